@@ -1,11 +1,27 @@
 import random
 import sys
+from collections import deque
+
+import numpy as np
 
 from circuit.circuit_loader import CircuitLoader
+from circuit.compiled_circuit import CompiledCircuit
+from circuit.netlist_cache import NetlistCache
+from logic_simulation.codegen_sim import CodegenSim
+from logic_simulation.event_sim import EventSim
+from logic_simulation.exhaustive_sim import ExhaustiveSim
+from logic_simulation.packed_sim import PackedSim
+from logic_simulation.parallel_sim import ParallelSim
+from logic_simulation.seq_sim import SeqSim
+from logic_simulation.ternary_sim import TernarySim
 from node import node
 
 sys.path.append('../')
+import config
+import utils
 from config import X_VALUE
+from tp_file import TPFile
+from tp_generator import TPGenerator
 #TODO: we need a flag to make sure no new nodes are added to the circuit, 
 #           for example, we all cell types in method foo after loading the circuit, 
 #           after adding new nodes, results of foo may still not be valid. 
@@ -47,8 +63,18 @@ class Circuit:
                     'IPT':node.IPT}
 
 
-    def __init__(self, c_fname, std_node_lib=STD_NODE_LIB):
+    def __init__(self, c_fname, std_node_lib=STD_NODE_LIB, cache=False):
         """ 
+        Arguments
+        ---------
+        c_fname : str
+            the name of the circuit with path and format
+        std_node_lib : dict
+            dictionary of node type to related node class
+        cache : bool
+            if True, the circuit is loaded from the binary netlist cache (see NetlistCache) 
+            when available, otherwise it is parsed and then saved in the cache.
+
         Attributes 
         ----------
         c_fname : str
@@ -63,6 +89,12 @@ class Circuit:
             list of intput nodes
         PO : list
             list of output nodes
+        DFF : list
+            (Q node, D node) of each flip-flop. Flip-flops are cut (full-scan): 
+            Q nodes are pseudo-PIs at the end of PI, and D nodes are pseudo-POs 
+            at the end of PO, in the same order as DFF. 
+        compiled : CompiledCircuit
+            array-backed version of the circuit, built by compile()
         """
 
         self.c_fname = c_fname 
@@ -71,9 +103,20 @@ class Circuit:
         self.nodes_lev = []
         self.PI = [] # this should repalce input_num_list
         self.PO = [] # this should be created to have a list of outputs
+        self.DFF = []
+        self.compiled = None
+        # (PI, PO) node lists the compiled circuit was built with
+        self._compiled_io = None
+        self._engines = {}
+        # EventSim that wrote node values last, None if another simulation did
+        self._values_sim = None
         
+        if cache and NetlistCache().load(self, std_node_lib):
+            return
         self._load(c_fname, std_node_lib)
         self.levelize()
+        if cache:
+            NetlistCache().save(self, std_node_lib)
 
     def _load(self, netlist_fname, std_node_lib):
         CircuitLoader(self, netlist_fname, std_node_lib)
@@ -82,29 +125,83 @@ class Circuit:
         """
         Levelization, assigns a level to each node
         Branches are also considered as gates: lev(branch) = lev(stem) + 1 
-        Algorithm is not efficient at all, don't care now
-        """
-        for po in self.PI:
-            po.lev = 0
-
-        flag_change = True
-        while flag_change: 
-            flag_change = False
-            for _, node in self.nodes.items():
-                if node.lev == None: 
-                    lev_u = [x.lev for x in node.unodes]
-                    if None in lev_u:
-                        continue
-                    elif lev_u == []:
-                        print(f"Warning! Node {node.num} has zero fanins")
-                        print(node)
-                        print("level of this node is set to zero")
-                        node.lev = 0
-                    else:
-                        node.lev = max(lev_u) + 1
-                        flag_change = True
-    
-        self.nodes_lev = sorted(list(self.nodes.values()), key=lambda x:x.lev)
+        Kahn's topological sort with a queue, runs in O(V+E). 
+        nodes_lev is ordered by level, and nodes of the same level keep their 
+        order in self.nodes. Raises ValueError if the circuit has a combinational loop. 
+        """
+        # Fanouts are derived from unodes, so that levelization only relies on fanins
+        fanouts = {node: [] for node in self.nodes.values()}
+        indegree = {}
+        queue = deque()
+        for node in self.nodes.values():
+            node.lev = None
+            indegree[node] = len(node.unodes)
+            for unode in node.unodes:
+                fanouts[unode].append(node)
+            if not node.unodes:
+                if node.gtype != "IPT":
+                    print(f"Warning! Node {node.num} has zero fanins")
+                    print(node)
+                    print("level of this node is set to zero")
+                node.lev = 0
+                queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for dnode in fanouts[node]:
+                indegree[dnode] -= 1
+                if indegree[dnode] == 0:
+                    dnode.lev = max([unode.lev for unode in dnode.unodes]) + 1
+                    queue.append(dnode)
+
+        loop_nodes = [node.num for node in self.nodes.values() if node.lev is None]
+        if loop_nodes:
+            raise ValueError(f"Combinational loop detected, {len(loop_nodes)} nodes " + 
+                    f"cannot be levelized: {loop_nodes[:10]}")
+
+        # Bucket sort on levels, stable with respect to the order in self.nodes
+        levels = [[] for _ in range(max([node.lev for node in self.nodes.values()], default=-1)+1)]
+        for node in self.nodes.values():
+            levels[node.lev].append(node)
+        self.nodes_lev = [node for level in levels for node in level]
+        self.compiled = None
+
+    def compile(self):
+        """ Returns the array-backed CompiledCircuit of this circuit.
+        It is built once and shared by the simulators, and is rebuilt only if 
+        the circuit is modified, e.g. levelized again or a PO is added. 
+        It is also rebuilt if self.PI or self.PO was changed directly, e.g. when an 
+        observation point is appended to self.PO and removed afterwards. 
+        """
+        if self.compiled is None or self._compiled_io != (self.PI, self.PO):
+            self.compiled = CompiledCircuit(self)
+            self._compiled_io = (list(self.PI), list(self.PO))
+        return self.compiled
+
+    def get_engine(self, engine_class):
+        """ Returns the simulation engine of the given class (e.g. PackedSim) 
+        built over the compiled circuit. Engines are built once and shared. 
+        """
+        cc = self.compile()
+        engine = self._engines.get(engine_class)
+        if engine is None or engine.cc is not cc:
+            engine = engine_class(cc)
+            self._engines[engine_class] = engine
+        return engine
+
+    def get_codegen(self):
+        """ Returns the CodegenSim of this circuit, or None if the circuit has more
+        than config.CODEGEN_MAX_NODES nodes and simulation should use the node objects
+        """
+        if not CodegenSim.is_supported(self.compile()):
+            return None
+        return self.get_engine(CodegenSim)
+
+    def _set_values(self, vals):
+        """ Writes back node values of a generated simulation to the node objects """
+        self._values_sim = None
+        for node, val in zip(self.nodes_lev, vals):
+            node.value = val
 
     def levelize_backward(self):
         """ Calculate shortest distace from node to POs for all nodes
@@ -203,6 +300,12 @@ class Circuit:
         if X_VALUE in tp:
             raise Exception('You have X in test pattern. Use logic_sim_t() instead.')
         
+        sim = self.get_codegen()
+        if sim is not None:
+            self._set_values(sim.run([int(val) for val in tp]))
+            return [po.value for po in self.PO]
+
+        self._values_sim = None
         node_dict = dict(zip([x.num for x in self.PI], tp))
 
         for node in self.nodes_lev:
@@ -213,6 +316,39 @@ class Circuit:
         
         return [po.value for po in self.PO]
     
+    def logic_sim_event(self, tp):
+        """
+        Event-driven logic simulation: only the fanout of nodes that changed since the 
+        previous call is evaluated (see EventSim), which is efficient when consecutive
+        patterns differ in a few PIs, e.g. in ATPG decisions or ordered pattern sets. 
+        node.value is updated only for the nodes that changed, unless another logic 
+        simulation of this circuit has written node values since the previous call, 
+        then all node values are written.
+        Number of evaluated gates is available in self.get_engine(EventSim).n_evals
+
+        Arguments
+        ---------
+        tp : list of int 
+            input pattern in the same order as in self.PI
+
+        Return
+        ------
+        list of output values
+        """
+        if X_VALUE in tp:
+            raise Exception('You have X in test pattern. Use logic_sim_t() instead.')
+
+        sim = self.get_engine(EventSim)
+        PO_values = sim.run([int(val) for val in tp])
+        if self._values_sim is sim:
+            for idx in sim.changed:
+                self.nodes_lev[idx].value = sim.values[idx]
+        else:
+            for node, val in zip(self.nodes_lev, sim.values):
+                node.value = val
+            self._values_sim = sim
+        return PO_values
+
     def logic_sim_t(self, tp):
         """
         Logic simulation:
@@ -225,6 +361,7 @@ class Circuit:
         list of output values
         """
 
+        self._values_sim = None
         node_dict = dict(zip([x.num for x in self.PI], tp))
 
         for node in self.nodes_lev:
@@ -235,6 +372,53 @@ class Circuit:
         
         return [po.value for po in self.PO]
 
+    def logic_sim_ternary(self, tps):
+        """
+        Bit-parallel three-valued logic simulation of partially specified patterns.
+        All patterns are simulated in one pass, using the two-rail encoding of TernarySim 
+        on Python ints. Node values are not updated. 
+
+        Arguments
+        ---------
+        tps : list of lists
+            each tp has 0, 1 or X_VALUE values, in the same order as in self.PI
+
+        Return
+        ------
+        list of output values (0, 1 or X_VALUE) for each tp
+        """
+        pi_r1, pi_r0 = [0] * len(self.PI), [0] * len(self.PI)
+        for j, tp in enumerate(tps):
+            for i, val in enumerate(tp):
+                if val != 0:
+                    pi_r1[i] |= 1 << j
+                if val != 1:
+                    pi_r0[i] |= 1 << j
+
+        po_r1, po_r0 = self.get_engine(TernarySim).run(pi_r1, pi_r0)
+        res = []
+        for j in range(len(tps)):
+            res.append([X_VALUE if (r1 >> j) & (r0 >> j) & 1 else (r1 >> j) & 1
+                for r1, r0 in zip(po_r1, po_r0)])
+        return res
+
+    def logic_sim_ternary_packed(self, pi_r1, pi_r0):
+        """
+        Three-valued logic simulation with NumPy, the two-rail version of logic_sim_packed.
+        See utils.pack_tps_t and utils.unpack_words_t 
+
+        Arguments
+        ---------
+        pi_r1, pi_r0 : np.ndarray (uint64) with shape (n_PI, n_words)
+            "can be 1" and "can be 0" planes, in the same order as self.PI
+
+        Return
+        ------
+        (r1, r0) : np.ndarray (uint64) of PO planes, shape is (n_PO, n_words)
+        """
+        po_r1, po_r0 = self.get_engine(TernarySim).run(pi_r1, pi_r0)
+        return np.array(po_r1, dtype=np.uint64), np.array(po_r0, dtype=np.uint64)
+
     def logic_sim_bitwise(self, tp, fault=None):
         """
         Logic simulation bitwise mode:
@@ -251,7 +435,19 @@ class Circuit:
         ------
         list of output values
         """
+        sim = self.get_codegen()
+        if sim is not None:
+            bitwise_not = self.nodes_lev[0].bitwise_not
+            if fault:
+                stuck_val = 0 if fault.stuck_val == '0' else bitwise_not
+                fault_masks = {self.compiled.num2id[fault.node_num]: bitwise_not}
+                vals = sim.run_inject(tp, bitwise_not, fault_masks, stuck_val)
+            else:
+                vals = sim.run(tp, bitwise_not)
+            self._set_values(vals)
+            return [po.value for po in self.PO]
 
+        self._values_sim = None
         node_dict = dict(zip([x.num for x in self.PI], tp))
     
         if fault:
@@ -275,60 +471,169 @@ class Circuit:
 
         return [po.value for po in self.PO]
         
-    def logic_sim_file(self, in_fname, out_fname, stil=False): 
-        #TODO: test
+    def logic_sim_packed(self, pi_words, all_nodes=False):
+        """
+        Pattern-parallel logic simulation with NumPy, for any number of patterns 
+        Patterns are bit-packed as uint64 words, see utils.pack_tps and PackedSim
+
+        Arguments
+        ---------
+        pi_words : np.ndarray (uint64) with shape (n_PI, n_words), in the same order as self.PI
+        all_nodes : bool
+            if True, returns values of all nodes in the order of self.nodes_lev 
+
+        Return
+        ------
+        np.ndarray (uint64) of PO words, shape is (n_PO, n_words)
+        """
+        return self.get_engine(PackedSim).run(pi_words, all_nodes=all_nodes)
+
+    def logic_sim_parallel(self, pi_words, num_proc=None):
+        """
+        Multi-process version of logic_sim_packed, patterns are split in shards of words
+        and each shard is simulated by a forked process, see ParallelSim
+
+        Arguments
+        ---------
+        pi_words : np.ndarray (uint64) with shape (n_PI, n_words), in the same order as self.PI
+        num_proc : int
+            number of processes, default is the number of CPUs
+
+        Return
+        ------
+        np.ndarray (uint64) of PO words, shape is (n_PO, n_words)
+        """
+        return self.get_engine(ParallelSim).run(pi_words, num_proc=num_proc)
+
+    def logic_sim_seq(self, pi_seq, state=None):
+        """
+        Cycle-based simulation of a sequential circuit, with packed words of 64 
+        independent sequences (see SeqSim). Flip-flops are in self.DFF. 
+
+        Arguments
+        ---------
+        pi_seq : np.ndarray (uint64) with shape (n_cycles, n_PI, n_words)
+            PI words of each cycle, in the same order as self.PI without pseudo-PIs
+        state : np.ndarray (uint64) with shape (n_DFF, n_words)
+            initial state, default is all zero
+
+        Return
+        ------
+        (po_seq, state) : PO words of each cycle with shape (n_cycles, n_PO, n_words), 
+            in the same order as self.PO without pseudo-POs, and the final state 
+        """
+        return self.get_engine(SeqSim).run(pi_seq, state)
+
+    def truth_table(self):
+        """
+        Exhaustive simulation of all 2^n patterns, in Gray-code order (see ExhaustiveSim)
+        Pattern m assigns bit i of m to self.PI[i]
+
+        Return
+        ------
+        list of int, truth table of each PO, bit m is the PO value for pattern m
+        """
+        return self.get_engine(ExhaustiveSim).truth_tables()
+
+    def exhaustive_detection(self, faults):
+        """
+        Exact detection probability of faults, by simulating all 2^n patterns
+        Updates fault.D_count to the number of patterns that detect the fault
+
+        Arguments
+        ---------
+        faults : FaultList
+
+        Return
+        ------
+        list of detection probability of each fault in faults.faults
+        """
+        cc = self.compile()
+        faults = faults.faults
+        counts = self.get_engine(ExhaustiveSim).detection_counts(
+                [(cc.num2id[f.node_num], int(f.stuck_val)) for f in faults])
+        for fault, count in zip(faults, counts):
+            fault.D_count = count
+        return [count / (1 << len(self.PI)) for count in counts]
+
+    def logic_sim_file(self, in_fname, out_fname, stil=False, stil_fname=None,
+            chunk_size=config.LOGIC_SIM_FILE_CHUNK): 
         """
         logic simulation with given input vectors from a file
-        - generate an output folder in ../data/modelsim/circuit_name/ directory
-        - read an input file in the input folder
-        - generate a output file in output folder by using logic_sim() function
-        """
-        # Saeed needs to rewrite this method using 'yield' in load_tp_file     
-        fr = open(in_fname, mode='r')
-        fw = open(out_fname, mode='w')
-        fw.write('Inputs: ')
-        fw.write(",".join(['N'+str(node.num) for node in self.PI]) + "\n")
-        fw.write('Outputs: ')
-        fw.write(",".join(['N'+str(node.num) for node in self.PO]) + "\n")
-        temp = fr.readline()
-        i=1
-        for line in fr.readlines():
-            line=line.rstrip('\n')
-            line_split=line.split(',')
-            for x in range(len(line_split)):
-                line_split[x]=int(line_split[x])
-            self.logic_sim(line_split)
-            fw.write('Test # = '+str(i)+'\n')
-            fw.write(line+'\n')
-            fw.write(",".join([str(node.value) for node in self.PO]) + "\n")
-            i+=1
-        fw.close()
-        fr.close()
-        
-        if stil:
-            infile = open(in_fname, "r")
-            lines = infile.readlines()
-            outfile = open(out_fname, "w")
-            outfile.write("PI:")
-            outfile.write(",".join([node.num for node in self.PI]) + "\n")
-            outfile.write("PO:")
-            outfile.write(",".join([node.num for node in self.PO]) + "\n")
-            for idx, line in enumerate(lines[1:]):
-                tp=line.rstrip('\n').split(",")
-                # for x in range(len(line_split)):
-                #    line_split[x]=int(line_split[x])
-                # self.logic_sim(line_split)
-                self.logic_sim(tp)
-                outfile.write("\"pattern " + str(idx) + "\": Call \"capture\" {\n")
-                outfile.write("\"_pi\"=")
-                outfile.write("".join(line.strip().split(",")))
-                outfile.write(";\n")
-                outfile.write("      \"_po\"=")
-                for node in self.PO:
-                    val = "H" if node.value==1 else "L"
-                    outfile.write(val)
-                outfile.write("; } \n")
-            outfile.close()
+        The file is streamed in chunks of chunk_size patterns, each chunk is simulated 
+        bit-parallel with logic_sim_packed, so memory does not grow with the file size. 
+
+        Arguments
+        ---------
+        in_fname : str
+            test pattern file, as generated by TPGenerator.gen_file, or a binary 
+            file (see TPFile) without X values
+        out_fname : str
+            output file, with the PO values of each pattern
+        stil : bool
+            if True, the output is also written in STIL format. 
+        stil_fname : str
+            STIL output file, written in the same pass as out_fname. 
+            If None and stil is True, only the STIL output is written in out_fname. 
+        """
+        if stil and stil_fname is None:
+            fw, fs = None, open(out_fname, mode='w')
+        else:
+            fw = open(out_fname, mode='w')
+            fs = open(stil_fname, mode='w') if stil else None
+
+        if fw:
+            fw.write('Inputs: ')
+            fw.write(",".join(['N'+str(node.num) for node in self.PI]) + "\n")
+            fw.write('Outputs: ')
+            fw.write(",".join(['N'+str(node.num) for node in self.PO]) + "\n")
+        if fs:
+            fs.write("PI:")
+            fs.write(",".join([node.num for node in self.PI]) + "\n")
+            fs.write("PO:")
+            fs.write(",".join([node.num for node in self.PO]) + "\n")
+
+        idx = 0
+        for lines, pi_words in self._read_tp_chunks(in_fname, chunk_size):
+            po_words = self.logic_sim_packed(pi_words)
+            po_vals = utils.unpack_words(po_words, len(lines))
+            
+            buf_w, buf_s = [], []
+            for line, vals in zip(lines, po_vals.tolist()):
+                if fw:
+                    buf_w.append(f"Test # = {idx+1}\n{line}\n" + 
+                            ",".join([str(val) for val in vals]) + "\n")
+                if fs:
+                    buf_s.append(f"\"pattern {idx}\": Call \"capture\" {{\n" + 
+                            "\"_pi\"=" + line.replace(",", "") + ";\n" + 
+                            "      \"_po\"=" + "".join(["H" if val else "L" for val in vals]) + 
+                            "; } \n")
+                idx += 1
+            if fw:
+                fw.write("".join(buf_w))
+            if fs:
+                fs.write("".join(buf_s))
+
+        for f in [fw, fs]:
+            if f:
+                f.close()
+
+    def _read_tp_chunks(self, in_fname, chunk_size):
+        """ Yields (lines, pi_words) for chunks of a text or binary test pattern file """
+        if not in_fname.endswith(config.TP_BIN_EXT):
+            for lines in TPGenerator.read_file_chunks(in_fname, chunk_size):
+                tps = np.array([line.split(',') for line in lines]).astype(np.uint8)
+                yield lines, utils.pack_tps(tps)
+            return
+
+        tp_file = TPFile(in_fname)
+        tp_file.check(self)
+        if tp_file.has_x:
+            raise ValueError(f"{in_fname} has X values, use logic_sim_ternary_packed")
+        for words, _, n_tps in tp_file.iter_words(max(1, chunk_size // 64)):
+            tps = utils.unpack_words(words, n_tps)
+            lines = [",".join(map(str, tp)) for tp in tps.tolist()]
+            yield lines, words
 
     def golden_test(self, golden_io_filename):
         # compares the results of logic-sim of this circuit, 
@@ -429,6 +734,7 @@ class Circuit:
 
         self.PO.append(new_brch)    
         self.nodes[new_brch.num] = new_brch
+        self.compiled = None
 
     def read_PO(self):
         """ Read the values of POs in a dictionary.
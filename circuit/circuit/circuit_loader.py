@@ -1,9 +1,13 @@
-import re
 import config
 
 from node.node import Node
 from node import node
 
+# Reverse of config.CELL_NAMES, from each cell name to its gate type
+CELL2GATE = {cell: gname for gname, cells in config.CELL_NAMES.items() for cell in cells}
+
+VERILOG_NET_TYPES = {"input": "PI", "output": "PO", "wire": "wire"}
+
 class CircuitLoader:
     """ Read a circuit netlist (gate level), 
     currently support .ckt (refer to USC EE658) and .v (Verilog) 
@@ -66,76 +70,92 @@ class CircuitLoader:
     def read_verilog(self, circuit, circuit_fname, std_node_lib):
         """
         Read circuit from .v file, each node as an object
+        The netlist is read only once, statement by statement (see verilog_statements), 
+        and nodes are created in the same pass. Connections are made after all nodes 
+        are created, from the gates collected in the pass. 
         """
-        infile = open(circuit_fname, 'r')
-        eff_line = ''
-        lines = infile.readlines()
-        new_lines=[]
-        for line in lines:
-            # Remove comment in lines 
-            line_syntax = re.match(r'^.*//.*', line, re.IGNORECASE)
-            line = line[:line.index('//')] if line_syntax else line
-
-            # If there is no ";" or "endmodule" it means the line is continued
-            # Stack the contniuous lines to each other
-            if ';' not in line and 'endmodule' not in line:
-                eff_line = eff_line + line.rstrip()
-            else:
-                line = eff_line + line.rstrip()
-                eff_line = ''
-                new_lines.append(line)
-
-        infile.close()
-
-        ## 1st time Parsing: Creating all nodes
-        # we need to use _nodes dict to collect all information
+        # we need to use _nodes dict to collect information of wires and POs 
+        # until their gate is seen
         _nodes = {}
-        for line in new_lines:
-
-            x_type, nets = self.read_verilog_syntax(line)
+        gates = []
+        dffs = []
+        skip_module = False
+        for stmt in CircuitLoader.verilog_statements(circuit_fname):
+            # definition of flip-flops is skipped, e.g. "module dff" in ISCAS89
+            if skip_module and stmt != "endmodule":
+                continue
+            x_type, nets = self.read_verilog_statement(stmt)
 
             if x_type == "module":
+                skip_module = nets in config.CELL_NAMES["DFF"]
                 continue
              
+            # DFF: cut into a pseudo-PI (Q) and a pseudo-PO (D), i.e. full-scan
+            elif x_type == "DFF":
+                q, d, qn = nets
+                if q is None:
+                    q = qn + "_Q"
+                if qn is not None:
+                    gates.append(("NOT", [qn, q]))
+                dffs.append((q, d))
+             
             # Wire: n_type=GATE, gtype=unknown
-            if x_type == "wire":
+            elif x_type == "wire":
                 for wire in nets:
                     _nodes[wire] = {'num':wire, 'n_type':"GATE", 'g_type':None}
 
             # PI: n_type=PI, g_type=IPT, Node will be added! 
-            if x_type == "PI":
+            elif x_type == "PI":
                 for pi in nets:
                     new_node = Node.gen_node({'num': pi, 'n_type': "PI", 'g_type': "IPT"}, std_node_lib)
                     circuit.nodes[new_node.num] = new_node
                     circuit.PI.append(new_node)
 
             # PO: n_type=PO, g_type=unknown, Node will NOT be added
-            if x_type == "PO":
+            elif x_type == "PO":
                 for po in nets:
                     _nodes[po] = {'num': po, 'n_type':"PO", 'g_type': None}
 
             # GATE, n_type = PO or GATE
             # Node was seen before, in wire or in input/output, node will be added
-            if x_type == "GATE":
-                gtype, nets = nets
-                if nets[0] not in _nodes:
-                    import pdb
-                    pdb.set_trace()
-                _nodes[nets[0]]['g_type'] = gtype 
-                new_node = Node.gen_node(_nodes[nets[0]], std_node_lib)
-                circuit.nodes[new_node.num] = new_node
-                if new_node.ntype == 'PO':
-                    circuit.PO.append(new_node)
-
-        # 2nd time Parsing: Making All Connections
-        for line in new_lines:
-            x_type, nets = self.read_verilog_syntax(line)
-            if x_type == "GATE":
-                gtype, nets = nets
-                for net in nets[1:]:
-                    circuit.nodes[nets[0]].unodes.append(circuit.nodes[net])
-                    circuit.nodes[net].dnodes.append(circuit.nodes[nets[0]])
+            elif x_type == "GATE":
+                gates.append(nets)
+
+        # Q nets of DFFs are pseudo-PIs, they are added after the PIs
+        for q, d in dffs:
+            new_node = Node.gen_node({'num': q, 'n_type': "PI", 'g_type': "IPT"}, std_node_lib)
+            circuit.nodes[new_node.num] = new_node
+            circuit.PI.append(new_node)
+            if _nodes.get(q, {}).get('n_type') == "PO":
+                circuit.PO.append(new_node)
+
+        for gtype, nets in gates:
+            node_info = _nodes.get(nets[0], {'num':nets[0], 'n_type':"GATE"})
+            node_info['g_type'] = gtype 
+            new_node = Node.gen_node(node_info, std_node_lib)
+            circuit.nodes[new_node.num] = new_node
+            if new_node.ntype == 'PO':
+                circuit.PO.append(new_node)
+
+        undriven = [net for _, nets in gates for net in nets[1:] if net not in circuit.nodes]
+        undriven += [d for _, d in dffs if d not in circuit.nodes]
+        if undriven:
+            raise NameError(f"Nets {undriven[:10]} are used but not driven in {circuit_fname}")
+
+        # D nets of DFFs are pseudo-POs, they are added after the POs
+        for q, d in dffs:
+            d_node = circuit.nodes[d]
+            if d_node.ntype == "GATE":
+                d_node.ntype = "PO"
+            circuit.PO.append(d_node)
+            circuit.DFF.append((circuit.nodes[q], d_node))
 
+        # Making all connections
+        for _, nets in gates:
+            out_node = circuit.nodes[nets[0]]
+            for net in nets[1:]:
+                out_node.unodes.append(circuit.nodes[net])
+                circuit.nodes[net].dnodes.append(out_node)
 
         # Branch modification 
         # Inserting FB node back into the circuit
@@ -150,6 +170,56 @@ class CircuitLoader:
                     CircuitLoader.insert_branch(node, node.dnodes[0], branch)
         circuit.nodes.update(branches)
 
+    @staticmethod
+    def verilog_statements(circuit_fname):
+        """ Streaming tokenizer of a Verilog netlist, yields one statement at a time.
+        Comments (// and /* */) are removed, statements spanning multiple lines 
+        are joined, and the ending ";" is removed. "endmodule" is yielded as a statement. 
+        """
+        stmt = []
+        in_comment = False
+        with open(circuit_fname, 'r') as infile:
+            for line in infile:
+                # block comments
+                if in_comment:
+                    idx = line.find('*/')
+                    if idx == -1:
+                        continue
+                    line = line[idx+2:]
+                    in_comment = False
+                while '/*' in line:
+                    idx = line.index('/*')
+                    idx_end = line.find('*/', idx+2)
+                    if idx_end == -1:
+                        line = line[:idx]
+                        in_comment = True
+                    else:
+                        line = line[:idx] + " " + line[idx_end+2:]
+                
+                # line comments
+                idx = line.find('//')
+                if idx != -1:
+                    line = line[:idx]
+
+                while True:
+                    idx = line.find(';')
+                    if idx == -1:
+                        break
+                    stmt.append(line[:idx])
+                    yield " ".join(stmt).strip()
+                    stmt = []
+                    line = line[idx+1:]
+
+                line = line.strip()
+                if not stmt and line.startswith("endmodule"):
+                    yield "endmodule"
+                    line = line[len("endmodule"):].strip()
+                if line:
+                    stmt.append(line)
+
+        if " ".join(stmt).strip():
+            raise NameError(f"Unterminated statement at the end of {circuit_fname}")
+
     def read_ckt(self, circuit, circuit_fname, std_node_lib):
         """
         Read circuit from .ckt file, each node as an object
@@ -182,10 +252,10 @@ class CircuitLoader:
     def cell2gate(cell_name):
         ## Inputs: Verilog gate input formats
         ## Outputs: gtype corresponding gate name
-        for gname, cell_names in config.CELL_NAMES.items():
-            if cell_name in cell_names:
-                return gname
-        raise NameError(f"Cell type {cell_name} was not found")
+        try:
+            return CELL2GATE[cell_name]
+        except KeyError:
+            raise NameError(f"Cell type {cell_name} was not found")
     
     @staticmethod
     def insert_branch(u_node, d_node, i_node):
@@ -199,53 +269,66 @@ class CircuitLoader:
         i_node.unodes.append(u_node)
         i_node.dnodes.append(d_node)
 
-    def read_verilog_syntax(self,line):
-        if line.strip() == "endmodule":
-            return ("module", None)
+    def read_verilog_syntax(self, line):
+        """ Parses a single line (or joined lines) of a Verilog netlist """
+        return self.read_verilog_statement(line.strip().rstrip(';'))
 
-        # If there is a "wire" in this line:
-        line_syntax = re.match(r'^[\s]*wire (.*,*);', line, re.IGNORECASE)
-        if line_syntax:
-            nets = line_syntax.group(1).replace(' ', '').replace('\t', '').split(',')
-            return ("wire", nets)
-        
-        # PI: 
-        line_syntax = re.match(r'^.*input ([a-z]+\s)*(.*,*).*;', line, re.IGNORECASE)
-        if line_syntax:
-            nets = line_syntax.group(2).replace(' ', '').replace('\t', '').split(',')
-            return ("PI", nets)
+    def read_verilog_statement(self, stmt):
+        """ Parses a single Verilog statement, without the ending ";" 
+
+        Returns
+        -------
+        (x_type, nets) : x_type is one of "module", "wire", "PI", "PO", "GATE", "DFF" 
+            For "module", nets is the module name (None for endmodule)
+            For "GATE", nets is (gtype, nets) and the output net is nets[0]
+            For "DFF", nets is (Q, D, QN), Q or QN may be None if not connected
+        """
+        words = stmt.split(None, 1)
+        if len(words) == 0 or words[0] == "endmodule":
+            return ("module", None)
+        if words[0] == "module":
+            return ("module", words[1].split('(')[0].strip())
         
-        # PO 
-        line_syntax = re.match(r'^.*output ([a-z]+\s)*(.*,*).*;', line, re.IGNORECASE)
-        if line_syntax:
-            nets = line_syntax.group(2).replace(' ', '').replace('\t', '').split(',')
-            return ("PO", nets)
+        keyword = words[0]
+        if keyword in VERILOG_NET_TYPES:
+            nets = [net.strip() for net in words[1].split(',')]
+            # e.g. input wire N1, or output reg N2
+            first = nets[0].split()
+            if len(first) > 1:
+                nets[0] = first[-1]
+            return (VERILOG_NET_TYPES[keyword], nets)
 
         # Gate
-        line_syntax = re.match(r'\s*(.+?) (.+?)\s*\((.*)\s*\);$', line, re.IGNORECASE)
-        if line_syntax:
-            if line_syntax.group(1) == "module":
-                return ("module", None)
-            
-            gtype = CircuitLoader.cell2gate(line_syntax.group(1))
-            # #we may not use gname for now. 
-            # gname = line_syntax.group(2)
-            
-            # TODO: Saeed fixed this but was not tested on all circuits
-            # It had issues with netlists that have gate description in multiple lines
-            # pin_format = re.findall(r'\.(\w+)\((\w*)\)', line_syntax.group(3))
-            pin_format = re.findall(r'\.(\w+)\((\w*)\)', line_syntax.group(3).replace(" ", ""))
-            if pin_format:
-                #TODO: for now, we considered PO as the last pin
-                if "Z" not in pin_format[-1][0]:
-                    raise NameError("Cannot detect the output pin as the last argumet, check code")
-                nets = [pin_format[-1][1]]
-                for x in pin_format[:-1]:
-                    nets.append(x[1])
-            else:
-                # verilog with no pin format
-                nets = line_syntax.group(3).replace(' ', '').split(',')
-
-            return ("GATE", (gtype, nets) )
+        idx_open = stmt.find('(')
+        idx_close = stmt.rfind(')')
+        if idx_open == -1 or idx_close < idx_open:
+            raise NameError(f"No suggestion for \n>{stmt}<\n was found")
+
+        gtype = CircuitLoader.cell2gate(keyword)
+        # #we may not use gname for now. 
+        # gname = stmt[len(keyword):idx_open].strip()
+        args = stmt[idx_open+1:idx_close].replace(" ", "").replace("\t", "")
         
-        raise NameError(f"No suggestion for \n>{line}<\n was found")
\ No newline at end of file
+        if args.startswith('.'):
+            # pin format: .A1(n6),.A2(n7),.ZN(N23)
+            pins = []
+            for pin in args[1:].split(',.'):
+                idx = pin.index('(')
+                pins.append((pin[:idx], pin[idx+1:pin.rindex(')')]))
+            if gtype == "DFF":
+                # e.g. .D(n1),.CK(CK),.Q(n2),.QN(n3)
+                pins = {pin: net for pin, net in pins if net}
+                return ("DFF", (pins.get("Q"), pins["D"], pins.get("QN")))
+            #TODO: for now, we considered PO as the last pin
+            if "Z" not in pins[-1][0]:
+                raise NameError("Cannot detect the output pin as the last argumet, check code")
+            nets = [pins[-1][1]] + [pin[1] for pin in pins[:-1]]
+        elif gtype == "DFF":
+            # ISCAS89 format: dff DFF_0(CK,Q,D), or without clock: dff DFF_0(Q,D)
+            q, d = args.split(',')[-2:]
+            return ("DFF", (q, d, None))
+        else:
+            # verilog with no pin format
+            nets = args.split(',')
+
+        return ("GATE", (gtype, nets))
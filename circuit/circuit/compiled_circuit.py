@@ -0,0 +1,143 @@
+import hashlib
+
+import numpy as np
+
+from node import node
+
+# Gate and node type codes are the values of node.gtype and node.ntype enums
+GTYPE_CODE = {g.name: g.value for g in node.gtype}
+NTYPE_CODE = {n.name: n.value for n in node.ntype}
+
+
+class CompiledCircuit:
+    """ Array-backed representation of a levelized Circuit, built once and shared
+    by the simulation engines instead of walking the node objects.
+
+    Node IDs are contiguous integers, in the same order as circuit.nodes_lev,
+    so nodes of level l are ids lev_ptr[l] to lev_ptr[l+1]-1.
+    The fanin of node i is fanin[fanin_ptr[i]:fanin_ptr[i+1]] (CSR format),
+    in the same order as node.unodes, and similarly for fanout and node.dnodes.
+
+    Attributes
+    ----------
+    nums : list of str
+        node.num of each node id
+    num2id : dict
+        from node.num to node id
+    gtype : np.ndarray (uint8)
+        gate type code of each node, values of node.gtype enum
+    ntype : np.ndarray (uint8)
+        node type code of each node, values of node.ntype enum
+    lev : np.ndarray (int32)
+        level of each node
+    lev_ptr : np.ndarray (int64)
+        offsets of levels in node ids, length is number of levels + 1
+    fanin_ptr, fanin : np.ndarray (int64, int32)
+        CSR fanin adjacency
+    fanout_ptr, fanout : np.ndarray (int64, int32)
+        CSR fanout adjacency
+    PI : np.ndarray (int32)
+        node ids of PIs, in the same order as circuit.PI
+    PO : np.ndarray (int32)
+        node ids of POs, in the same order as circuit.PO
+    DFF : np.ndarray (int32)
+        shape is (n_DFF, 2), node ids of (Q, D) of each flip-flop, as in circuit.DFF
+    """
+
+    def __init__(self, circuit=None):
+        """ Compiles the given circuit, it should be already levelized.
+        If circuit is None, an empty object is returned to be filled by from_arrays.
+        """
+        if circuit is None:
+            return
+
+        nodes = circuit.nodes_lev
+        self.nums = [n.num for n in nodes]
+        self.num2id = {num: idx for idx, num in enumerate(self.nums)}
+
+        self.gtype = np.array([GTYPE_CODE[n.gtype] for n in nodes], dtype=np.uint8)
+        self.ntype = np.array([NTYPE_CODE[n.ntype] for n in nodes], dtype=np.uint8)
+        self.lev = np.array([n.lev for n in nodes], dtype=np.int32)
+
+        self.fanin_ptr, self.fanin = self._csr([n.unodes for n in nodes])
+        self.fanout_ptr, self.fanout = self._csr([n.dnodes for n in nodes])
+
+        self.PI = np.array([self.num2id[n.num] for n in circuit.PI], dtype=np.int32)
+        self.PO = np.array([self.num2id[n.num] for n in circuit.PO], dtype=np.int32)
+        self.DFF = np.array([[self.num2id[q.num], self.num2id[d.num]] for q, d in circuit.DFF],
+                dtype=np.int32).reshape(-1, 2)
+        self._set_lev_ptr()
+
+    @classmethod
+    def from_arrays(cls, nums, gtype, ntype, lev, fanin_ptr, fanin,
+            fanout_ptr, fanout, PI, PO, DFF=None):
+        """ Builds a compiled circuit directly from its arrays, e.g. read from a cache """
+        cc = cls()
+        cc.nums = np.asarray(nums).tolist()
+        cc.num2id = {num: idx for idx, num in enumerate(cc.nums)}
+        cc.gtype = np.asarray(gtype, dtype=np.uint8)
+        cc.ntype = np.asarray(ntype, dtype=np.uint8)
+        cc.lev = np.asarray(lev, dtype=np.int32)
+        cc.fanin_ptr = np.asarray(fanin_ptr, dtype=np.int64)
+        cc.fanin = np.asarray(fanin, dtype=np.int32)
+        cc.fanout_ptr = np.asarray(fanout_ptr, dtype=np.int64)
+        cc.fanout = np.asarray(fanout, dtype=np.int32)
+        cc.PI = np.asarray(PI, dtype=np.int32)
+        cc.PO = np.asarray(PO, dtype=np.int32)
+        cc.DFF = np.asarray([] if DFF is None else DFF, dtype=np.int32).reshape(-1, 2)
+        cc._set_lev_ptr()
+        return cc
+
+    def _csr(self, adj_lists):
+        """ Converts lists of neighbor nodes into CSR (ptr, idx) arrays """
+        ptr = np.zeros(len(adj_lists)+1, dtype=np.int64)
+        ptr[1:] = np.cumsum([len(adj) for adj in adj_lists])
+        idx = np.fromiter((self.num2id[n.num] for adj in adj_lists for n in adj),
+                dtype=np.int32, count=ptr[-1])
+        return ptr, idx
+
+    def _set_lev_ptr(self):
+        if np.any(np.diff(self.lev) < 0):
+            raise ValueError("Nodes of a compiled circuit should be ordered by level")
+        n_levs = int(self.lev[-1]) + 1 if len(self.lev) else 0
+        self.lev_ptr = np.searchsorted(self.lev, np.arange(n_levs+1)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.nums)
+
+    @property
+    def n_levels(self):
+        return len(self.lev_ptr) - 1
+
+    def get_fanin(self, idx):
+        """ Returns the node ids of the fanin of node idx """
+        return self.fanin[self.fanin_ptr[idx]:self.fanin_ptr[idx+1]]
+
+    def get_fanout(self, idx):
+        """ Returns the node ids of the fanout of node idx """
+        return self.fanout[self.fanout_ptr[idx]:self.fanout_ptr[idx+1]]
+
+    def level_ids(self, lev):
+        """ Returns the range of node ids with the given level """
+        return range(self.lev_ptr[lev], self.lev_ptr[lev+1])
+
+    def hash(self):
+        """ Structural hash of the circuit: gate types, connections, PIs and POs """
+        if getattr(self, '_hash', None) is None:
+            h = hashlib.sha1()
+            for arr in [self.gtype, self.fanin_ptr, self.fanin, self.PI, self.PO, self.DFF]:
+                h.update(np.ascontiguousarray(arr).tobytes())
+                h.update(b';')
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def nbytes(self):
+        """ Total memory used by the arrays of the compiled circuit, in bytes """
+        arrs = [self.gtype, self.ntype, self.lev, self.lev_ptr, self.fanin_ptr,
+                self.fanin, self.fanout_ptr, self.fanout, self.PI, self.PO, self.DFF]
+        return sum(arr.nbytes for arr in arrs)
+
+    def __str__(self):
+        return (f"Compiled circuit: #Nodes={len(self)}, #Levels={self.n_levels}, " +
+                f"#PI={len(self.PI)}, #PO={len(self.PO)}, #DFF={len(self.DFF)}, " + 
+                f"#Edges={len(self.fanin)}")
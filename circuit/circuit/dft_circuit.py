@@ -5,7 +5,11 @@ import time
 from collections import deque
 from multiprocessing import Pipe, Process
 
+import numpy as np
+
 import config
+from fault_simulation.fault import FaultList
+from logic_simulation.exhaustive_sim import ExhaustiveSim
 from node import dft_node
 from tp_generator import TPGenerator
 
@@ -36,8 +40,8 @@ class DFTCircuit(circuit.Circuit):
                     'NOT':dft_node.DFTNOT,
                     'IPT':dft_node.DFTIPT}
 
-    def __init__(self, netlist_fname):
-        super().__init__(netlist_fname, DFTCircuit.STD_NODE_LIB)
+    def __init__(self, netlist_fname, cache=False):
+        super().__init__(netlist_fname, DFTCircuit.STD_NODE_LIB, cache=cache)
         self._stafan_executed = False
     
     def SCOAP_CC(self):
@@ -84,7 +88,7 @@ class DFTCircuit(circuit.Circuit):
                 node.sense = True
                 node.sen_count += 1
 
-    def STAFAN_C(self, tp, limit=None):
+    def STAFAN_C(self, tp, limit=None, seed=None, tp_source=None):
         """ 
         STAFAN controllability 
 
@@ -98,14 +102,17 @@ class DFTCircuit(circuit.Circuit):
             primary inputs together in the same sequence as in self.PI, and then converting 
             this value to a decimal one. 
         
+        seed : seed of the random generator, see TPGenerator
+
+        tp_source : generator of random tps instead of TPGenerator, e.g. PRPG
+        
         Note: Random input patterns are generated with replacement (not pseudo-random)
-        Note: random.choice method is very inefficient
         """
 
-        tg = TPGenerator(self)
+        tg = TPGenerator(self, seed) if tp_source is None else tp_source
         tps=[]
         if isinstance(tp, str):
-            tps = tg.load_file(tp)
+            tps = TPGenerator.load_file(tp)
         elif isinstance(tp, int):
             tps = tg.gen_n_random(tp)
         else:
@@ -135,11 +142,11 @@ class DFTCircuit(circuit.Circuit):
                 node.B1 = 1.0
             node.stafan_b()
     
-    def STAFAN_C_handler(self, conn, id_proc, tp_count, tot_proc):
+    def STAFAN_C_handler(self, conn, id_proc, tp_count, tot_proc, seed=None, tp_source=None):
         limit = [int(pow(2, len(self.PI))/tot_proc) * id_proc, 
                 int(pow(2, len(self.PI))/tot_proc) * (id_proc+1)-1]
         
-        self.STAFAN_C(tp_count, limit)
+        self.STAFAN_C(tp_count, limit, seed, tp_source)
 
         one_count_list = []
         zero_count_list = []
@@ -153,7 +160,7 @@ class DFTCircuit(circuit.Circuit):
         conn.send((one_count_list, zero_count_list, sen_count_list))
         conn.close()
 
-    def STAFAN(self, tp_count, num_proc=1, verbose=True, save_log=True):
+    def STAFAN(self, tp_count, num_proc=1, verbose=True, save_log=True, seed=None, tp_source=None):
         """ 
         Calculating STAFAN controllability and observability in parallel. 
         Random TPs are generated within the method itself and are not stored. 
@@ -162,6 +169,9 @@ class DFTCircuit(circuit.Circuit):
         ---------
         total_tp : (int) total number of test pattern vectors (not less than num_proc)
         num_proc : (int) number of processors that will be used in parallel processing 
+        seed : (int) seed of random tps, each process gets an independent stream of it
+        tp_source : (PRPG) generator of random tps instead of TPGenerator, 
+            each process applies the next segment of its sequence (see PRPG.spawn)
         """
         self._stafan_tp = tp_count
         if verbose:
@@ -175,10 +185,15 @@ class DFTCircuit(circuit.Circuit):
         start_time = time.time()
 
         process_list = []
+        seeds = np.random.SeedSequence(seed).spawn(num_proc)
+        sources = [None] * num_proc
+        if tp_source is not None:
+            sources = tp_source.spawn(num_proc, tp_count//num_proc+1)
         for id_proc in range(num_proc):
             parent_conn, child_conn = Pipe()
             p = Process(target = self.STAFAN_C_handler, 
-                    args =(child_conn, id_proc, tp_count//num_proc+1 , num_proc))
+                    args =(child_conn, id_proc, tp_count//num_proc+1 , num_proc, seeds[id_proc], 
+                        sources[id_proc]))
             p.start()
             process_list.append((p, parent_conn))
 
@@ -353,56 +368,252 @@ class DFTCircuit(circuit.Circuit):
         op.ntype = orig_ntype
         self.PO = self.PO[:-1]
         return count
-    
-    def gen_fault_dic(self):
-        """
-        Fault Dictionary:
-        key: input pattern value: detected fault (returned by PFS)
-        Fault Dictionary can only be generated for small circuits
-        because the file size will become too large for big circuits.
+
+    def WRP_objectives(self, node, val):
+        """ PI values that help to detect a fault, for weighted random patterns.
+        The fault is activated by setting node to val, and propagated along the fanout
+        with the highest STAFAN observability, with non-controlling side inputs.
+        These objectives are backtraced to PIs, choosing the input with the highest
+        STAFAN controllability when any input can control a gate.
+
+        Returns
+        -------
+        dict : from PI node number to its value, PIs with conflicting values are excluded
         """
-        fault_dict = {}
-        inputnum = len(self.input_num_list)
-        total_pattern = pow(2,inputnum) # produce 2^n different input files for pfs to use
+        objectives = [(node, val)]
+        curr = node
+        while curr.ntype != "PO" and curr.dnodes:
+            dnode = max(curr.dnodes, key=lambda n: max(n.B0, n.B1))
+            side_val = {"AND": 1, "NAND": 1, "OR": 0, "NOR": 0}.get(dnode.gtype)
+            if side_val is not None:
+                objectives += [(unode, side_val) for unode in dnode.unodes if unode != curr]
+            curr = dnode
+
+        pi_vals = {}
+        visited = set()
+        while objectives:
+            node, val = objectives.pop()
+            if (node.num, val) in visited:
+                continue
+            visited.add((node.num, val))
+            inv = 1 if node.gtype in ["NAND", "NOR", "NOT"] else 0
+            if node.gtype == "IPT":
+                pi_vals[node.num] = None if pi_vals.get(node.num, val) != val else val
+            elif node.gtype in ["NOT", "BUFF", "BRCH"]:
+                objectives.append((node.unodes[0], val ^ inv))
+            elif node.gtype in ["AND", "NAND", "OR", "NOR"]:
+                # value of the inputs that all are needed, e.g. 1 for AND output 1
+                all_val = 1 if node.gtype in ["AND", "NAND"] else 0
+                if val ^ inv == all_val:
+                    objectives += [(unode, all_val) for unode in node.unodes]
+                else:
+                    ctrl = 1 - all_val
+                    unode = max(node.unodes, key=lambda n: n.C1 if ctrl else n.C0)
+                    objectives.append((unode, ctrl))
+            # XOR and XNOR outputs can be justified by any input value
 
-        for i in range(total_pattern):
-            print ('{:05b}'.format(i)) #str type output #Suit different input numbers!!!!
-            # b = (f'{i:0%db}'%inputnum)
-            list_to_pfs = []
-            for j in range(inputnum):
-                list_to_pfs.append(int(b[j]))
+        return {num: val for num, val in pi_vals.items() if val is not None}
 
-            #do pfs based on the prodeuced input files
-            result = []
-            result = self.pfs(list_to_pfs)
-            fault = []
-            for i in result:
-                fault.append("%d@%d" % (i[0], i[1]))
+    def WRP_weights(self, faults=None, n_sets=1, pd_th=config.WRP_PD_TH):
+        """ Weights (probability of 1 for each PI) of weighted random patterns,
+        to target random pattern resistant faults. STAFAN should be already calculated.
+        PI values that help to detect each hard fault are found by WRP_objectives.
+        Each fault is added to the weight set where its values conflict the least, and
+        the weight of a PI in a set is the fraction of its faults that need a 1.
 
-            fault.sort(key = lambda i:int(re.match(r'(\d+)',i).group()))
-            #jb51.net/article/164342.htm for referance to sort the output
+        Arguments
+        ---------
+        faults : FaultList
+            target faults, e.g. faults not detected by PFS. If None, faults with
+            STAFAN detection probability lower than pd_th are targeted
+        n_sets : int
+            number of weight sets
+        pd_th : float
+            threshold of detection probability, used if faults is None
+
+        Returns
+        -------
+        np.ndarray of shape (n_sets, n_PI), can be passed to TPGenerator
+        """
+        for node in self.nodes_lev:
+            if None in [node.C0, node.C1, node.B0, node.B1]:
+                raise ValueError("STAFAN is not calculated or loaded completely. " +
+                        "First, call STAFAN() or load_STAFAN().")
 
-            fault_dict.update({b: fault})
+        if faults is None:
+            targets = []
+            for node in self.nodes_lev:
+                targets.append((node.C1 * node.B1, node, 1))
+                targets.append((node.C0 * node.B0, node, 0))
+            targets = sorted([t for t in targets if t[0] < pd_th], key=lambda t: t[0])
+        else:
+            targets = [(None, self.nodes[f.node_num], 1 - int(f.stuck_val))
+                    for f in faults.faults]
+        if len(targets) == 0:
+            print("Warning: no target fault, weights are 0.5")
+
+        pi_pos = {node.num: idx for idx, node in enumerate(self.PI)}
+        ones = np.zeros((n_sets, len(self.PI)))
+        zeros = np.zeros((n_sets, len(self.PI)))
+        n_faults = [0] * n_sets
+        for _, node, val in targets:
+            pi_vals = self.WRP_objectives(node, val)
+            need_1 = [pi_pos[num] for num, v in pi_vals.items() if v == 1]
+            need_0 = [pi_pos[num] for num, v in pi_vals.items() if v == 0]
+            conflicts = zeros[:, need_1].sum(axis=1) + ones[:, need_0].sum(axis=1)
+            k = min(range(n_sets), key=lambda k: (conflicts[k], n_faults[k]))
+            ones[k, need_1] += 1
+            zeros[k, need_0] += 1
+            n_faults[k] += 1
+
+        votes = ones + zeros
+        weights = np.where(votes > 0, ones / np.maximum(votes, 1), 0.5)
+        return np.clip(weights, config.WRP_MIN_WEIGHT, 1 - config.WRP_MIN_WEIGHT)
+
+    def collapse_faults(self, dominance=True):
+        """ Fault collapsing of the stuck-at faults of all nodes, with structural
+        equivalence and dominance. For a gate input node that has no other fanout and is
+        not a PO, its fault is equivalent to a fault of the gate output:
+            BUFF, BRCH: in@v == out@v,  NOT: in@v == out@(1-v)
+            AND: in@0 == out@0,  NAND: in@0 == out@1,  OR: in@1 == out@1,  NOR: in@1 == out@0
+        Chains of single fanout nodes are merged through union-find.
+        With dominance, the output fault of AND/NAND/OR/NOR gates that dominates the
+        input fault of such inputs (AND: out@1 of in@1, NAND: out@0 of in@1, OR: out@0 of 
+        in@0, NOR: out@1 of in@0) is removed, with its equivalence class, 
+        since any test of the input fault detects it.
 
-        fault_dict_result = open(f"../fault_dic/{self.c_name}.fd", "w")
-        for i in range(len(self.input_num_list)):
-            if (i<len(self.input_num_list)-1):
-                fault_dict_result.write('%d->' % self.input_num_list[i])
+        Arguments
+        ---------
+        dominance : bool
+            if False, only equivalent faults are collapsed
+
+        Returns
+        -------
+        classes : dict
+            {representative: list of its equivalent faults}, for all classes, faults are
+            (node.num, stuck value) and the representative is the fault nearest to PIs
+        dominated : dict
+            {representative of a removed class: list of representatives of kept classes}, 
+            the removed class is detected if any of the kept classes is detected
+        """
+        parent = {}
+        def find(f):
+            while parent[f] != f:
+                parent[f] = parent[parent[f]]
+                f = parent[f]
+            return f
+
+        def union(f1, f2):
+            r1, r2 = find(f1), find(f2)
+            if r1 != r2:
+                # the root is the fault nearest to PIs
+                if (lev[r2[0]], r2) < (lev[r1[0]], r1):
+                    r1, r2 = r2, r1
+                parent[r2] = r1
+
+        lev = {}
+        for node in self.nodes_lev:
+            lev[node.num] = node.lev
+            parent[(node.num, 0)] = (node.num, 0)
+            parent[(node.num, 1)] = (node.num, 1)
+
+        # (value of input fault, value of equivalent output fault) of each gate type
+        equivalent = {"BUFF": [(0, 0), (1, 1)], "BRCH": [(0, 0), (1, 1)], 
+                "NOT": [(0, 1), (1, 0)], 
+                "AND": [(0, 0)], "NAND": [(0, 1)], "OR": [(1, 1)], "NOR": [(1, 0)]}
+        # (value of input fault, value of dominating output fault)
+        dominating = {"AND": (1, 1), "NAND": (1, 0), "OR": (0, 0), "NOR": (0, 1)}
+
+        dominance_edges = []
+        for node in self.nodes_lev:
+            if node.gtype not in equivalent:
+                continue
+            inputs = [unode for unode in node.unodes 
+                    if len(unode.dnodes) == 1 and unode.ntype != "PO"]
+            if len(node.unodes) == 1 and node.gtype in dominating:
+                # single input gate is a buffer or an inverter
+                inv = node.gtype in ["NAND", "NOR"]
+                pairs = [(0, int(inv)), (1, 1-int(inv))]
             else:
-                fault_dict_result.write('%d' % self.input_num_list[i])
-
+                pairs = equivalent[node.gtype]
+            for unode in inputs:
+                for v_in, v_out in pairs:
+                    union((unode.num, v_in), (node.num, v_out))
+            if dominance and len(node.unodes) > 1 and node.gtype in dominating:
+                v_in, v_out = dominating[node.gtype]
+                for unode in inputs:
+                    dominance_edges.append(((node.num, v_out), (unode.num, v_in)))
+
+        classes = {}
+        for f in parent:
+            classes.setdefault(find(f), []).append(f)
+
+        # dominated_by[D]: classes whose detection implies D is detected
+        dominated_by = {}
+        for f_dom, f in dominance_edges:
+            r_dom, r = find(f_dom), find(f)
+            if r_dom != r:
+                dominated_by.setdefault(r_dom, set()).add(r)
+
+        dominated = {}
+        def kept_reps(rep, visiting):
+            if rep not in dominated_by:
+                return set([rep])
+            if rep in dominated:
+                return dominated[rep]
+            visiting.add(rep)
+            res = set()
+            for r in dominated_by[rep]:
+                if r not in visiting:
+                    res |= kept_reps(r, visiting)
+            visiting.discard(rep)
+            dominated[rep] = res
+            return res
+
+        for rep in dominated_by:
+            kept_reps(rep, set())
+        dominated = {rep: sorted(reps) for rep, reps in dominated.items() if reps}
+        return classes, dominated
+
+    def gen_fault_dic(self, fname=None):
+        """
+        Fault Dictionary:
+        key: input pattern value: detected faults
+        All 2^n patterns are simulated with ExhaustiveSim, in Gray-code order of the
+        high PIs, and each fault is simulated only in its fanout cone. 
+        Patterns are written in the order of simulation, the file is streamed. 
+        Fault Dictionary can only be generated for small circuits
+        because the file size will become too large for big circuits.
+        """
+        if fname is None:
+            if not os.path.exists(config.FAULT_DICT_DIR):
+                os.makedirs(config.FAULT_DICT_DIR)
+            fname = os.path.join(config.FAULT_DICT_DIR, f"{self.c_name}.fd")
+
+        fault_list = FaultList(self)
+        fault_list.add_all()
+        faults = fault_list.faults
+        cc = self.compile()
+        sim = self.get_engine(ExhaustiveSim)
+        k, n_pi = sim.word_pis, len(self.PI)
+
+        fault_dict_result = open(fname, "w")
+        fault_dict_result.write('->'.join([node.num for node in self.PI]))
         fault_dict_result.write(' as sequence of inputs')
         fault_dict_result.write('\n')
         fault_dict_result.write('tps\t\t\tdetected_faults\n')
-        for i in range(total_pattern):
-            print ('{:05b}'.format(i)) #str type output #Suit different input numbers!!!!
-            # b = (f'{i:0%db}'%inputnum)
-            fault_dict_result.write('%s\t\t\t\t' % b)
-            for i in range(len(fault_dict.get(b))):
-                fault_dict_result.write('%-5s ' % fault_dict.get(b)[i])#format ok?
-            fault_dict_result.write('\n')
+        for high, det_words in sim.iter_detections(
+                [(cc.num2id[f.node_num], int(f.stuck_val)) for f in faults]):
+            high_str = ''.join([str((high >> j) & 1) for j in range(n_pi - k)])
+            lines = []
+            for p in range(sim.word_bits):
+                tp_str = ''.join([str((p >> j) & 1) for j in range(k)]) + high_str
+                detected = [str(faults[i]) for i, det in enumerate(det_words) if (det >> p) & 1]
+                lines.append(f'{tp_str}\t\t\t\t' + ''.join(['%-5s ' % f for f in detected]) + '\n')
+            fault_dict_result.write(''.join(lines))
 
         fault_dict_result.close()
+        return fname
 
     def gen_fault_dic_multithreading(self, thread_cnt, idx):
         """
@@ -0,0 +1,102 @@
+import hashlib
+import os
+
+import numpy as np
+
+import config
+from node import node
+from circuit.compiled_circuit import CompiledCircuit
+
+# Increase when the content of cache files changes, old files will be ignored
+CACHE_VERSION = 2
+
+
+class NetlistCache:
+    """ Content-addressed binary cache of loaded netlists.
+    A cache file holds the compiled arrays of a circuit (see CompiledCircuit) and
+    the order of nodes, so that a warm load skips parsing, branch insertion and
+    levelization. The cache key is the hash of the netlist file content and of the
+    std_node_lib, hence a modified netlist is never loaded from an old cache file.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = config.CACHE_DIR if cache_dir is None else cache_dir
+
+    @staticmethod
+    def key(c_fname, std_node_lib):
+        """ Hash of the netlist file content and the node classes in std_node_lib """
+        h = hashlib.sha1()
+        h.update(f"v{CACHE_VERSION}".encode())
+        with open(c_fname, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(1<<20), b''):
+                h.update(chunk)
+        for gtype in sorted(std_node_lib):
+            cls = std_node_lib[gtype]
+            h.update(f"{gtype}:{cls.__module__}.{cls.__qualname__};".encode())
+        return h.hexdigest()
+
+    def fname(self, c_fname, std_node_lib):
+        c_name = c_fname.split('/')[-1].split('.')[0]
+        return os.path.join(self.cache_dir,
+                f"{c_name}_{NetlistCache.key(c_fname, std_node_lib)}.npz")
+
+    def save(self, circuit, std_node_lib):
+        """ Saves the compiled arrays of a loaded and levelized circuit """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fname = self.fname(circuit.c_fname, std_node_lib)
+        cc = circuit.compile()
+        order = np.array([cc.num2id[num] for num in circuit.nodes], dtype=np.int32)
+
+        # write in a temp file first, parallel runs may load the same circuit
+        fname_tmp = f"{fname}.{os.getpid()}.tmp"
+        with open(fname_tmp, 'wb') as outfile:
+            np.savez(outfile, nums=np.array(cc.nums, dtype=str), gtype=cc.gtype,
+                    ntype=cc.ntype, lev=cc.lev, fanin_ptr=cc.fanin_ptr, fanin=cc.fanin,
+                    fanout_ptr=cc.fanout_ptr, fanout=cc.fanout, PI=cc.PI, PO=cc.PO,
+                    DFF=cc.DFF, order=order)
+        os.replace(fname_tmp, fname)
+        return fname
+
+    def load(self, circuit, std_node_lib):
+        """ Fills the circuit from the cache file, if it exists.
+
+        Returns
+        -------
+        bool : True if the circuit was loaded from cache
+        """
+        fname = self.fname(circuit.c_fname, std_node_lib)
+        if not os.path.exists(fname):
+            return False
+
+        with np.load(fname, allow_pickle=False) as data:
+            cc = CompiledCircuit.from_arrays(data['nums'], data['gtype'], data['ntype'],
+                    data['lev'], data['fanin_ptr'], data['fanin'], data['fanout_ptr'],
+                    data['fanout'], data['PI'], data['PO'], data['DFF'])
+            order = data['order']
+
+        # node classes are called directly, with the same rules as Node.gen_node
+        gtype_names = [g.name for g in sorted(node.gtype, key=lambda g: g.value)]
+        ntype_names = [n.name for n in sorted(node.ntype, key=lambda n: n.value)]
+        nodes_lev = []
+        for num, n_code, g_code, lev in zip(cc.nums, cc.ntype.tolist(), 
+                cc.gtype.tolist(), cc.lev.tolist()):
+            n_type, g_type = ntype_names[n_code], gtype_names[g_code]
+            new_node = std_node_lib[g_type](n_type, g_type, num)
+            new_node.lev = lev
+            nodes_lev.append(new_node)
+
+        fanin_ptr, fanin = cc.fanin_ptr.tolist(), cc.fanin.tolist()
+        fanout_ptr, fanout = cc.fanout_ptr.tolist(), cc.fanout.tolist()
+        for idx, n in enumerate(nodes_lev):
+            n.unodes = [nodes_lev[i] for i in fanin[fanin_ptr[idx]:fanin_ptr[idx+1]]]
+            n.dnodes = [nodes_lev[i] for i in fanout[fanout_ptr[idx]:fanout_ptr[idx+1]]]
+
+        circuit.nodes = {nodes_lev[idx].num: nodes_lev[idx] for idx in order.tolist()}
+        circuit.nodes_lev = nodes_lev
+        circuit.PI = [nodes_lev[idx] for idx in cc.PI.tolist()]
+        circuit.PO = [nodes_lev[idx] for idx in cc.PO.tolist()]
+        circuit.DFF = [(nodes_lev[q], nodes_lev[d]) for q, d in cc.DFF.tolist()]
+        circuit.compiled = cc
+        circuit._compiled_io = (list(circuit.PI), list(circuit.PO))
+        return True
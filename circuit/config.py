@@ -39,6 +39,7 @@ FAULT_DICT_DIR = os.path.join(DATA_DIR, "fault_dict")
 FAULT_SIM_DIR = os.path.join(DATA_DIR, "fault_sim")
 STAFAN_DIR = os.path.join(DATA_DIR, "stafan-data")
 FIG_DIR = os.path.join(DATA_DIR, "figures")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
 
 """Test Point Insertion Poblem"""
 HTO_TH = 0.1
@@ -53,6 +54,46 @@ SAMPLES = 100
 
 V_FORMATS = ["EPFL", "ISCAS85"]
 
+"""Logic Simulation"""
+# Max memory (bytes) for node values of one chunk in pattern-parallel simulation
+PACKED_SIM_MEM = 1<<28
+# Circuits with more nodes are not compiled to straight-line code (see CodegenSim)
+CODEGEN_MAX_NODES = 20000
+# Number of test patterns read and simulated at once in Circuit.logic_sim_file
+LOGIC_SIM_FILE_CHUNK = 1<<14
+# In exhaustive simulation, this many PIs are enumerated inside a word (2^n bits)
+EXHAUSTIVE_WORD_PIS = 12
+# Extension of binary test pattern files (see TPFile), others are read as text
+TP_BIN_EXT = ".tpb"
+
+"""Fault Simulation"""
+# Number of faults simulated at once in one pass of PFS
+PFS_PASS_WIDTH = 1024
+# Number of tps packed in one word (Python int) when PPSF propagates each fault
+PPSF_BLOCK_TPS = 1<<14
+# Number of tps packed in one word (Python int) in critical path tracing (CPT)
+CPT_BLOCK_TPS = 1<<12
+
+"""Pseudo-Random Pattern Generator (LFSR) for LBIST"""
+# Primitive polynomials by degree, as the exponents of their terms
+PRPG_POLYS = {
+        8: [8, 6, 5, 4, 0],
+        16: [16, 15, 13, 4, 0],
+        24: [24, 23, 22, 17, 0],
+        32: [32, 22, 2, 1, 0],
+        64: [64, 63, 61, 60, 0]}
+PRPG_DEGREE = 32
+# Number of LFSR stages XORed for each output of the phase shifter
+PRPG_PS_TAPS = 3
+
+"""Weighted Random Patterns"""
+# Weights are quantized to multiples of 1/2^WRP_BITS
+WRP_BITS = 8
+# Faults with STAFAN detection probability below this are targeted by weights
+WRP_PD_TH = 1e-3
+# Weights derived from hard faults are kept in [WRP_MIN_WEIGHT, 1-WRP_MIN_WEIGHT]
+WRP_MIN_WEIGHT = 1/16
+
 """Logic Library Related"""
 CELL_NAMES = {
         "XOR": ["xor", "XOR2", "XOR2_X1"],
@@ -64,7 +105,8 @@ CELL_NAMES = {
         "NOT": ["not", "inv", "NOT", "INV_X1", "INV_X2", "INV_X4"],
         "BUFF": ["buff", "buf", 
             "CLKBUF_X12", "CLKBUF_X1", "CLKBUF_X2","CLKBUF_X4","CLKBUF_X8","CLKBUF_X16",
-            "BUF_X1", "BUF_X2", "BUF_X4", "BUF_X8"]
+            "BUF_X1", "BUF_X2", "BUF_X4", "BUF_X8"],
+        "DFF": ["dff", "DFF_X1", "DFF_X2"]
         }
 
 ALL_ISCAS85=["c17","c432","c499","c880","c1355","c1908","c2670","c3540","c5315","c6288","c7552"] 
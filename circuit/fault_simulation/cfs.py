@@ -0,0 +1,234 @@
+import os
+
+import numpy as np
+
+import config
+from fault_simulation.fault_simulation import FaultSim
+from fault_simulation.fault import FaultList
+from logic_simulation.event_sim import EventSim, AND, NAND, XOR, XNOR
+from tp_generator import TPGenerator
+
+VERBOSE_FREQ = 50
+
+
+class CFS(FaultSim):
+    """
+    Concurrent Fault Simulation, single pattern at a time.
+    Each node keeps the set of faults (indices in the fault list) whose faulty machine
+    has a different value than the good machine on that node. As the circuit is binary,
+    the faulty value of such a node is the complement of its good value.
+    The sets are kept from one pattern to the next, and a node is re-evaluated only if the
+    good value or the fault set of one of its fanins has changed (the good machine is
+    simulated by EventSim). A fault is detected when it is in the set of a PO.
+    Dropped faults, including faults of the list already detected fault_drop times, are
+    ignored, and they are removed from the sets of the nodes that are re-evaluated.
+    """
+    def __init__(self, circuit, faults=None):
+        super().__init__(circuit, faults=faults)
+        self.fs_type = "cfs"
+
+    def _setup(self, fault_drop=None):
+        """ Compiles the circuit and resets the good machine and the fault sets.
+        All faults are added if the fault list is empty. Faults with D_count >= fault_drop
+        (if given) are dropped from the start, as in PFS. """
+        if len(self.fault_list.faults) == 0:
+            self.fault_list.add_all()
+        self.cc = self.circuit.compile()
+        self.sim = EventSim(self.cc)
+        self.fault_sets = [set() for _ in range(len(self.cc))]
+        self.dropped = set()
+        if fault_drop:
+            D_counts = self.fault_list.D_counts[:len(self.fault_list.faults)]
+            self.dropped = set(np.flatnonzero(D_counts >= fault_drop).tolist())
+        # faults on each node, as (fault index, stuck value), dropped faults are removed
+        self.local_faults = [[] for _ in range(len(self.cc))]
+        for f_idx, fault in enumerate(self.fault_list.faults):
+            if f_idx not in self.dropped:
+                node_id = self.cc.num2id[fault.node_num]
+                self.local_faults[node_id].append((f_idx, int(fault.stuck_val)))
+
+    def _node_faults(self, idx):
+        """ Returns the set of active faults that make the value of node idx differ
+        from its good value, from the fault sets of its fanin """
+        sim, dropped = self.sim, self.dropped
+        good = sim.values
+        good_val = good[idx]
+        local = self.local_faults[idx]
+        res = set([f_idx for f_idx, stuck_val in local if stuck_val != good_val])
+
+        fins = sim.fanins[idx]
+        if len(fins) == 0:
+            return res
+        fin_sets = [self.fault_sets[i] for i in fins]
+        if not any(fin_sets):
+            return res
+        code = sim.codes[idx]
+        if len(fins) == 1:
+            # buffer or inverter, every difference propagates
+            faulty = fin_sets[0]
+        elif code == XOR or code == XNOR:
+            # differs on an odd number of inputs
+            faulty = set()
+            for fs in fin_sets:
+                faulty ^= fs
+        else:
+            # AND/OR family: if no input has the controlling value, a difference on any
+            # input propagates. Otherwise, it must flip all controlling inputs and
+            # none of the others.
+            ctrl = 0 if code == AND or code == NAND else 1
+            ctrl_sets = [fs for i, fs in zip(fins, fin_sets) if good[i] == ctrl]
+            if not ctrl_sets:
+                faulty = set().union(*fin_sets)
+            else:
+                faulty = set.intersection(*ctrl_sets)
+                if faulty:
+                    faulty = faulty.difference(*[fs for i, fs in zip(fins, fin_sets)
+                        if good[i] != ctrl])
+        if faulty:
+            res |= faulty - dropped
+            for f_idx, stuck_val in local:
+                if stuck_val == good_val:
+                    res.discard(f_idx)
+        return res
+
+    def _one_tp_run(self, tp, fault_drop=None, tp_idx=None):
+        """
+        Runs CFS for one test pattern, starting from the fault sets of the previous one.
+        Nodes whose good value has changed, and the fanout of nodes whose good value
+        or fault set has changed, are evaluated in level order.
+        Updates fault.D_count (and first_det if tp_idx is given), drops the faults with 
+        D_count >= fault_drop (if given)
+        Returns a list of detected faults in this pattern
+        """
+        sim = self.sim
+        sim.run([int(val) for val in tp])
+        queue = [[] for _ in range(self.cc.n_levels)]
+        scheduled = set()
+
+        def schedule(idx):
+            if idx not in scheduled:
+                scheduled.add(idx)
+                queue[sim.levs[idx]].append(idx)
+
+        good_changed = set(sim.changed)
+        for idx in good_changed:
+            schedule(idx)
+            for out in sim.fanouts[idx]:
+                schedule(out)
+
+        for level in queue:
+            for idx in level:
+                new_set = self._node_faults(idx)
+                if new_set != self.fault_sets[idx]:
+                    self.fault_sets[idx] = new_set
+                    for out in sim.fanouts[idx]:
+                        schedule(out)
+
+        detected = set()
+        for po in sim.PO:
+            detected |= self.fault_sets[po]
+        detected -= self.dropped
+
+        fault_list = self.fault_list
+        faults = fault_list.faults
+        for f_idx in detected:
+            fault_list.detect(f_idx, tp_idx)
+            if fault_drop and fault_list.D_counts[f_idx] >= fault_drop:
+                self.dropped.add(f_idx)
+                fault_list.drop(f_idx)
+                node_id = self.cc.num2id[faults[f_idx].node_num]
+                self.local_faults[node_id] = [(i, val) for i, val in self.local_faults[node_id]
+                        if i != f_idx]
+
+        return [faults[f_idx] for f_idx in sorted(detected)]
+
+    def run(self, tps, faults=None, fault_drop=None, verbose=False, save_log=True, seed=None,
+            tp_source=None):
+        """
+        Running the CFS simulation and calculating fault coverage (FC) for the
+        test patterns (tps), in the given order.
+
+        Parameters
+        ----------
+        tps : list of lists , test patterns, or
+            int , number of random test patterns to be generated, or
+            str , file name of test patterns
+
+        faults : FaultList, or 'all' (default None) , if None, self.fault_list is used,
+            all faults if it is empty
+
+        fault_drop : int (default None) , number of tps that must detect a fault so that the 
+            fault is dropped. If None, D_count is the number of detecting tps.
+
+        seed : int (default None) , seed of random tps, see TPGenerator
+
+        tp_source : (default None) , generator of random tps instead of TPGenerator, e.g. PRPG
+
+        Returns
+        -------
+        fc, detected_faults
+        fault coverage after each tp and list of detected faults
+        """
+        if isinstance(faults, FaultList):
+            self.fault_list = faults
+        elif faults == 'all':
+            self.fault_list = FaultList(self.circuit)
+            self.fault_list.add_all()
+        elif faults is not None:
+            raise TypeError("Other types not defined yet.")
+
+        tg = TPGenerator(self.circuit, seed) if tp_source is None else tp_source
+        if isinstance(tps, int):
+            tps = tg.gen_n_random(tps)
+        elif isinstance(tps, str):
+            tps = TPGenerator.load_file(tps)
+        elif not isinstance(tps, list):
+            raise TypeError("tps should be either int, or file name")
+
+        self._setup(fault_drop)
+        if verbose:
+            pr =f"Running CFS with:\n"
+            pr+=f"\t| tp count = {len(tps)}\n"
+            pr+=f"\t| fault count = {len(self.fault_list.faults)}\n"
+            print(pr)
+
+        tpfc_log_fname, tpfc_log_file = None, None
+        if save_log:
+            log_dir = os.path.join(config.FAULT_SIM_DIR, self.circuit.c_name, 'cfs')
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            tpfc_log_fname = os.path.join(log_dir,
+                    f"{self.circuit.c_name}_CFS_TPFC_tp{len(tps)}_f{len(self.fault_list.faults)}.log")
+            tpfc_log_file = open(tpfc_log_fname, 'w')
+
+        fault_coverage = []
+        all_detected_faults = {}
+        for idx, tp in enumerate(tps):
+            detected_faults = self._one_tp_run(tp, fault_drop, idx)
+            for fault in detected_faults:
+                all_detected_faults[id(fault)] = fault
+            fault_coverage.append(self.fault_list.calc_fc())
+
+            log = (f"{idx:5} \t Detected faults: {len(detected_faults):5}" +
+                f"  Total detected faults: {len(all_detected_faults):5}" +
+                f"  FC={100*fault_coverage[-1]:.4f}%")
+            if verbose and idx%VERBOSE_FREQ == 0:
+                print(log)
+            if tpfc_log_file:
+                tpfc_log_file.write(log + "\n")
+
+            if fault_coverage[-1] == 1:
+                if verbose:
+                    print(f'\nAll faults were found on test pattern {idx}\n')
+                break
+
+        if tpfc_log_file:
+            tpfc_log_file.write(f"Fault Coverage = {fault_coverage[-1]*100:.4f}%\n")
+            tpfc_log_file.close()
+            print(f'Log file for tpfc saved in {tpfc_log_fname}')
+
+        if verbose:
+            print(f"\nTPFC completed:\tFC={100*fault_coverage[-1]:.4f}%, " +
+                    f"tot-faults={len(all_detected_faults)}")
+
+        return fault_coverage, list(all_detected_faults.values())
@@ -0,0 +1,303 @@
+import heapq
+import os
+
+import config
+import utils
+from fault_simulation.fault_simulation import FaultSim
+from fault_simulation.fault import FaultList
+from logic_simulation.event_sim import EventSim, AND, NAND, OR, NOR
+from tp_file import TPFile
+from tp_generator import TPGenerator
+
+
+class CPT(FaultSim):
+    """
+    Critical Path Tracing, fault grading from a fault-free simulation.
+    A node is critical for a tp if flipping its value changes a PO, so its stuck-at
+    fault at the complement of its value is detected by that tp.
+    The good circuit is simulated once for a block of tps packed in Python ints
+    (bit k is tp k of the block), and criticality words are traced backward from POs:
+    a node with a single fanout gate is critical where the gate is critical and the
+    node is sensitive, with the same rule as DFTNode.is_sensible (side inputs of
+    AND/NAND at 1, of OR/NOR at 0, always for other gates).
+    Criticality of fanout stems depends on reconvergence, two modes are available:
+        exact: the flip of the stem is propagated in its fanout cone, until POs or until
+            the difference remains on a single node, whose criticality is already known.
+        conservative: a stem is critical where any of its branches is critical if its
+            branches do not reconverge (which is exact), otherwise it is not critical.
+            Detected faults are a subset of the exact ones.
+    """
+    def __init__(self, circuit, faults=None, stem_mode="exact"):
+        super().__init__(circuit, faults=faults)
+        if stem_mode not in ["exact", "conservative"]:
+            raise NameError("stem_mode is not acceptable! stem_mode = 'exact' or 'conservative'")
+        self.fs_type = "cpt"
+        self.stem_mode = stem_mode
+        self.sim = None
+
+    def _setup(self):
+        """ Compiles the circuit and the stem information, again only if the circuit
+        was modified (see Circuit.compile) """
+        cc = self.circuit.compile()
+        if self.sim is not None and self.cc is cc:
+            return
+        self.cc = cc
+        self.sim = EventSim(cc)
+        sim = self.sim
+        self.is_po = [False] * len(cc)
+        for idx in sim.PO:
+            self.is_po[idx] = True
+        # level of the last fanout of each node
+        self.max_fanout_lev = [max([sim.levs[i] for i in fouts], default=-1)
+                for fouts in sim.fanouts]
+        self.reconvergent = None
+        if self.stem_mode == "conservative":
+            self.reconvergent = [len(fouts) > 1 and self._is_reconvergent(idx)
+                    for idx, fouts in enumerate(sim.fanouts)]
+
+    def _is_reconvergent(self, stem):
+        """ True if nodes in the fanout cone of stem are reached from two of its fanouts """
+        fanouts = self.sim.fanouts
+        reached = {}
+        for branch_idx, branch in enumerate(fanouts[stem]):
+            stack = [branch]
+            while stack:
+                idx = stack.pop()
+                if idx in reached:
+                    if reached[idx] != branch_idx:
+                        return True
+                    continue
+                reached[idx] = branch_idx
+                stack.extend(fanouts[idx])
+        return False
+
+    def _sensitivity(self, idx, gate, mask):
+        """ Word of tps where a change of node idx changes the value of its fanout gate,
+        for the current good values (see DFTNode.is_sensible) """
+        sim = self.sim
+        code = sim.codes[gate]
+        if code == AND or code == NAND:
+            sens = mask
+            for i in sim.fanins[gate]:
+                if i != idx:
+                    sens &= sim.values[i]
+            return sens
+        if code == OR or code == NOR:
+            sens = mask
+            for i in sim.fanins[gate]:
+                if i != idx:
+                    sens &= ~sim.values[i]
+            return sens & mask
+        return mask
+
+    def _stem_criticality(self, stem, crit, mask):
+        """ Exact criticality of a stem: its value is flipped and propagated level by level.
+        If at some level only one node carries the difference to the next levels,
+        propagation stops and its known criticality is used. """
+        sim = self.sim
+        values, levs, fanouts = sim.values, sim.levs, sim.fanouts
+        saved = {stem: values[stem]}
+        values[stem] ^= mask
+        queue, heap, scheduled = {}, [], set()
+
+        def schedule(idx):
+            for out in fanouts[idx]:
+                if out not in scheduled:
+                    scheduled.add(out)
+                    if levs[out] not in queue:
+                        queue[levs[out]] = []
+                        heapq.heappush(heap, levs[out])
+                    queue[levs[out]].append(out)
+
+        schedule(stem)
+        live = {stem}
+        detected = 0
+        while heap:
+            lev = heapq.heappop(heap)
+            for idx in queue.pop(lev):
+                val = sim._eval(idx, mask)
+                if val != values[idx]:
+                    saved[idx] = values[idx]
+                    values[idx] = val
+                    if self.is_po[idx]:
+                        detected |= val ^ saved[idx]
+                    if fanouts[idx]:
+                        live.add(idx)
+                        schedule(idx)
+            live = set([idx for idx in live if self.max_fanout_lev[idx] > lev])
+            if len(live) == 1 and stem not in live:
+                dom = live.pop()
+                detected |= (values[dom] ^ saved[dom]) & crit[dom]
+                break
+
+        for idx, val in saved.items():
+            values[idx] = val
+        return detected
+
+    def _criticality(self, mask):
+        """ Criticality word of each node, for the current good values """
+        sim = self.sim
+        crit = [0] * len(self.cc)
+        for idx in reversed(range(len(self.cc))):
+            fouts = sim.fanouts[idx]
+            if self.is_po[idx]:
+                crit[idx] = mask
+            elif len(fouts) == 1:
+                if crit[fouts[0]]:
+                    crit[idx] = crit[fouts[0]] & self._sensitivity(idx, fouts[0], mask)
+            elif len(fouts) > 1:
+                if self.stem_mode == "exact":
+                    crit[idx] = self._stem_criticality(idx, crit, mask)
+                elif not self.reconvergent[idx]:
+                    for out in fouts:
+                        crit[idx] |= crit[out]
+        return crit
+
+    def block_detections(self, pi_vals, n_tps):
+        """
+        Detected faults of the fault list for a block of tps, in bulk
+
+        Arguments
+        ---------
+        pi_vals : list of int, in the same order as circuit.PI
+            bit k of each int is the PI value in tp k of the block (see utils.words_to_ints)
+        n_tps : int, number of tps in the block
+
+        Returns
+        -------
+        list of int, for each fault of the fault list, bit k is 1 if tp k detects the fault
+        """
+        self._setup()
+        mask = (1 << n_tps) - 1
+        sim = self.sim
+        sim.run(pi_vals, mask)
+        crit = self._criticality(mask)
+        values, num2id = sim.values, self.cc.num2id
+        res = []
+        for fault in self.fault_list.faults:
+            idx = num2id[fault.node_num]
+            if fault.stuck_val == '1':
+                res.append(crit[idx] & ~values[idx] & mask)
+            else:
+                res.append(crit[idx] & values[idx])
+        return res
+
+    def _tp_blocks(self, tps, block_tps, tg):
+        """ Yields (pi_vals, n_tps) of consecutive blocks of tps """
+        if isinstance(tps, int):
+            for b0 in range(0, tps, block_tps):
+                n_tps = min(block_tps, tps - b0)
+                yield utils.words_to_ints(tg.gen_packed(n_tps)), n_tps
+        elif isinstance(tps, str) and tps.endswith(config.TP_BIN_EXT):
+            tp_file = TPFile(tps)
+            if tp_file.has_x:
+                print("Warning: X values in the test pattern file are simulated as 0")
+            for words, _, n_tps in tp_file.iter_words(max(1, block_tps // 64)):
+                yield utils.words_to_ints(words), n_tps
+        else:
+            if isinstance(tps, str):
+                tps = TPGenerator.load_file(tps)
+            for b0 in range(0, len(tps), block_tps):
+                tps_block = tps[b0:b0+block_tps]
+                yield utils.words_to_ints(utils.pack_tps(tps_block)), len(tps_block)
+
+    def run(self, tps, faults=None, verbose=False, save_log=True, seed=None, tp_source=None,
+            block_tps=config.CPT_BLOCK_TPS):
+        """
+        Grades the faults in the fault list with CPT, and calculates the fault coverage
+        (FC) after each tp. There is no fault dropping, D_count of each fault is updated
+        with the number of tps that detect it, as in PFS.
+
+        Parameters
+        ----------
+        tps : list of lists , test patterns, or
+            int , number of random test patterns to be generated (block by block), or
+            str , file name of test patterns, binary files (config.TP_BIN_EXT) are read
+            block by block
+
+        faults : FaultList, or 'all' (default None) , if None, self.fault_list is used,
+            all faults if it is empty
+
+        seed : int (default None) , seed of random tps, see TPGenerator
+
+        tp_source : (default None) , generator of random tps instead of TPGenerator, e.g. PRPG
+
+        block_tps : int , number of tps simulated at once
+
+        Returns
+        -------
+        fc, detected_faults
+        fault coverage after each tp and list of detected faults
+        """
+        if isinstance(faults, FaultList):
+            self.fault_list = faults
+        elif faults == 'all':
+            self.fault_list = FaultList(self.circuit)
+            self.fault_list.add_all()
+        elif faults is not None:
+            raise TypeError("Other types not defined yet.")
+        if len(self.fault_list.faults) == 0:
+            self.fault_list.add_all()
+        faults = self.fault_list.faults
+
+        tg = TPGenerator(self.circuit, seed) if tp_source is None else tp_source
+        if not isinstance(tps, (int, str, list)):
+            raise TypeError("tps should be either int, list, or file name")
+
+        if verbose:
+            pr =f"Running CPT ({self.stem_mode}) with:\n"
+            pr+=f"\t| tp count = {tps if isinstance(tps, int) else len(tps)}\n"
+            pr+=f"\t| fault count = {len(faults)}\n"
+            print(pr)
+
+        tpfc_log_fname, tpfc_log_file = None, None
+        if save_log:
+            log_dir = os.path.join(config.FAULT_SIM_DIR, self.circuit.c_name, 'cpt')
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            tpfc_log_fname = os.path.join(log_dir,
+                    f"{self.circuit.c_name}_CPT_TPFC_f{len(faults)}.log")
+            tpfc_log_file = open(tpfc_log_fname, 'w')
+
+        # index of the first detecting tp of each fault
+        first_det = [None] * len(faults)
+        n_tps_all = 0
+        n_detected = 0
+        for pi_vals, n_tps in self._tp_blocks(tps, block_tps, tg):
+            for f_idx, det in enumerate(self.block_detections(pi_vals, n_tps)):
+                if det:
+                    first = n_tps_all + (det & -det).bit_length() - 1
+                    self.fault_list.detect(f_idx, first, bin(det).count('1'))
+                    if first_det[f_idx] is None:
+                        first_det[f_idx] = first
+                        n_detected += 1
+            n_tps_all += n_tps
+
+            log = (f"{n_tps_all:8} tps \t Total detected faults: {n_detected:5}" +
+                f"  FC={100*n_detected/len(faults):.4f}%")
+            if verbose:
+                print(log)
+            if tpfc_log_file:
+                tpfc_log_file.write(log + "\n")
+
+        n_new = [0] * n_tps_all
+        for first in first_det:
+            if first is not None:
+                n_new[first] += 1
+        fault_coverage = []
+        tot_detected = 0
+        for new in n_new:
+            tot_detected += new
+            fault_coverage.append(tot_detected / len(faults))
+
+        if tpfc_log_file:
+            tpfc_log_file.write(f"Fault Coverage = {100*n_detected/len(faults):.4f}%\n")
+            tpfc_log_file.close()
+            print(f'Log file for tpfc saved in {tpfc_log_fname}')
+
+        if verbose:
+            print(f"\nCPT completed:\tFC={100*n_detected/len(faults):.4f}%, " +
+                    f"tot-faults={n_detected}")
+
+        detected_faults = [fault for fault, first in zip(faults, first_det) if first is not None]
+        return fault_coverage, detected_faults
@@ -1,60 +1,260 @@
 import os
+
+import numpy as np
+
 import config
 from fault_simulation.fault_simulation import FaultSim
+from fault_simulation.fault import FaultList
+from logic_simulation.event_sim import AND, NAND, OR, NOR, XOR, XNOR, INVERTING
+from tp_generator import TPGenerator
+
+VERBOSE_FREQ = 50
 
 class DFS(FaultSim):
-    def __init__(self, circuit):
-        FaultSim.__init__(self, circuit)
+    """
+    Deductive Fault Simulation, single pattern at a time.
+    Faults get ids, their index in the fault list, and the fault list of a node (the faults
+    that flip its value) is a bitset in a Python int, bit i is fault i.
+    For a gate with controlling value c, if some inputs are at c, the faults that flip all
+    of them and none of the other inputs are propagated: AND of the lists of inputs at c,
+    ANDNOT the OR of the others. Otherwise, the OR of all input lists is propagated.
+    XOR gates propagate the XOR of input lists. Then local faults are inserted.
+    """
+    def __init__(self, circuit, faults=None):
+        FaultSim.__init__(self, circuit, faults=faults)
         self.fs_type = 'dfs'
+        self._compiled_faults = None
 
-    def fs_for_atpg(self, ipt_pattern):
-        return self.single(ipt_pattern)
+    def _setup(self):
+        """ Compiles the circuit, and the masks of local faults of each node.
+        All faults are added if the fault list is empty. """
+        if len(self.fault_list.faults) == 0:
+            self.fault_list.add_all()
+        cc = self.circuit.compile()
+        self.cc = cc
+        fanin_ptr, fanin = cc.fanin_ptr.tolist(), cc.fanin.tolist()
+        self.fanins = [fanin[fanin_ptr[i]:fanin_ptr[i+1]] for i in range(len(cc))]
+        self.codes = cc.gtype.tolist()
+        self.PI = cc.PI.tolist()
+        self.PO = cc.PO.tolist()
+
+        # sa_masks[idx][v]: bitset of stuck-at-v faults of node idx
+        self.sa_masks = [[0, 0] for _ in range(len(cc))]
+        for f_idx, fault in enumerate(self.fault_list.faults):
+            self.sa_masks[cc.num2id[fault.node_num]][int(fault.stuck_val)] |= 1 << f_idx
+        self.active = (1 << len(self.fault_list.faults)) - 1
+        self._compiled_faults = (self.fault_list.faults, len(self.fault_list.faults))
+
+    def _is_setup(self):
+        """ False if the fault list or the circuit (see Circuit.compile) has changed 
+        since _setup """
+        return self._compiled_faults is not None and \
+                self._compiled_faults[0] is self.fault_list.faults and \
+                self._compiled_faults[1] == len(self.fault_list.faults) and \
+                self.cc is self.circuit.compile()
+
+    def single_bits(self, input_pattern):
+        """ Returns the bitset of active faults detected by input_pattern,
+        in the same order as circuit.PI """
+        if not self._is_setup():
+            self._setup()
+        if len(input_pattern) != len(self.PI):
+            raise ValueError(f"Expected {len(self.PI)} PI values, got {len(input_pattern)}")
+
+        n = len(self.codes)
+        values = [0] * n
+        flists = [0] * n
+        for idx, val in zip(self.PI, input_pattern):
+            values[idx] = int(val)
+        pis = set(self.PI)
+        sa_masks, active = self.sa_masks, self.active
+
+        for idx in range(n):
+            fins = self.fanins[idx]
+            if idx in pis or len(fins) == 0:
+                val = values[idx]
+                flist = 0
+            else:
+                code = self.codes[idx]
+                if code == XOR or code == XNOR:
+                    val, flist = 0, 0
+                    for i in fins:
+                        val ^= values[i]
+                        flist ^= flists[i]
+                elif (code == AND or code == NAND or code == OR or code == NOR) and len(fins) > 1:
+                    ctrl = 0 if code == AND or code == NAND else 1
+                    ctrl_list, nctrl_list, has_ctrl = -1, 0, False
+                    for i in fins:
+                        if values[i] == ctrl:
+                            has_ctrl = True
+                            ctrl_list &= flists[i]
+                        else:
+                            nctrl_list |= flists[i]
+                    val = ctrl if has_ctrl else 1 - ctrl
+                    flist = ctrl_list & ~nctrl_list if has_ctrl else nctrl_list
+                else:
+                    val, flist = values[fins[0]], flists[fins[0]]
+                if code in INVERTING:
+                    val ^= 1
+                values[idx] = val
+
+            # local faults: stuck at the complement flips the node, stuck at val masks it
+            sa_val, sa_nval = sa_masks[idx][val], sa_masks[idx][1-val]
+            if sa_val or sa_nval:
+                flist = (flist & ~sa_val) | (sa_nval & active)
+            flists[idx] = flist
+
+        self.values = values
+        detected = 0
+        for idx in self.PO:
+            detected |= flists[idx]
+        return detected & active
+
+    def _bits_to_faults(self, bits):
+        faults = self.fault_list.faults
+        res = []
+        while bits:
+            low = bits & -bits
+            res.append(faults[low.bit_length()-1])
+            bits ^= low
+        return res
 
     def single(self, input_pattern):
-        """ running deductive fault simulation on the circuit 
-        needs to make sure the levelization is updated """ 
-        self.circuit.logic_sim(input_pattern)
-        fault_set = set()
-        for node in self.circuit.nodes_lev:
-            node.dfs()
-        for node in self.circuit.PO:
-            # print(node.faultlist_dfs)
-            fault_set = fault_set.union(node.faultlist_dfs)
-        # return a fault set
+        """ Runs deductive fault simulation for one test pattern, for the active faults.
+        Returns the set of detected faults, as (node.num, stuck value) """
+        return set([(f.node_num, int(f.stuck_val)) 
+            for f in self._bits_to_faults(self.single_bits(input_pattern))])
+
+    def fs_for_atpg(self, ipt_pattern):
+        """ Fault dropping for ATPG: detected faults of ipt_pattern are dropped,
+        so that following patterns only simulate the remaining faults.
+        Returns the set of newly detected faults, as (node.num, stuck value) """
+        fault_set = self.single(ipt_pattern)
+        self.drop(fault_set)
         return fault_set
 
-    def run(self, tp_num=1, t_mode='rand', r_mode='b'):
+    def drop(self, faults):
+        """ Drops faults, given as Fault objects or (node.num, stuck value) """
+        if not self._is_setup():
+            self._setup()
+        keys = set()
+        for f in faults:
+            fault = self.fault_list.get(f)
+            if fault is None:
+                continue
+            keys.add(fault.key)
+            self.active &= ~(1 << fault.fault_id)
+            self.fault_list.drop(fault.fault_id)
+        self.fault_set_rest = self.fault_set_rest - keys
+
+    def run(self, tps, faults=None, fault_drop=None, verbose=False, save_log=True, seed=None,
+            tp_source=None):
         """
-        Execute fs in rand or full mode
-        rand: the total faults can be detected by several random patterns
-        full: the faults can be detected by each single pattern; all possible patterns are included
+        Running the DFS simulation and calculating fault coverage (FC) for the
+        test patterns (tps), in the given order. Same arguments and results as PFS.run.
+
+        Parameters
+        ----------
+        tps : list of lists , test patterns, or
+            int , number of random test patterns to be generated, or
+            str , file name of test patterns
+
+        faults : FaultList, or 'all' (default None) , if None, self.fault_list is used
+
+        fault_drop : int (default None) , number of tps that must detect a fault so that the 
+            fault is dropped. If None, D_count is the number of detecting tps. Dropped faults 
+            and faults with D_count >= fault_drop in the fault list are not simulated, as in PFS.
+
+        seed : int (default None) , seed of random tps, see TPGenerator
+
+        tp_source : (default None) , generator of random tps instead of TPGenerator, e.g. PRPG
+
+        Returns
+        -------
+        fc, detected_faults
+        fault coverage after each tp and list of detected faults
         """
+        if isinstance(faults, FaultList):
+            self.fault_list = faults
+        elif faults == 'all':
+            self.fault_list = FaultList(self.circuit)
+            self.fault_list.add_all()
+        elif faults is not None:
+            raise TypeError("Other types not defined yet.")
 
-        if t_mode == 'rand':
-            # self.fs_folder(tp_mode='rand', r_mode='b')
+        tg = TPGenerator(self.circuit, seed) if tp_source is None else tp_source
+        if isinstance(tps, int):
+            tps = tg.gen_n_random(tps)
+        elif isinstance(tps, str):
+            tps = TPGenerator.load_file(tps)
+        elif not isinstance(tps, list):
+            raise TypeError("tps should be either int, or file name")
+
+        self._setup()
+        faults = self.fault_list.faults
+        if fault_drop:
+            fault_list = self.fault_list
+            n = len(faults)
+            active = fault_list.live[:n] & (fault_list.D_counts[:n] < fault_drop)
+            self.active = int.from_bytes(np.packbits(active, bitorder='little').tobytes(), 
+                    'little')
+        if verbose:
+            pr =f"Running DFS with:\n"
+            pr+=f"\t| tp count = {len(tps)}\n"
+            pr+=f"\t| fault count = {len(faults)}\n"
+            print(pr)
+
+        tpfc_log_fname, tpfc_log_file = None, None
+        if save_log:
             self.fs_folder()
-            report_fname = self.circuit.c_name + '_' + str(tp_num) + '_dfs_'+ r_mode + '.log'
-            # tp_fname = tp_path + self.c_name + '_' + str(tp_num) + "_tp_b.txt"
-            tp_fname = self.circuit.c_name + '_' + str(tp_num) + "_tp_b.txt"
+            log_dir = os.path.join(config.FAULT_SIM_DIR, self.circuit.c_name, 'dfs')
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            tpfc_log_fname = os.path.join(log_dir,
+                    f"{self.circuit.c_name}_DFS_TPFC_tp{len(tps)}_f{len(faults)}.log")
+            tpfc_log_file = open(tpfc_log_fname, 'w')
 
-            self.fs_tp_gen(tp_num = tp_num, t_mode = 'rand', r_mode = r_mode)
-            # tp_fname is bare name, the path is given in the method
-            pattern_list = self.fs_input_fetch(tp_fname)
-            # run fs multiple
-            self.multiple(pattern_list=pattern_list, fname_log=report_fname, mode="b")
+        all_detected = 0
+        fault_coverage = []
+        for idx, tp in enumerate(tps):
+            detected = self.single_bits(tp)
+            all_detected |= detected
+            detected_faults = []
+            bits = detected
+            while bits:
+                low = bits & -bits
+                f_idx = low.bit_length() - 1
+                self.fault_list.detect(f_idx, idx)
+                if fault_drop and self.fault_list.D_counts[f_idx] >= fault_drop:
+                    self.active ^= low
+                    self.fault_list.drop(f_idx)
+                detected_faults.append(faults[f_idx])
+                bits ^= low
+            fault_coverage.append(self.fault_list.calc_fc())
 
-        elif t_mode == 'full':
-            self.fs_folder(tp_mode='full', r_mode='b')
-            report_fname = self.circuit.c_name + '_full_dfs_' + r_mode + '.log'
-            tp_fname = self.circuit.c_name + '_full_tp_' + r_mode + '.txt'
-            # generate all possible patterns in order
-            self.fs_tp_gen(tp_num = tp_num, t_mode = 'full', r_mode = r_mode)
-            pattern_list = self.fs_input_fetch(tp_fname)
-            # run dfs
-            self.multiple_separate(pattern_list=pattern_list, fname_log=report_fname, mode="b")
+            log = (f"{idx:5} \t Detected faults: {len(detected_faults):5}" +
+                f"  Total detected faults: {bin(all_detected).count('1'):5}" +
+                f"  FC={100*fault_coverage[-1]:.4f}%")
+            if verbose and idx%VERBOSE_FREQ == 0:
+                print(log)
+            if tpfc_log_file:
+                tpfc_log_file.write(log + "\n")
 
-        else:
-            raise NameError("Mode is not acceptable! Mode = 'rand' or 'full'!")
+            if fault_coverage[-1] == 1:
+                if verbose:
+                    print(f'\nAll faults were found on test pattern {idx}\n')
+                break
+
+        if tpfc_log_file:
+            tpfc_log_file.write(f"Fault Coverage = {fault_coverage[-1]*100:.4f}%\n")
+            tpfc_log_file.close()
+            print(f'Log file for tpfc saved in {tpfc_log_fname}')
+
+        if verbose:
+            print(f"\nTPFC completed:\tFC={100*fault_coverage[-1]:.4f}%, " +
+                    f"tot-faults={bin(all_detected).count('1')}")
+
+        return fault_coverage, self._bits_to_faults(all_detected)
 
 
 ######################## just for golden file ########################################################
@@ -1,11 +1,43 @@
+import numpy as np
+
+
 class Fault():
+    """ A stuck-at fault. If it belongs to a FaultList, it is a view of one entry of
+    the fault list arrays, and D_count reads and updates FaultList.D_counts. """
+    __slots__ = ("node_num", "stuck_val", "D_count_list", "_fl", "_idx", "_D_count")
+
     def __init__(self, node_num, stuck_val):
         self.node_num = str(node_num)
         self.stuck_val = str(stuck_val)
-        self.D_count = 0 
+        self._fl = None
+        self._idx = None
+        self._D_count = 0
         # Issue: in PPSFm D_count is set as an array
         self.D_count_list = [] # used in ppsf-bad!
 
+    @property
+    def D_count(self):
+        if self._fl is None:
+            return self._D_count
+        return int(self._fl.D_counts[self._idx])
+
+    @D_count.setter
+    def D_count(self, value):
+        if self._fl is None:
+            self._D_count = value
+        else:
+            self._fl.set_D_count(self._idx, value)
+
+    @property
+    def fault_id(self):
+        """ Index of the fault in its FaultList, None if it is not in a fault list """
+        return self._idx
+
+    @property
+    def key(self):
+        """ (node_num, stuck value as int), used to find the fault in a FaultList """
+        return (self.node_num, int(self.stuck_val))
+
     def __str__(self):
         return self.node_num + "@" + self.stuck_val
 
@@ -14,7 +46,23 @@ class Fault():
 
 
 class FaultList:
-    """ Fault list """
+    """ Fault list, backed by arrays indexed by fault id (the position in self.faults).
+    Fault objects in self.faults are views of these arrays.
+
+    Attributes
+    ----------
+    node_ids : np.ndarray (int32)
+        index of the node of each fault in circuit.nodes_lev, -1 if there is no circuit
+    stuck_vals : np.ndarray (uint8)
+    D_counts : np.ndarray (int64)
+        number of detections of each fault, see Fault.D_count
+    first_det : np.ndarray (int64)
+        index of the first tp that detected each fault, -1 if unknown or not detected
+    live : np.ndarray (bool)
+        False for faults dropped with drop()
+    n_detected : int
+        number of faults with D_count > 0, kept up to date with D_counts
+    """
     def __init__(self, circuit=None, fname=None, fault_list=None, fault_count=None, nodes=None):
         """
         fname : str 
@@ -28,8 +76,11 @@ class FaultList:
         nodes : list of Node
             if given, all faults related to the given nodes are added
         """
-        self.faults = []
         self.circuit = circuit
+        self._clear()
+        # set by add_collapsed, see DFTCircuit.collapse_faults
+        self.classes = {}
+        self.dominated = {}
 
         if fname:
             self.add_file(fname)
@@ -47,13 +98,145 @@ class FaultList:
         elif nodes:
             self.add_nodes(nodes)
 
+    def _clear(self):
+        self._faults = []
+        self._index = {}
+        self._num2id = None
+        self.node_ids = np.zeros(0, dtype=np.int32)
+        self.stuck_vals = np.zeros(0, dtype=np.uint8)
+        self.D_counts = np.zeros(0, dtype=np.int64)
+        self.first_det = np.zeros(0, dtype=np.int64)
+        self.live = np.zeros(0, dtype=bool)
+        self.n_detected = 0
+
+    @property
+    def faults(self):
+        """ list of Fault, in the order of fault ids """
+        return self._faults
+
+    @faults.setter
+    def faults(self, faults):
+        """ Replaces the faults, see add_fault """
+        faults = [self._detached(f) if f._fl is not None else (f, -1) for f in faults]
+        self._clear()
+        for fault, first in faults:
+            self.add_fault(fault)
+            self.first_det[fault._idx] = first
+
+    @staticmethod
+    def _detached(fault):
+        """ A copy of a fault of a fault list that is not in any list, and its first_det """
+        new_f = Fault(fault.node_num, fault.stuck_val)
+        new_f.D_count_list = fault.D_count_list
+        new_f._D_count = fault.D_count
+        return new_f, int(fault._fl.first_det[fault._idx])
+
+    def _node_id(self, node_num):
+        if self.circuit is None:
+            return -1
+        if self._num2id is None:
+            self._num2id = {node.num: idx for idx, node in enumerate(self.circuit.nodes_lev)}
+        return self._num2id.get(node_num, -1)
+
+    def _grow(self):
+        """ Doubles the capacity of the arrays """
+        size = max(16, 2 * len(self.D_counts))
+        n = len(self._faults)
+        for name, fill in [("node_ids", -1), ("stuck_vals", 0), ("D_counts", 0), 
+                ("first_det", -1), ("live", True)]:
+            arr = getattr(self, name)
+            new = np.full(size, fill, dtype=arr.dtype)
+            new[:n] = arr[:n]
+            setattr(self, name, new)
+
+    def _view(self, name):
+        return getattr(self, name)[:len(self._faults)]
+
+    def add_fault(self, fault: Fault):
+        """ Adds a fault. A fault that is not in another fault list becomes a view of
+        this one, o.w. a copy of it is added. D_count and first_det are kept. """
+        first = -1
+        if fault._fl is not None:
+            fault, first = self._detached(fault)
+        D_count = fault._D_count
+
+        idx = len(self._faults)
+        if idx == len(self.D_counts):
+            self._grow()
+        self.node_ids[idx] = self._node_id(fault.node_num)
+        self.stuck_vals[idx] = int(fault.stuck_val)
+        self.D_counts[idx] = 0
+        self.first_det[idx] = first
+        self.live[idx] = True
+        fault._fl, fault._idx = self, idx
+        self._faults.append(fault)
+        self._index.setdefault(fault.key, idx)
+        if D_count:
+            self.set_D_count(idx, D_count)
+
     def add(self, node_num, stuck_val):
-        self.faults.append(Fault(node_num, stuck_val))
+        self.add_fault(Fault(node_num, stuck_val))
 
     def add_str(self, fault_str):
         """ add a fault if the fault format is <node-num>@<stuck value> """ 
         num, val = fault_str.strip().split("@")
-        self.faults.append(Fault(num, val))
+        self.add_fault(Fault(num, val))
+
+    @staticmethod
+    def _key(fault):
+        if isinstance(fault, Fault):
+            return fault.key
+        if isinstance(fault, str):
+            num, val = fault.strip().split("@")
+            return (num, int(val))
+        return (str(fault[0]), int(fault[1]))
+
+    def index(self, fault):
+        """ Fault id of fault, given as Fault, (node_num, stuck value) or <node-num>@<stuck value>.
+        If a fault is added more than once, the first one is returned. Raises KeyError if 
+        the fault is not in the list. """
+        return self._index[self._key(fault)]
+
+    def get(self, fault):
+        """ The Fault of this list that is the same as fault (see index), or None """
+        try:
+            return self._faults[self.index(fault)]
+        except KeyError:
+            return None
+
+    def set_D_count(self, idx, value):
+        """ Sets D_count of fault id idx, and updates n_detected """
+        old = self.D_counts[idx]
+        self.D_counts[idx] = value
+        self.n_detected += int(value > 0) - int(old > 0)
+
+    def detect(self, idx, tp_idx=None, count=1):
+        """ Adds count detections to fault id idx, by test pattern tp_idx (if known) """
+        self.set_D_count(idx, self.D_counts[idx] + count)
+        if tp_idx is not None and count > 0 and self.first_det[idx] < 0:
+            self.first_det[idx] = tp_idx
+
+    def set_first_det(self, fault_ids, tp_idx):
+        """ Sets first_det of the given fault ids to tp_idx, if not already set """
+        fault_ids = np.asarray(fault_ids, dtype=np.int64)
+        first_det = self._view("first_det")
+        first_det[fault_ids[first_det[fault_ids] < 0]] = tp_idx
+
+    def reset_D_counts(self):
+        """ Sets D_count of all faults to 0, first_det to -1, and all faults live """
+        self._view("D_counts")[:] = 0
+        self._view("first_det")[:] = -1
+        self._view("live")[:] = True
+        self.n_detected = 0
+
+    def drop(self, fault):
+        """ Marks a fault (or fault id) as dropped, it stays in the list """
+        idx = fault if isinstance(fault, (int, np.integer)) else self.index(fault)
+        self.live[idx] = False
+
+    def live_faults(self):
+        """ list of Fault that are not dropped """
+        return [self._faults[idx] for idx in np.flatnonzero(self._view("live"))]
 
     def add_str_list(self, faults_str_list):
         """ add faults with their string in faults_str_list """
@@ -64,6 +247,24 @@ class FaultList:
         for node in self.circuit.nodes_lev:
             self.add_node(node)
 
+    def add_collapsed(self, dominance=True):
+        """ Adds a representative fault of each class of equivalent faults, 
+        classes removed by dominance are not added (see DFTCircuit.collapse_faults).
+        Sets self.classes, {representative: equivalent faults} for all classes, and 
+        self.dominated, {representative of a removed class: representatives that imply 
+        its detection}, faults are strings as in Fault.__str__. They are used in calc_fc_full.
+        """
+        if not hasattr(self.circuit, "collapse_faults"):
+            raise TypeError("Fault collapsing needs a DFTCircuit")
+        classes, dominated = self.circuit.collapse_faults(dominance)
+        fstr = lambda f: f"{f[0]}@{f[1]}"
+        self.classes = {fstr(rep): [fstr(f) for f in faults] for rep, faults in classes.items()}
+        self.dominated = {fstr(rep): [fstr(f) for f in reps] for rep, reps in dominated.items()}
+        for node in self.circuit.nodes_lev:
+            for val in [0, 1]:
+                if (node.num, val) in classes and (node.num, val) not in dominated:
+                    self.add(node.num, val)
+
     def add_n_random(self, n=1):
         """Add n random unique faults"""
         if n >= len(self.circuit.nodes_lev):
@@ -73,26 +274,16 @@ class FaultList:
         for n_num in random.choices(list(self.circuit.nodes.keys()), k=n):
             self.add(node_num=n_num, stuck_val=random.randint(0,1))
 
-    def add_fault(self, fault: Fault):
-        self.faults.append(fault)
-    
     def copy_fault(self, fault: Fault):
         new_f = Fault(fault.node_num, fault.stuck_val)
         new_f.D_count_list = fault.D_count_list.copy()
         self.add_fault(new_f)
 
     def remove_faults(self, faults):
-        # TODO: this is not a good method, to be modified after
-        # the main data structure is changed to a dict or set
-        # Does not change the current faults
-        current_faults = set([str(x) for x in self.faults])
-        if isinstance(faults, list):
-            faults = set([str(x) for x in faults])
-        new_faults = current_faults - faults
-        # self.faults = []
-        # for fault in new_faults:
-        #     self.faults.add_str(fault)
-        return list(new_faults)
+        """ Returns the strings of faults in this list that are not in faults (list or set
+        of Fault or fault strings). Does not change the current faults """
+        removed = set([self._key(fault) for fault in faults])
+        return list(set([str(fault) for fault in self.faults if fault.key not in removed]))
 
     def add_node(self, node):
         """ adds both S@0 and S@1 faults for node """
@@ -132,14 +323,23 @@ class FaultList:
                 print("Fault list with D_counts is stored in {}".format(fname))
     
     def calc_fc(self):
-        detected_count = 0
-        for fault in self.faults:
-            if fault.D_count > 0:
-                detected_count += 1
-        return detected_count / len(self.faults)
+        """ Fraction of faults with D_count > 0, kept incrementally """
+        return self.n_detected / len(self.faults)
    
+    def calc_fc_full(self):
+        """ Fault coverage of all faults, for a fault list of collapsed faults (see 
+        add_collapsed). A class is detected if its representative is detected, a class 
+        removed by dominance is detected if any of its dominated representatives is. 
+        For removed classes, this is a lower bound. """
+        if not self.classes:
+            return self.calc_fc()
+        detected = set([str(fault) for fault in self.faults if fault.D_count > 0])
+        detected_count, total_count = 0, 0
+        for rep, faults in self.classes.items():
+            total_count += len(faults)
+            if rep in detected or any([r in detected for r in self.dominated.get(rep, [])]):
+                detected_count += len(faults)
+        return detected_count / total_count
+
     def get_D_count(self):
-        res = {}
-        for fault in self.faults:
-            res[str(fault)] = fault.D_count
-        return res
+        return dict(zip([str(fault) for fault in self.faults], self._view("D_counts").tolist()))
@@ -1,4 +1,7 @@
 import os
+from multiprocessing import Array, Barrier, Pipe, Process
+
+import numpy as np
 
 import config
 from fault_simulation.fault_simulation import FaultSim
@@ -6,13 +9,22 @@ from fault_simulation.fault import FaultList
 from tp_generator import TPGenerator
 
 VERBOSE_FREQ = 50
+# In multiprocess PFS, processes are synchronized after this many tps
+SYNC_TPS = 64
 class PFS(FaultSim):
     """ 
     Parallel Fault Single Pattern, Fault Simulation 
     """
-    def __init__(self, circuit, faults=None):
+    def __init__(self, circuit, faults=None, pass_width=config.PFS_PASS_WIDTH):
+        """
+        Arguments
+        ---------
+        pass_width : int
+            number of faults simulated in one pass, node values are ints of pass_width+1 bits
+        """
         super().__init__(circuit, faults=faults)
         self.fs_type = "pfs"
+        self.pass_width = pass_width
         self.fs_folder()
         
     def fs_folder(self):
@@ -29,74 +41,75 @@ class PFS(FaultSim):
         Updates the fault.D_count of fault_list.faults
         Returns a list of detected faults in this pass
         tp sequence is important, if circuit.PI=[Na, Nb, Nc], then tp=[Xa, Xb, Xc]
+
+        In each pass, up to self.pass_width faults are simulated at once: 
+        bit i of node values belongs to faults_pass[i], and the next bit to the good circuit.
         #TODO: Fix fault drop
         """
         detected_faults = set() 
 
-        ptr0 = 0
-        while (ptr0 < len(self.fault_list.faults)):
-            pfs_stuck_values = 0
+        sim = self.circuit.get_codegen()
+        if sim is not None:
+            num2id = sim.cc.num2id
+            po_ids = sim.cc.PO.tolist()
 
+        faults = self.fault_list.faults
+        if fault_drop:
+            # ids of faults that are not dropped yet
+            fault_ids = np.flatnonzero(self.fault_list.D_counts[:len(faults)] < fault_drop).tolist()
+        else:
+            fault_ids = range(len(faults))
+        for ptr0 in range(0, len(fault_ids), self.pass_width):
             # fault list for one pass
-            mask_dict = {}  # {key: fault_num, value: mask}
-            faults_pass = []
-            faults_pass_idx = []
-
-            if fault_drop:    
-                ptr1 = ptr0
-                while len(faults_pass) < self.wordlen-1 and \
-                        ptr1 != len(self.fault_list.faults) :
-                    fault = self.fault_list.faults[ptr1]
-                    if fault.D_count < fault_drop:
-                        faults_pass.append(fault)
-                        faults_pass_idx.append(ptr1)
-                    ptr1 += 1
-            else:
-                ptr1 = min(ptr0+self.wordlen-2, len(self.fault_list.faults)-1)
-                for x in range(ptr0, ptr1+1):
-                    faults_pass.append(self.fault_list.faults[x])
-                    faults_pass_idx.append(x)
-            
-            ptr0 = ptr1+1
-            for i in range(len(faults_pass)):
-                pfs_stuck_values += int(faults_pass[i].stuck_val) * (2**i)
+            faults_pass = [faults[idx] for idx in fault_ids[ptr0:ptr0+self.pass_width]]
 
-                if faults_pass[i].node_num in mask_dict:
-                    mask_dict[faults_pass[i].node_num] += 2**i
-                else:
-                    mask_dict[faults_pass[i].node_num] = 2**i
+            pfs_stuck_values = 0
+            mask_dict = {}  # {key: fault_num, value: mask}
+            for i, fault in enumerate(faults_pass):
+                if fault.stuck_val == '1':
+                    pfs_stuck_values |= 1 << i
+                mask_dict[fault.node_num] = mask_dict.get(fault.node_num, 0) | (1 << i)
+            fault_mask = (1 << len(faults_pass)) - 1
+            bitwise_not = (fault_mask << 1) | 1
 
             # pfs for one pass
-            node_dict = dict(zip([x.num for x in self.circuit.PI], tp))
-            for node in self.circuit.nodes_lev:
+            if sim is not None:
+                # generated code, node.pfs_V is not updated
+                fault_masks = {num2id[num]: mask for num, mask in mask_dict.items()}
+                pi_vals = [bitwise_not if int(val) else 0 for val in tp]
+                vals = sim.run_inject(pi_vals, bitwise_not, fault_masks, pfs_stuck_values)
+                po_vals = [vals[idx] for idx in po_ids]
+            else:
+                node_dict = dict(zip([x.num for x in self.circuit.PI], tp))
+                for node in self.circuit.nodes_lev:
 
-                # PFS mask 
-                node.pfs_I = 0
-                if node.num in mask_dict:
-                    node.pfs_I = mask_dict[node.num]
-                
-                # Simple parallel simulation of a node 
-                if node.gtype == "IPT":
-                    node.imply_p(node.bitwise_not, node_dict[node.num])
-                else:
-                    node.imply_p(node.bitwise_not)
-                
-                # Fault injection 
-                node.insert_f(node.bitwise_not, pfs_stuck_values)
+                    # PFS mask 
+                    node.pfs_I = mask_dict.get(node.num, 0)
+                    
+                    # Simple parallel simulation of a node 
+                    if node.gtype == "IPT":
+                        node.imply_p(bitwise_not, node_dict[node.num])
+                    else:
+                        node.imply_p(bitwise_not)
+                    
+                    # Fault injection 
+                    node.insert_f(bitwise_not, pfs_stuck_values)
+                po_vals = [po.pfs_V for po in self.circuit.PO]
             
-            # output result
-            for i in self.circuit.PO:
-                # if some faults can be detected
-                if (i.pfs_V != 0) and (i.pfs_V != node.bitwise_not):
-                    pfs_V_str = format(i.pfs_V,"b").zfill(self.wordlen)
-                    msb_pfs_V = pfs_V_str[0]        # MSB of pfs_V: good circuit
-                    for j in range(self.wordlen-1):
-                        if pfs_V_str[self.wordlen-1-j] != msb_pfs_V:
-                            # tp found this fault_pass[j]
-                            detected_faults.add(faults_pass[j])
+            # a fault is detected if its bit differs from the good bit (MSB) in any PO
+            detected = 0
+            for pfs_V in po_vals:
+                good = fault_mask if pfs_V >> len(faults_pass) else 0
+                detected |= (pfs_V ^ good) & fault_mask
+            while detected:
+                low = detected & -detected
+                detected_faults.add(faults_pass[low.bit_length()-1])
+                detected ^= low
 
         for fault in detected_faults:
             fault.D_count += 1
+            if fault_drop and fault.D_count >= fault_drop:
+                self.fault_list.drop(fault.fault_id)
 
         return list(detected_faults)
 
@@ -123,6 +136,7 @@ class PFS(FaultSim):
 
         for idx, tp in enumerate(tps):
             detected_faults = self._one_tp_run(tp, fault_drop)
+            self.fault_list.set_first_det([f.fault_id for f in detected_faults], idx)
             
             for df in detected_faults:
                 all_detected_faults.add(df)
@@ -171,7 +185,8 @@ class PFS(FaultSim):
 
         return fault_coverage, list(all_detected_faults)
 
-    def run(self, tps, faults=None, fault_drop=None, verbose=False, save_log=True):
+    def run(self, tps, faults=None, fault_drop=None, verbose=False, save_log=True, seed=None,
+            tp_source=None, num_proc=1):
         """ 
         Running the PFS simulation and calculating fault coverage (FC) for the number of
         test patterns (tps), which is referred to as TPFC. 
@@ -189,6 +204,13 @@ class PFS(FaultSim):
         fault_drop : int (default None) , number of tps that must detect a fault so that the fault is
          dropped from fault_list, in other words considered completely detected. 
 
+        seed : int (default None) , seed of random tps, see TPGenerator
+
+        tp_source : (default None) , generator of random tps instead of TPGenerator, e.g. PRPG
+
+        num_proc : int (default 1) , number of processes. If more than 1, the fault list is 
+            split in shards simulated in parallel, see _multiprocess_run. 
+
          #TODO: pass faults
 
         Returns
@@ -207,11 +229,11 @@ class PFS(FaultSim):
         else:
             raise TypeError("Other types not defined yet.")
         
-        tg = TPGenerator(self.circuit)
+        tg = TPGenerator(self.circuit, seed) if tp_source is None else tp_source
         if isinstance(tps, int):
             tps = tg.gen_n_random(tps)
         elif isinstance(tps, str):
-            tps = tg.load_file(tps)
+            tps = TPGenerator.load_file(tps)
         elif not isinstance(tps, list):
             raise TypeError("tps should be either int, or file name")
 
@@ -221,7 +243,7 @@ class PFS(FaultSim):
             pr+=f"\t| fault count = {len(self.fault_list.faults)}\n"        
             print(pr)
 
-        faults_log_fname=None
+        faults_log_fname, tpfc_log_fname = None, None
         
         if save_log:
             log_dir = os.path.join(config.FAULT_SIM_DIR, self.circuit.c_name)+'/pfs/'
@@ -231,7 +253,11 @@ class PFS(FaultSim):
             tpfc_log_fname = f"{log_dir}{self.circuit.c_name}_PFS_TPFC_tp{len(tps)}_f{len(self.fault_list.faults)}.log"
 
 
-        fc, detected_faults = self._multiple_tp_run(tps=tps, fault_drop=fault_drop, 
+        if num_proc > 1:
+            fc, detected_faults = self._multiprocess_run(tps=tps, fault_drop=fault_drop, 
+                    num_proc=num_proc, tpfc_log_fname=tpfc_log_fname)
+        else:
+            fc, detected_faults = self._multiple_tp_run(tps=tps, fault_drop=fault_drop, 
                                                     log_fname=[faults_log_fname, tpfc_log_fname], verbose=verbose)
 
         if verbose: 
@@ -239,6 +265,117 @@ class PFS(FaultSim):
         
         return  fc, detected_faults
 
+    def _shard_runner(self, conn, faults, tps, fault_drop, id_proc, done_at, barrier):
+        """ Runs PFS for a shard of the faults, in a forked process. 
+        As in _multiple_tp_run, the run stops at the tp where all faults are detected, 
+        of all shards: processes are synchronized every SYNC_TPS tps, and detections 
+        after that tp in the last block are undone. 
+        Sends D_count and the index of the first detecting tp of each fault (None if not 
+        detected), and the number of faults detected by each tp """
+        try:
+            self.fault_list = faults
+            first_det = [None] * len(faults.faults)
+            n_det = []
+            n_first = 0
+            for b0 in range(0, len(tps), SYNC_TPS):
+                block_det = []  # (tp index, fault position) of detections in this block
+                for idx in range(b0, min(b0 + SYNC_TPS, len(tps))):
+                    detected_faults = self._one_tp_run(tps[idx], fault_drop)
+                    n_det.append(len(detected_faults))
+                    for fault in detected_faults:
+                        block_det.append((idx, fault.fault_id))
+                        if first_det[fault.fault_id] is None:
+                            first_det[fault.fault_id] = idx
+                            n_first += 1
+                    if n_first == len(faults.faults) and done_at[id_proc] < 0:
+                        done_at[id_proc] = idx
+                barrier.wait()
+                last_tp = max(done_at) if min(done_at) >= 0 else None
+                barrier.wait()
+                if last_tp is not None:
+                    for idx, fault_pos in block_det:
+                        if idx > last_tp:
+                            faults.faults[fault_pos].D_count -= 1
+                    n_det = n_det[:last_tp+1]
+                    break
+        except Exception:
+            barrier.abort()
+            raise
+        conn.send((faults.D_counts[:len(faults.faults)].tolist(), first_det, n_det))
+        conn.close()
+
+    def _multiprocess_run(self, tps, fault_drop=None, num_proc=2, tpfc_log_fname=None):
+        """ 
+        PFS over num_proc forked processes, each simulates the tps for a shard of the 
+        fault list (every num_proc-th fault). Fault dropping is per fault, hence it is the
+        same as in a single process. The FC of each tp is merged from the first detecting 
+        tp of all faults. Results are the same as _multiple_tp_run, but the fault log 
+        is not written. 
+
+        Returns
+        -------
+        fault_coverage, detected_faults : as _multiple_tp_run
+        """
+        faults = self.fault_list.faults
+        # generated code is compiled once and shared with the forked processes
+        self.circuit.get_codegen()
+
+        done_at = Array('q', [-1] * num_proc)
+        barrier = Barrier(num_proc)
+        process_list = []
+        for id_proc in range(num_proc):
+            parent_conn, child_conn = Pipe()
+            shard = FaultList()
+            shard.faults = faults[id_proc::num_proc]
+            p = Process(target=self._shard_runner, 
+                    args=(child_conn, shard, tps, fault_drop, id_proc, done_at, barrier))
+            p.start()
+            process_list.append((p, parent_conn))
+
+        first_det = [None] * len(faults)
+        n_det = [0] * len(tps)
+        for id_proc, (p, conn) in enumerate(process_list):
+            try:
+                D_counts, shard_first, shard_n_det = conn.recv()
+            except EOFError:
+                raise RuntimeError(f"PFS process {id_proc} failed")
+            p.join()
+            for idx, D_count, first in zip(range(id_proc, len(faults), num_proc), 
+                    D_counts, shard_first):
+                faults[idx].D_count = D_count
+                first_det[idx] = first
+                if first is not None:
+                    self.fault_list.set_first_det([idx], first)
+                if fault_drop and D_count >= fault_drop:
+                    self.fault_list.drop(idx)
+            for idx, count in enumerate(shard_n_det):
+                n_det[idx] += count
+
+        n_tps = max(done_at) + 1 if min(done_at) >= 0 else len(tps)
+        n_new = [0] * n_tps
+        for first in first_det:
+            if first is not None:
+                n_new[first] += 1
+
+        fault_coverage = []
+        tot_detected = 0
+        tpfc_log_file = open(tpfc_log_fname, 'w') if tpfc_log_fname else None
+        for idx, new in enumerate(n_new):
+            tot_detected += new
+            fault_coverage.append(tot_detected / len(faults))
+            if tpfc_log_file:
+                tpfc_log_file.write(f"{idx:5} \t Detected faults: {n_det[idx]:5}" +
+                f"  New Faults: {new:5}"
+                f"  Total detected faults: {tot_detected:5}" +
+                f"  FC={100*tot_detected/len(faults):.4f}%\n")
+        if tpfc_log_file:
+            tpfc_log_file.write(f"Fault Coverage = {fault_coverage[-1]*100:.4f}%\n")
+            tpfc_log_file.close()
+            print(f'Log file for tpfc saved in {tpfc_log_fname}')
+
+        detected_faults = [fault for fault, first in zip(faults, first_det) if first is not None]
+        return fault_coverage, detected_faults
+
     def tpfc(self, tps, log_fname=None, fault_drop=None, verbose=False):
         """ 
         Running the PFS simulation and calculating fault coverage (FC) for the number of
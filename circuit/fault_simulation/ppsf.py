@@ -1,4 +1,3 @@
-import math
 import os
 import sys
 import time
@@ -11,6 +10,7 @@ import numpy as np
 import utils
 from fault_simulation.fault import FaultList
 from fault_simulation.fault_simulation import FaultSim
+from logic_simulation.event_sim import EventSim
 from tp_generator import TPGenerator
 
 
@@ -67,7 +67,7 @@ class PPSF(FaultSim):
         
         return res_fixed
 
-    def run(self, tps, faults=None, save_log=False, verbose=False):
+    def run(self, tps, faults=None, save_log=False, verbose=False, seed=None, tp_source=None):
         """ 
         Runs PPSF for the faults in the fault list, given tp count/list/fname
         For each fault, it counts the number of times it has been detected
@@ -76,13 +76,17 @@ class PPSF(FaultSim):
         Updates fault.D_count
 
         faults: None: consider self.fault_list if already set, else all faults
-                FaultList: consider given FaultList
+                FaultList: consider given FaultList, even if self.fault_list is set
                 int: n random
 
         tps : int: number of random tps
               str: address of file containing tps
               list: list of test patterns
 
+        seed : seed of random tps, see TPGenerator
+
+        tp_source : generator of random tps instead of TPGenerator, e.g. PRPG
+
         num_proc : int
             Number of processes. Default is 1. if more than 1, algorithm is run in parallel.
 
@@ -92,13 +96,15 @@ class PPSF(FaultSim):
         """
         
         if isinstance(tps, int):
-            tg = TPGenerator(self.circuit)
+            tg = TPGenerator(self.circuit, seed) if tp_source is None else tp_source
             tps = tg.gen_n_random(tps) # Not unique. Pass unique=True if want so --> as warning?
         elif isinstance(tps, str):
             tg = TPGenerator(self.circuit)
             tps = tg.load_file(tps)
 
-        if faults is None and len(self.fault_list.faults) == 0:
+        if isinstance(faults, FaultList):
+            pass
+        elif faults is None and len(self.fault_list.faults) == 0:
             faults = FaultList(circuit=self.circuit)
             faults.add_all()
 
@@ -135,22 +141,18 @@ class PPSF(FaultSim):
             log_file = open(log_fname, 'w')
             log_file.write(f"#TP={len(tps)}\n")
             
-        # Reset D_counts
-        for f in faults.faults:
-            f.D_count = 0
+        faults.reset_D_counts()
 
-        for idx, fault in enumerate(faults.faults):
-            tot_pass = math.ceil(len(tps)/self.wordlen)
-            for _pass in range(tot_pass):
-                tps_pass = tps[_pass*64:(_pass+1)*64]
-                res = self._one_fault_run(tps_pass, fault)
-                fault.D_count += len(res)
+        self._cone_run(tps, faults)
 
+        n_detected = 0
+        for idx, fault in enumerate(faults.faults):
+            n_detected += 1 if fault.D_count else 0
             if verbose and idx % 50 == 0:
-                print(f"#Faults:{idx:5} \tFC: {100*faults.calc_fc():.4f}%")
+                print(f"#Faults:{idx:5} \tFC: {100*n_detected/len(faults.faults):.4f}%")
             
             if log_file:
-                log_file.write(f"{idx:5} \tFC: {100*faults.calc_fc():.4f}%\n")
+                log_file.write(f"{idx:5} \tFC: {100*n_detected/len(faults.faults):.4f}%\n")
 
         if verbose:
             print("\nPPFS completed")
@@ -176,11 +178,41 @@ class PPSF(FaultSim):
         
         return fault_dict #TODO: return fc and Faults Dict
     
-    def _single_process_runner(self, conn, tp, faults, verbose=False):
-        self.run(tps=tp, faults=faults, verbose=verbose, save_log=False)
-        conn.send(faults)
-
-    def _multiprocess_handler(self, tp, fl_curr, num_proc=1, log_fname=None, count_cont=False, verbose = False):
+    def _cone_run(self, tps, faults, block_tps=config.PPSF_BLOCK_TPS):
+        """ 
+        Simulates the good circuit once for each block of block_tps test patterns, 
+        with all tps of the block packed in Python ints (bit k is tp k of the block). 
+        Then each fault is simulated only in its fanout cone, level by level, and 
+        propagation stops where faulty values are the same as good values 
+        (see EventSim.run_fault). The number of detecting tps is added to fault.D_count. 
+        """
+        cc = self.circuit.compile()
+        sim = EventSim(cc)
+        po_ids = cc.PO.tolist()
+        sites = [(cc.num2id[f.node_num], f.stuck_val == '1') for f in faults.faults]
+        for b0 in range(0, len(tps), block_tps):
+            tps_block = tps[b0:b0+block_tps]
+            mask = (1 << len(tps_block)) - 1
+            sim.run(utils.words_to_ints(utils.pack_tps(tps_block)), mask)
+            good = sim.values
+            for f_idx, (idx, stuck_1) in enumerate(sites):
+                faulty = sim.run_fault(idx, mask if stuck_1 else 0)
+                detected = 0
+                for po in po_ids:
+                    if po in faulty:
+                        detected |= faulty[po] ^ good[po]
+                if detected:
+                    faults.detect(f_idx, b0 + (detected & -detected).bit_length() - 1, 
+                            bin(detected).count('1'))
+
+    def _single_process_runner(self, conn, tp, faults, verbose=False, seed=None, tp_source=None):
+        """ Runs PPSF for faults in a child process, and sends their D_counts """
+        self.run(tps=tp, faults=faults, verbose=verbose, save_log=False, seed=seed, 
+                tp_source=tp_source)
+        conn.send(faults.D_counts[:len(faults.faults)].tolist())
+
+    def _multiprocess_handler(self, tp, fl_curr, num_proc=1, log_fname=None, count_cont=False, verbose = False, seed=None, 
+            tp_source=None):
         """ Run ppsf in parallel for one step with given list or number of test patterns and fault list, \
         counts the number of the times faults in fault list are detected. 
         The tps are generated in each process separately, but are not stored by default.
@@ -197,6 +229,11 @@ class PPSF(FaultSim):
             File name for the final log fil. If None, does not log results (default is None)
         count_cont: int
             #TODO: define this (default is False). Still required?
+        seed : int
+            seed of random tps, each process gets an independent stream of it
+        tp_source : PRPG
+            generator of random tps instead of TPGenerator, 
+            each process applies the next tp patterns of its sequence (see PRPG.spawn)
 
         Returns
         ------
@@ -206,24 +243,25 @@ class PPSF(FaultSim):
         """
         time_s = time.time()
         process_list = []
-        for _ in range(num_proc):
+        seeds = np.random.SeedSequence(seed).spawn(num_proc)
+        sources = [None] * num_proc if tp_source is None else tp_source.spawn(num_proc, tp)
+        for id_proc in range(num_proc):
             parent_conn, child_conn = Pipe()
             fault_copy = FaultList()
             fault_copy.faults = fl_curr.faults.copy()
             p = Process(target=self._single_process_runner,
-                        args=(child_conn, tp, fault_copy, verbose))
+                        args=(child_conn, tp, fault_copy, verbose, seeds[id_proc], sources[id_proc]))
             p.start()
             process_list.append((p, parent_conn))
 
-        fault_lists = []
+        all_D_counts = []
         for p, conn in process_list:
-            faults_with_D_count = conn.recv()
-            fault_lists.append(faults_with_D_count)
+            all_D_counts.append(conn.recv())
             p.join()
 
-        for fl in fault_lists:
-            for idx in range(len(fl_curr.faults)):
-                fl_curr.faults[idx].D_count_list.append(fl.faults[idx].D_count)
+        for D_counts in all_D_counts:
+            for fault, D_count in zip(fl_curr.faults, D_counts):
+                fault.D_count_list.append(D_count)
 
         if log_fname:
             with open(log_fname, "a") as outfile:
@@ -304,9 +342,7 @@ class PPSF(FaultSim):
             
             print(pr)
             
-        fault_idx = {}
-        for idx, fault in enumerate(fl_cont.faults):
-            fault_idx[str(fault)] = idx
+        for fault in fl_cont.faults:
             fault.D_count_list = np.zeros(num_proc)
 
         path = os.path.join(config.FAULT_SIM_DIR, self.circuit.c_name) + '/ppsf/'
@@ -345,7 +381,7 @@ class PPSF(FaultSim):
                 outfile.write(f"#TP={tp}\n")
 
             for fault in fl_curr.faults:
-                fault_cont = fl_cont.faults[fault_idx[str(fault)]]
+                fault_cont = fl_cont.get(fault)
                 fault_cont.D_count_list += np.array(fault.D_count_list)
                 mu = np.mean(fault_cont.D_count_list/tp_tot)
                 std = np.std(fault_cont.D_count_list/tp_tot)
@@ -0,0 +1,101 @@
+import config
+from circuit.compiled_circuit import GTYPE_CODE
+
+# Generated functions, shared by all circuits with the same compiled hash
+_SIM_CACHE = {}
+
+# Operator of each gate type, and if the output is inverted
+GATE_OPS = {GTYPE_CODE['AND']: (' & ', False),
+        GTYPE_CODE['NAND']: (' & ', True),
+        GTYPE_CODE['OR']: (' | ', False),
+        GTYPE_CODE['NOR']: (' | ', True),
+        GTYPE_CODE['XOR']: (' ^ ', False),
+        GTYPE_CODE['XNOR']: (' ^ ', True),
+        GTYPE_CODE['BUFF']: ('', False),
+        GTYPE_CODE['BRCH']: ('', False),
+        GTYPE_CODE['NOT']: ('', True)}
+
+
+class CodegenSim:
+    """ Straight-line logic simulation, generated for a circuit.
+    The levelized circuit is compiled into a Python function where each gate is one
+    assignment on local variables, e.g. n23 = (n10 & n16) ^ MASK.
+    MASK is all ones over the simulated word, i.e. 1 for single pattern simulation
+    and Node.bitwise_not for bitwise simulation, so the same function serves both.
+    Generated functions are cached per circuit hash (CompiledCircuit.hash).
+    """
+
+    def __init__(self, compiled):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        """
+        self.cc = compiled
+        key = compiled.hash()
+        if key not in _SIM_CACHE:
+            _SIM_CACHE[key] = (self._build(inject=False), self._build(inject=True))
+        self.sim, self.sim_inject = _SIM_CACHE[key]
+
+    @staticmethod
+    def is_supported(compiled):
+        """ Large circuits are not compiled, generated code grows with circuit size """
+        return len(compiled) <= config.CODEGEN_MAX_NODES
+
+    def _build(self, inject):
+        """ Generates and compiles the simulation function
+        If inject is True, the function takes F : dict {node id: fault mask} and S :
+        stuck values word, and injects faults after each node, similar to DFTNode.insert_f
+        """
+        cc = self.cc
+        fanin_ptr, fanin = cc.fanin_ptr.tolist(), cc.fanin.tolist()
+        args = "pis, MASK, F, S" if inject else "pis, MASK"
+        lines = [f"def sim({args}):"]
+        if len(cc.PI):
+            lines.append("    " + ", ".join([f"n{idx}" for idx in cc.PI.tolist()]) + ", = pis")
+        pis = set(cc.PI.tolist())
+
+        for idx, code in enumerate(cc.gtype.tolist()):
+            if idx not in pis:
+                fins = [f"n{i}" for i in fanin[fanin_ptr[idx]:fanin_ptr[idx+1]]]
+                if len(fins) == 0:
+                    expr = "0"
+                else:
+                    op, inv = GATE_OPS[code]
+                    expr = op.join(fins) if op else fins[0]
+                    if inv:
+                        expr = f"({expr}) ^ MASK" if len(fins) > 1 else f"{expr} ^ MASK"
+                lines.append(f"    n{idx} = {expr}")
+            if inject:
+                lines.append(f"    if {idx} in F: n{idx} = (n{idx} & ~F[{idx}]) | (F[{idx}] & S)")
+
+        lines.append("    return (" + ", ".join([f"n{idx}" for idx in range(len(cc))]) + ",)")
+        namespace = {}
+        exec(compile("\n".join(lines), f"<codegen_sim {cc.hash()[:8]}>", "exec"), namespace)
+        return namespace["sim"]
+
+    def run(self, pi_vals, mask=1):
+        """ Simulates one word of patterns
+
+        Arguments
+        ---------
+        pi_vals : list of int, in the same order as circuit.PI
+        mask : int, all ones over the simulated word
+
+        Returns
+        -------
+        tuple of the values of all nodes, in the order of circuit.nodes_lev
+        """
+        return self.sim(pi_vals, mask)
+
+    def run_inject(self, pi_vals, mask, fault_masks, stuck_vals):
+        """ Simulates one word with faults injected
+
+        Arguments
+        ---------
+        fault_masks : dict
+            from node id to its fault mask, bits of the word where the node is faulty
+        stuck_vals : int
+            stuck values of the faults, at the bits of the fault masks
+        """
+        return self.sim_inject(pi_vals, mask, fault_masks, stuck_vals)
@@ -0,0 +1,172 @@
+from circuit.compiled_circuit import GTYPE_CODE
+
+AND, NAND = GTYPE_CODE['AND'], GTYPE_CODE['NAND']
+OR, NOR = GTYPE_CODE['OR'], GTYPE_CODE['NOR']
+XOR, XNOR = GTYPE_CODE['XOR'], GTYPE_CODE['XNOR']
+NOT = GTYPE_CODE['NOT']
+INVERTING = {NAND, NOR, XNOR, NOT}
+
+
+class EventSim:
+    """ Event-driven incremental logic simulation over a CompiledCircuit.
+    Node values of the previous pattern are kept, and only the fanout of nodes whose
+    value changed is evaluated, level by level through a levelized event queue.
+    The first run (or a run after reset) evaluates all nodes.
+    Values are ints, either 0/1 or words of bits when mask is all ones over a word.
+
+    Attributes
+    ----------
+    values : list of int
+        value of each node id after the last run, None before the first run
+    changed : list of int
+        node ids whose value changed in the last run
+    n_evals : int
+        number of gates evaluated in the last run
+    total_evals : int
+        number of gates evaluated since the last reset
+    """
+
+    def __init__(self, compiled):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        """
+        self.cc = compiled
+        fanin_ptr, fanin = compiled.fanin_ptr.tolist(), compiled.fanin.tolist()
+        fanout_ptr, fanout = compiled.fanout_ptr.tolist(), compiled.fanout.tolist()
+        self.fanins = [fanin[fanin_ptr[i]:fanin_ptr[i+1]] for i in range(len(compiled))]
+        self.fanouts = [fanout[fanout_ptr[i]:fanout_ptr[i+1]] for i in range(len(compiled))]
+        self.codes = compiled.gtype.tolist()
+        self.levs = compiled.lev.tolist()
+        self.PI = compiled.PI.tolist()
+        self.PO = compiled.PO.tolist()
+        self.reset()
+
+    def reset(self):
+        """ Forgets previous values, the next run evaluates all nodes """
+        self.values = None
+        self.mask = None
+        self.changed = []
+        self.n_evals = 0
+        self.total_evals = 0
+
+    def _eval(self, idx, mask):
+        """ Returns the value of node idx from the current values of its fanin """
+        values = self.values
+        fins = self.fanins[idx]
+        if len(fins) == 0:
+            return 0
+        code = self.codes[idx]
+        val = values[fins[0]]
+        if code == AND or code == NAND:
+            for i in fins[1:]:
+                val &= values[i]
+        elif code == OR or code == NOR:
+            for i in fins[1:]:
+                val |= values[i]
+        elif code == XOR or code == XNOR:
+            for i in fins[1:]:
+                val ^= values[i]
+        return val ^ mask if code in INVERTING else val
+
+    def _run_all(self, pi_vals, mask):
+        self.values = [0] * len(self.cc)
+        for idx, val in zip(self.PI, pi_vals):
+            self.values[idx] = val
+        pis = set(self.PI)
+        gates = [idx for idx in range(len(self.cc)) if idx not in pis]
+        for idx in gates:
+            self.values[idx] = self._eval(idx, mask)
+        self.changed = list(range(len(self.cc)))
+        self.n_evals = len(gates)
+
+    def run(self, pi_vals, mask=1):
+        """ Simulates a pattern, starting from the values of the previous pattern
+
+        Arguments
+        ---------
+        pi_vals : list of int, in the same order as circuit.PI
+        mask : int, all ones over the simulated word
+
+        Returns
+        -------
+        list of PO values
+        """
+        if len(pi_vals) != len(self.PI):
+            raise ValueError(f"Expected {len(self.PI)} PI values, got {len(pi_vals)}")
+
+        if self.values is None or mask != self.mask:
+            self.mask = mask
+            self._run_all(pi_vals, mask)
+        else:
+            self._run_events(pi_vals, mask)
+        self.total_evals += self.n_evals
+        return [self.values[idx] for idx in self.PO]
+
+    def _run_events(self, pi_vals, mask):
+        values = self.values
+        sources = []
+        for idx, val in zip(self.PI, pi_vals):
+            if values[idx] != val:
+                values[idx] = val
+                sources.append(idx)
+        self.changed, self.n_evals = self._propagate(sources, mask)
+
+    def _propagate(self, sources, mask, saved=None):
+        """ Evaluates the fanout of source nodes, whose values are already changed,
+        in level order. Returns the list of changed node ids, and count of evaluations 
+        If saved (dict) is given, previous values of changed nodes are stored in it. """
+        values = self.values
+        queue = [[] for _ in range(self.cc.n_levels)]
+        scheduled = set()
+        changed = list(sources)
+
+        def schedule(idx):
+            for out in self.fanouts[idx]:
+                if out not in scheduled:
+                    scheduled.add(out)
+                    queue[self.levs[out]].append(out)
+
+        for idx in sources:
+            schedule(idx)
+
+        n_evals = 0
+        for level in queue:
+            for idx in level:
+                n_evals += 1
+                val = self._eval(idx, mask)
+                if val != values[idx]:
+                    if saved is not None:
+                        saved[idx] = values[idx]
+                    values[idx] = val
+                    changed.append(idx)
+                    schedule(idx)
+        return changed, n_evals
+
+    def run_fault(self, idx, stuck_val):
+        """ Propagates a stuck-at fault over the values of the last run, which are kept
+        unchanged. Only the fanout cone of the fault site is evaluated.
+
+        Arguments
+        ---------
+        idx : int
+            node id of the fault site
+        stuck_val : int
+            0 or mask, for stuck-at-0 and stuck-at-1
+
+        Returns
+        -------
+        dict from node id to its faulty value, for nodes where it differs from the good value
+        """
+        values = self.values
+        if values[idx] == stuck_val:
+            return {}
+        saved = {idx: values[idx]}
+        values[idx] = stuck_val
+        changed, n_evals = self._propagate([idx], self.mask, saved)
+        self.total_evals += n_evals
+        faulty = {i: values[i] for i in changed}
+        for i, val in saved.items():
+            values[i] = val
+        return faulty
@@ -0,0 +1,106 @@
+import config
+from logic_simulation.event_sim import EventSim
+
+
+class ExhaustiveSim:
+    """ Exhaustive logic simulation of all 2^n input patterns, without building them.
+    The first k = word_pis PIs are enumerated inside a word of 2^k bits (bit p of the
+    word of PI j is bit j of p), and the remaining high PIs are walked in Gray-code
+    order, so that each step flips a single PI word and only its fanout is evaluated
+    again (see EventSim).
+    Pattern m assigns bit i of m to circuit.PI[i]; bit p of the word yielded for high
+    value h belongs to pattern (h << k) | p.
+    """
+
+    def __init__(self, compiled, word_pis=None):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        word_pis : int
+            number of PIs enumerated inside a word, default is config.EXHAUSTIVE_WORD_PIS
+        """
+        self.cc = compiled
+        word_pis = config.EXHAUSTIVE_WORD_PIS if word_pis is None else word_pis
+        self.word_pis = min(len(compiled.PI), word_pis)
+        self.word_bits = 1 << self.word_pis
+        self.mask = (1 << self.word_bits) - 1
+        self.event = EventSim(compiled)
+        self.PO = compiled.PO.tolist()
+
+    def _pi_word(self, j):
+        """ Word of PI j < word_pis: blocks of 2^j zeros and 2^j ones """
+        width = 1 << (j+1)
+        word = ((1 << (1 << j)) - 1) << (1 << j)
+        while width < self.word_bits:
+            word |= word << width
+            width *= 2
+        return word
+
+    def __len__(self):
+        """ Number of words, i.e. steps of the Gray-code walk """
+        return 1 << (len(self.cc.PI) - self.word_pis)
+
+    def iter_words(self):
+        """ Walks the input space in Gray-code order of the high PIs.
+        Values of all nodes are available in self.event.values during each step.
+
+        Yields
+        ------
+        (high, po_words) : value of the high PIs and list of PO words
+        """
+        k = self.word_pis
+        pi_vals = [self._pi_word(j) for j in range(k)] + [0] * (len(self.cc.PI) - k)
+        self.event.reset()
+        high = 0
+        yield high, self.event.run(pi_vals, self.mask)
+        for step in range(1, len(self)):
+            j = (step & -step).bit_length() - 1
+            high ^= 1 << j
+            pi_vals[k+j] ^= self.mask
+            yield high, self.event.run(pi_vals, self.mask)
+
+    def truth_tables(self):
+        """ Returns the truth table of each PO as an int, bit m is the PO value for pattern m """
+        parts = [[None] * len(self) for _ in self.PO]
+        for high, po_words in self.iter_words():
+            for i, word in enumerate(po_words):
+                parts[i][high] = word
+
+        if self.word_bits % 8:
+            return [sum(word << (high * self.word_bits) for high, word in enumerate(words)) 
+                    for words in parts]
+        n_bytes = self.word_bits // 8
+        return [int.from_bytes(b''.join([word.to_bytes(n_bytes, 'little') for word in words]),
+            'little') for words in parts]
+
+    def iter_detections(self, faults):
+        """ Simulates the faults for all patterns, each fault only in its fanout cone
+
+        Arguments
+        ---------
+        faults : list of (node id, stuck value 0/1)
+
+        Yields
+        ------
+        (high, det_words) : value of the high PIs and, for each fault, the word of
+            patterns that detect it
+        """
+        for high, po_words in self.iter_words():
+            det_words = []
+            for idx, stuck_val in faults:
+                faulty = self.event.run_fault(idx, stuck_val * self.mask)
+                det = 0
+                for po_idx, word in zip(self.PO, po_words):
+                    if po_idx in faulty:
+                        det |= faulty[po_idx] ^ word
+                det_words.append(det)
+            yield high, det_words
+
+    def detection_counts(self, faults):
+        """ Returns the number of patterns that detect each fault, see iter_detections """
+        counts = [0] * len(faults)
+        for _, det_words in self.iter_detections(faults):
+            for i, det in enumerate(det_words):
+                counts[i] += bin(det).count('1')
+        return counts
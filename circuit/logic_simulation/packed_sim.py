@@ -0,0 +1,113 @@
+import numpy as np
+
+import config
+from circuit.compiled_circuit import GTYPE_CODE
+
+# Gates evaluated by reducing their fanin words, and if the result is inverted
+REDUCE_OPS = {GTYPE_CODE['AND']: (np.bitwise_and, False),
+        GTYPE_CODE['NAND']: (np.bitwise_and, True),
+        GTYPE_CODE['OR']: (np.bitwise_or, False),
+        GTYPE_CODE['NOR']: (np.bitwise_or, True),
+        GTYPE_CODE['XOR']: (np.bitwise_xor, False),
+        GTYPE_CODE['XNOR']: (np.bitwise_xor, True)}
+
+# Single input gates, and if the output is inverted
+SINGLE_OPS = {GTYPE_CODE['BUFF']: False,
+        GTYPE_CODE['BRCH']: False,
+        GTYPE_CODE['NOT']: True}
+
+
+class PackedSim:
+    """ Pattern-parallel logic simulation over a CompiledCircuit with NumPy.
+    Patterns are bit-packed in uint64 words: bit k of word w of a node is its value
+    for pattern 64*w+k (see utils.pack_tps). Gates are evaluated level by level,
+    all gates of the same type in a level at once with NumPy bitwise operations.
+    Word columns are simulated in chunks, so that the node values of one chunk
+    fit in config.PACKED_SIM_MEM bytes.
+    """
+
+    def __init__(self, compiled):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        """
+        self.cc = compiled
+        self.plan = self._make_plan()
+
+    def _make_plan(self):
+        """ Groups the gates of each level by gate type.
+
+        Returns
+        -------
+        list of (gtype code, output node ids, gathered fanin ids, reduceat offsets)
+        """
+        cc = self.cc
+        plan = []
+        for lev in range(1, cc.n_levels):
+            ids = np.arange(cc.lev_ptr[lev], cc.lev_ptr[lev+1])
+            codes = cc.gtype[ids]
+            for code in np.unique(codes):
+                out_ids = ids[codes == code]
+                starts = cc.fanin_ptr[out_ids]
+                sizes = cc.fanin_ptr[out_ids+1] - starts
+                # position of each gathered fanin in the CSR fanin array
+                offsets = np.zeros(len(out_ids), dtype=np.int64)
+                offsets[1:] = np.cumsum(sizes)[:-1]
+                gather = np.repeat(starts - offsets, sizes) + np.arange(sizes.sum())
+                plan.append((int(code), out_ids, cc.fanin[gather], offsets))
+        return plan
+
+    def chunk_words(self):
+        """ Number of words simulated at once """
+        return max(1, config.PACKED_SIM_MEM // (8 * max(1, len(self.cc))))
+
+    def run(self, pi_words, all_nodes=False):
+        """ Simulates the packed patterns
+
+        Arguments
+        ---------
+        pi_words : np.ndarray (uint64)
+            shape is (n_PI, n_words), in the same order as circuit.PI
+        all_nodes : bool
+            if True, values of all nodes are returned, otherwise only POs
+
+        Returns
+        -------
+        np.ndarray (uint64) of shape (n_PO, n_words), or (n_nodes, n_words) if all_nodes
+        """
+        pi_words = np.asarray(pi_words, dtype=np.uint64)
+        if pi_words.ndim == 1:
+            pi_words = pi_words.reshape(-1, 1)
+        if pi_words.shape[0] != len(self.cc.PI):
+            raise ValueError(f"Expected {len(self.cc.PI)} PI rows, got {pi_words.shape[0]}")
+
+        n_words = pi_words.shape[1]
+        chunk = self.chunk_words()
+        if all_nodes or n_words <= chunk:
+            if all_nodes and n_words > chunk:
+                print(f"Warning: values of all nodes are kept for {n_words} words")
+            vals = self._run_chunk(pi_words)
+            return vals if all_nodes else vals[self.cc.PO]
+
+        po_words = np.empty((len(self.cc.PO), n_words), dtype=np.uint64)
+        for w in range(0, n_words, chunk):
+            vals = self._run_chunk(pi_words[:, w:w+chunk])
+            po_words[:, w:w+chunk] = vals[self.cc.PO]
+        return po_words
+
+    def _run_chunk(self, pi_words):
+        vals = np.zeros((len(self.cc), pi_words.shape[1]), dtype=np.uint64)
+        vals[self.cc.PI] = pi_words
+        for code, out_ids, fanin, offsets in self.plan:
+            if code in SINGLE_OPS:
+                res = vals[fanin]
+                if SINGLE_OPS[code]:
+                    np.invert(res, out=res)
+            else:
+                op, inv = REDUCE_OPS[code]
+                res = op.reduceat(vals[fanin], offsets, axis=0)
+                if inv:
+                    np.invert(res, out=res)
+            vals[out_ids] = res
+        return vals
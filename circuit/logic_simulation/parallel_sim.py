@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from logic_simulation.packed_sim import PackedSim
+
+
+class ParallelSim:
+    """ Multi-process pattern-parallel logic simulation over a CompiledCircuit.
+    Packed patterns (see utils.pack_tps) are split into shards of words, and each shard
+    is simulated by a forked worker with PackedSim. Workers inherit the compiled
+    circuit and the simulation plan from the parent, so nothing is pickled: patterns
+    and PO responses are exchanged through shared memory, in the original order.
+    """
+
+    def __init__(self, compiled):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        """
+        self.cc = compiled
+        self.packed = PackedSim(compiled)
+        self._pi_words = self._po_words = None
+
+    def run(self, pi_words, num_proc=None):
+        """ Simulates the packed patterns on num_proc processes
+
+        Arguments
+        ---------
+        pi_words : np.ndarray (uint64)
+            shape is (n_PI, n_words), in the same order as circuit.PI
+        num_proc : int
+            number of processes, default is the number of CPUs
+
+        Returns
+        -------
+        np.ndarray (uint64) of shape (n_PO, n_words)
+        """
+        pi_words = np.asarray(pi_words, dtype=np.uint64)
+        if pi_words.ndim == 1:
+            pi_words = pi_words.reshape(-1, 1)
+        n_words = pi_words.shape[1]
+        num_proc = min(num_proc or os.cpu_count() or 1, n_words)
+        if num_proc <= 1:
+            return self.packed.run(pi_words)
+
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except ValueError:
+            print("Warning: fork is not available, patterns are simulated in one process")
+            return self.packed.run(pi_words)
+
+        bounds = np.linspace(0, n_words, num_proc+1).astype(int).tolist()
+        shm_in = shared_memory.SharedMemory(create=True, size=max(1, pi_words.nbytes))
+        shm_out = shared_memory.SharedMemory(create=True,
+                size=max(1, 8 * len(self.cc.PO) * n_words))
+        try:
+            # buffers are mapped before fork, hence shared with the workers
+            self._pi_words = np.ndarray(pi_words.shape, dtype=np.uint64, buffer=shm_in.buf)
+            self._po_words = np.ndarray((len(self.cc.PO), n_words), dtype=np.uint64,
+                    buffer=shm_out.buf)
+            self._pi_words[:] = pi_words
+
+            procs = []
+            for w0, w1 in zip(bounds[:-1], bounds[1:]):
+                p = ctx.Process(target=self._worker, args=(w0, w1))
+                p.start()
+                procs.append(p)
+            for p in procs:
+                p.join()
+            failed = [p.exitcode for p in procs if p.exitcode != 0]
+            if failed:
+                raise RuntimeError(f"{len(failed)} simulation worker(s) failed, " +
+                        f"exit codes: {failed}")
+            po_words = self._po_words.copy()
+        finally:
+            self._pi_words = self._po_words = None
+            for shm in [shm_in, shm_out]:
+                shm.close()
+                shm.unlink()
+        return po_words
+
+    def _worker(self, w0, w1):
+        """ Simulates words w0 to w1-1, runs in a forked process """
+        self._po_words[:, w0:w1] = self.packed.run(self._pi_words[:, w0:w1])
@@ -0,0 +1,79 @@
+import numpy as np
+
+from logic_simulation.packed_sim import PackedSim
+
+
+class SeqSim:
+    """ Cycle-based bit-parallel simulation of a sequential circuit.
+    Flip-flops are cut by the loader (full-scan): the Q of each flip-flop is a pseudo-PI
+    and its D is a pseudo-PO (see CompiledCircuit.DFF). In each cycle, the combinational
+    logic is simulated with PackedSim for the PIs and the current state, and the values
+    of D nodes become the next state. Bit k of each word belongs to sequence k, so
+    64 independent sequences are simulated per word.
+    """
+
+    def __init__(self, compiled):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        """
+        self.cc = compiled
+        self.packed = PackedSim(compiled)
+
+        PI, PO = compiled.PI.tolist(), compiled.PO.tolist()
+        pi_pos = {idx: pos for pos, idx in enumerate(PI)}
+        self.ppi_pos = [pi_pos[q] for q in compiled.DFF[:, 0].tolist()]
+        self.pi_pos = sorted(set(range(len(PI))) - set(self.ppi_pos))
+
+        # a D node may be a PO too, its last position is the pseudo-PO
+        po_pos = {}
+        for pos, idx in enumerate(PO):
+            po_pos.setdefault(idx, []).append(pos)
+        self.ppo_pos = [po_pos[d].pop() for d in compiled.DFF[:, 1].tolist()]
+        self.po_pos = sorted(set(range(len(PO))) - set(self.ppo_pos))
+
+    @property
+    def n_PI(self):
+        """ Number of primary inputs, without pseudo-PIs """
+        return len(self.pi_pos)
+
+    @property
+    def n_PO(self):
+        """ Number of primary outputs, without pseudo-POs """
+        return len(self.po_pos)
+
+    def run(self, pi_seq, state=None):
+        """ Simulates the sequences cycle by cycle
+
+        Arguments
+        ---------
+        pi_seq : np.ndarray (uint64)
+            shape is (n_cycles, n_PI, n_words), packed PI values of each cycle,
+            in the order of circuit.PI without pseudo-PIs
+        state : np.ndarray (uint64)
+            shape is (n_DFF, n_words), initial state, default is all zero
+
+        Returns
+        -------
+        (po_seq, state) : PO words of each cycle, shape is (n_cycles, n_PO, n_words),
+            without pseudo-POs, and the final state
+        """
+        pi_seq = np.asarray(pi_seq, dtype=np.uint64)
+        if pi_seq.ndim == 2:
+            pi_seq = pi_seq.reshape(pi_seq.shape[0], pi_seq.shape[1], 1)
+        n_cycles, n_pi, n_words = pi_seq.shape
+        if n_pi != self.n_PI:
+            raise ValueError(f"Expected {self.n_PI} PI rows, got {n_pi}")
+        if state is None:
+            state = np.zeros((len(self.cc.DFF), n_words), dtype=np.uint64)
+
+        pi_words = np.empty((len(self.cc.PI), n_words), dtype=np.uint64)
+        po_seq = np.empty((n_cycles, self.n_PO, n_words), dtype=np.uint64)
+        for cycle in range(n_cycles):
+            pi_words[self.pi_pos] = pi_seq[cycle]
+            pi_words[self.ppi_pos] = state
+            po_words = self.packed.run(pi_words)
+            po_seq[cycle] = po_words[self.po_pos]
+            state = po_words[self.ppo_pos]
+        return po_seq, state
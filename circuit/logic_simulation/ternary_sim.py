@@ -0,0 +1,82 @@
+from circuit.compiled_circuit import GTYPE_CODE
+
+AND, NAND = GTYPE_CODE['AND'], GTYPE_CODE['NAND']
+OR, NOR = GTYPE_CODE['OR'], GTYPE_CODE['NOR']
+XOR, XNOR = GTYPE_CODE['XOR'], GTYPE_CODE['XNOR']
+INVERTING = {NAND, NOR, XNOR, GTYPE_CODE['NOT']}
+
+
+class TernarySim:
+    """ Word-parallel three-valued (0/1/X) logic simulation with two-rail encoding.
+    Each node has two bit-planes, r1 ("can be 1") and r0 ("can be 0"), and bit k of
+    each plane belongs to pattern k:
+        0 --> (r1, r0) = (0, 1)
+        1 --> (r1, r0) = (1, 0)
+        X --> (r1, r0) = (1, 1)
+    Gates only use &, | and swapping of the rails, so plane values can be Python ints
+    (any number of patterns per pass) or NumPy uint64 arrays (see utils.pack_tps_t).
+    """
+
+    def __init__(self, compiled):
+        """
+        Arguments
+        ---------
+        compiled : CompiledCircuit
+        """
+        self.cc = compiled
+        fanin_ptr, fanin = compiled.fanin_ptr.tolist(), compiled.fanin.tolist()
+        self.fanins = [fanin[fanin_ptr[i]:fanin_ptr[i+1]] for i in range(len(compiled))]
+        self.codes = compiled.gtype.tolist()
+        self.PI = compiled.PI.tolist()
+        self.PO = compiled.PO.tolist()
+
+    def run(self, pi_r1, pi_r0, all_nodes=False):
+        """ Simulates the two-rail encoded patterns
+
+        Arguments
+        ---------
+        pi_r1, pi_r0 : list of int or np.ndarray
+            "can be 1" and "can be 0" planes of PIs, in the same order as circuit.PI
+        all_nodes : bool
+            if True, planes of all nodes are returned, in the order of circuit.nodes_lev
+
+        Returns
+        -------
+        (r1, r0) : lists of PO planes, or of all nodes if all_nodes
+        """
+        if len(pi_r1) != len(self.PI) or len(pi_r0) != len(self.PI):
+            raise ValueError(f"Expected {len(self.PI)} PI values for each rail")
+
+        r1 = [0] * len(self.cc)
+        r0 = [0] * len(self.cc)
+        for idx, v1, v0 in zip(self.PI, pi_r1, pi_r0):
+            r1[idx], r0[idx] = v1, v0
+        # each pattern has at least one rail set, hence all ones over the patterns
+        ones = pi_r1[0] | pi_r0[0] if len(self.PI) else 0
+
+        pis = set(self.PI)
+        for idx, code in enumerate(self.codes):
+            if idx in pis:
+                continue
+            fins = self.fanins[idx]
+            if len(fins) == 0:
+                r1[idx], r0[idx] = ones & 0, ones
+                continue
+            a1, a0 = r1[fins[0]], r0[fins[0]]
+            if code == AND or code == NAND:
+                for i in fins[1:]:
+                    a1, a0 = a1 & r1[i], a0 | r0[i]
+            elif code == OR or code == NOR:
+                for i in fins[1:]:
+                    a1, a0 = a1 | r1[i], a0 & r0[i]
+            elif code == XOR or code == XNOR:
+                for i in fins[1:]:
+                    b1, b0 = r1[i], r0[i]
+                    a1, a0 = (a1 & b0) | (a0 & b1), (a1 & b1) | (a0 & b0)
+            if code in INVERTING:
+                a1, a0 = a0, a1
+            r1[idx], r0[idx] = a1, a0
+
+        if all_nodes:
+            return r1, r0
+        return [r1[idx] for idx in self.PO], [r0[idx] for idx in self.PO]
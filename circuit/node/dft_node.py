@@ -5,8 +5,23 @@ sys.path.insert(0,'..')
 import utils
 import node.node as node
 
+# Slots of DFTNode fields, declared in each DFT node class 
+# since DFTNode is a mixin and cannot have a non-empty layout itself
+DFT_SLOTS = ('pfs_V', 'pfs_I', 'CC0', 'CC1', 'CO', 'one_count', 'zero_count', 'sen_count', 
+        'sense', 'S', 'C1', 'C0', 'B1', 'B0')
+
 class DFTNode(ABC):
     """For now, it is designed for STAFAN, SCOAP, PFS and PPSF"""
+    __slots__ = ()
+
+    # Rarely used analysis fields, kept in the side table of the node 
+    D0 = node.SideField()       # prob
+    D1 = node.SideField()       # prob
+    Entropy = node.SideField()
+    HTO = node.SideField()
+    # Test Point Insertion Measurements
+    stat = node.SideField(default_factory=dict)
+
     def __init__(self):
         
         # PFS:
@@ -36,11 +51,6 @@ class DFTNode(ABC):
         self.C0 = None          # prob
         self.B1 = None          # prob
         self.B0 = None          # prob
-        self.D0 = None          # prob
-        self.D1 = None          # prob
-
-        # Test Point Insertion Measurements
-        self.stat = {}
         
     def insert_f(self, bitwise_not, pfs_S):
         """ insert a fault for pdf in this node """ 
@@ -91,6 +101,8 @@ class DFTNode(ABC):
 
 class DFTBUFF(node.BUFF, DFTNode):
     """ This gate is yet not tested""" 
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.BUFF.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -111,6 +123,8 @@ class DFTBUFF(node.BUFF, DFTNode):
 
 class DFTNOT(node.NOT, DFTNode):
     """ This gate is yet not tested""" 
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.NOT.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -130,6 +144,8 @@ class DFTNOT(node.NOT, DFTNode):
         self.unodes[0].B0 = self.B1
 
 class DFTOR(node.OR, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.OR.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -176,6 +192,8 @@ class DFTOR(node.OR, DFTNode):
                 print(f" ==> node.B0 ~ {unode.B0:.2e}")
 
 class DFTNOR(node.NOR, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.NOR.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -223,6 +241,8 @@ class DFTNOR(node.NOR, DFTNode):
                 print(f" ==> B0 ~ {unode.B0:.2e}")
 
 class DFTAND(node.AND, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.AND.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -268,6 +288,8 @@ class DFTAND(node.AND, DFTNode):
                 print(f" ==> node.B0 ~ {unode.B0:.2e}")
 
 class DFTNAND(node.NAND, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.NAND.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -322,6 +344,8 @@ class DFTNAND(node.NAND, DFTNode):
                 print(f" ==> node.B0 ~ {unode.B0:.2e}")
 
 class DFTXOR(node.XOR, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.XOR.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -354,6 +378,8 @@ class DFTXOR(node.XOR, DFTNode):
             unode.B0 = self.B1
 
 class DFTXNOR(node.XNOR, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.XNOR.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -387,6 +413,8 @@ class DFTXNOR(node.XNOR, DFTNode):
             unode.B0 = self.B1
 
 class DFTIPT(node.IPT, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.IPT.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
@@ -405,6 +433,8 @@ class DFTIPT(node.IPT, DFTNode):
         return 
 
 class DFTBRCH(node.BRCH, DFTNode):
+    __slots__ = DFT_SLOTS
+
     def __init__(self, n_type, g_type, num):
         node.BRCH.__init__(self, n_type, g_type, num)
         DFTNode.__init__(self)
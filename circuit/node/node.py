@@ -25,9 +25,40 @@ class ntype(Enum):
     FB = 2
     PO = 3
 
+class SideField:
+    """ Descriptor for rarely used node attributes, e.g. SSTA or TPI analysis fields. 
+    Their values are kept in a side table (node._side), which is allocated only when 
+    one of these fields is set, so that nodes do not need a __dict__. 
+    """
+    def __init__(self, default=None, default_factory=None):
+        self.default = default
+        self.default_factory = default_factory
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        side = obj._side
+        if side is not None and self.name in side:
+            return side[self.name]
+        if self.default_factory is None:
+            return self.default
+        # mutable defaults, e.g. dict, are created per node at first access 
+        value = self.default_factory()
+        self.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        if obj._side is None:
+            obj._side = {}
+        obj._side[self.name] = value
+
 class Node(ABC):
     """ Representing the abstract of a circuit node, i.e. also representing its unique upnode gate.
         Difference of node type and gate type important, refer to ckt documentation.
+        Nodes use __slots__, attributes that are not in slots should be declared as SideField.
 
     Attributes
     ----------
@@ -48,28 +79,31 @@ class Node(ABC):
     dnodes : list 
         list of lower hand node objects
     """
+    __slots__ = ('gtype', 'ntype', 'num', 'lev', 'value', 'unodes', 'dnodes', 
+            'flagA', 'flagB', '_side')
 
     bitlen = int(math.log2(sys.maxsize))+1 # move to utils
     bitwise_not = 2**bitlen-1
 
+    cval = None     #TODO: controlling value, set to 15 by mistake 
+    inv = None      #TODO: inverting value, set to 15 by mistake
+
+    # # SSTA Project
+    dd_cell = SideField()
+    dd_node = SideField()
+    cell_name = SideField()
+
     def __init__(self, n_type, g_type, num):
-        self.bitwise_not = Node.bitwise_not
-        self.bitlen = Node.bitlen
         self.gtype = g_type
         self.ntype = n_type
         self.num = num
         self.lev = None 
         self.value = None
-        self.cval = None    #TODO: controlling value, set to 15 by mistake 
-        self.inv = None     #TODO: inverting value, set to 15 by mistake
         self.unodes = []
         self.dnodes = []
         self.flagA = None   # Very professional 
         self.flagB = None   # Very professional 
-
-        # # SSTA Project
-        self.dd_cell = None
-        self.dd_node = None
+        self._side = None
 
     def __str__(self):
         res = ", ".join([str(self.num), self.ntype, self.gtype, str(self.lev)]) 
@@ -161,6 +195,8 @@ class Node(ABC):
     
 class BUFF(Node):
     """ This gate is yet not tested""" 
+    __slots__ = ()
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
 
@@ -175,6 +211,8 @@ class BUFF(Node):
     
 class NOT(Node):
     """ This gate is yet not tested""" 
+    __slots__ = ()
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
 
@@ -191,10 +229,12 @@ class NOT(Node):
                 self.value = X_VALUE
 
 class OR(Node):
+    __slots__ = ()
+    cval = 15
+    inv = 0
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
-        self.cval = 15
-        self.inv = 0
 
     def imply(self):
         self.value = 1 if (1 in self.unodes_val()) else 0
@@ -213,10 +253,12 @@ class OR(Node):
             self.value = 0
 
 class NOR(Node):
+    __slots__ = ()
+    cval = 15
+    inv = 15
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
-        self.cval = 15
-        self.inv = 15
 
     def imply(self):
         self.value = 0 if (1 in self.unodes_val()) else 1
@@ -236,10 +278,12 @@ class NOR(Node):
             self.value = 1
         
 class AND(Node):
+    __slots__ = ()
+    cval = 0
+    inv = 0
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
-        self.cval = 0
-        self.inv = 0
 
     def imply(self):
         self.value = 0 if (0 in self.unodes_val()) else 1
@@ -260,10 +304,12 @@ class AND(Node):
             self.value = 1
 
 class NAND(Node):
+    __slots__ = ()
+    cval = 0
+    inv = 15
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
-        self.cval = 0
-        self.inv = 15
     
     def imply(self):
         self.value = 1 if (0 in self.unodes_val()) else 0
@@ -285,9 +331,11 @@ class NAND(Node):
             self.value = 0
 
 class XOR(Node):
+    __slots__ = ()
+    c_flag = 0
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
-        self.c_flag = 0 
 
     def imply(self):
         try:
@@ -307,9 +355,11 @@ class XOR(Node):
             self.value = sum(self.unodes_val())%2
 
 class XNOR(Node):
+    __slots__ = ()
+    c_flag = 0
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
-        self.c_flag = 0 
 
     def imply(self):
         self.value = (sum(self.unodes_val())+1)%2
@@ -327,6 +377,8 @@ class XNOR(Node):
             self.value = (sum(self.unodes_val())+1) %2
 
 class IPT(Node):
+    __slots__ = ()
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
     
@@ -340,6 +392,8 @@ class IPT(Node):
         self.value = value
 
 class BRCH(Node):
+    __slots__ = ()
+
     def __init__(self, n_type, g_type, num):
         Node.__init__(self, n_type, g_type, num)
     
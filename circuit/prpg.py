@@ -0,0 +1,192 @@
+import copy
+
+import numpy as np
+
+import config
+import utils
+
+
+def gf2_matmul(a, b):
+    """ Product of two 0/1 matrices (np.uint8) over GF(2) """
+    prod = np.matmul(a.astype(np.float32), b.astype(np.float32))
+    return (prod.astype(np.int64) & 1).astype(np.uint8)
+
+def gf2_matpow(a, exp):
+    """ a to the power of exp over GF(2), by repeated squaring """
+    res = np.eye(len(a), dtype=np.uint8)
+    while exp:
+        if exp & 1:
+            res = gf2_matmul(res, a)
+        a = gf2_matmul(a, a)
+        exp >>= 1
+    return res
+
+
+class PRPG:
+    """ LFSR-based Pseudo-Random Pattern Generator, as used in LBIST.
+    The LFSR has one stage per degree of its polynomial and is clocked once per pattern.
+    Each PI is driven by a phase shifter output, the XOR of a few LFSR stages,
+    so adjacent PIs do not see shifted copies of the same sequence.
+
+    The state after t clocks is A^t * seed over GF(2), where A is the companion matrix
+    of the polynomial. Patterns are generated directly as packed words (see utils.pack_tps):
+    the 64 bits of stage 0 in a word are a fixed linear function of the state at the start
+    of the word, and the LFSR jumps 64 clocks at once from word to word with A^64.
+    Stage j is stage 0 delayed by j clocks, so the word of each phase shifter output is
+    the XOR of shifted copies of the stage 0 words.
+    It can be used in place of TPGenerator as a source of random patterns.
+    """
+
+    def __init__(self, circuit, poly=None, seed=1, phase_shifter=config.PRPG_PS_TAPS,
+            ps_seed=0):
+        """
+        Arguments
+        ---------
+        circuit : Circuit
+        poly : list of int, or int
+            exponents of the terms of the feedback polynomial, e.g. [32, 22, 2, 1, 0]
+            for x^32+x^22+x^2+x+1. If int, it is the degree of a polynomial in
+            config.PRPG_POLYS. Default is degree config.PRPG_DEGREE.
+        seed : int
+            initial state of the LFSR, bit i is stage i, should not be zero
+        phase_shifter : None, int, or list of lists of int
+            None: PI i is driven by stage i mod degree
+            int: each PI is driven by the XOR of this many stages, randomly chosen with ps_seed
+            list: stages XORed for each PI, in the same order as circuit.PI
+        ps_seed : int
+            seed of the random phase shifter
+        """
+        self.circuit = circuit
+        if poly is None:
+            poly = config.PRPG_DEGREE
+        if isinstance(poly, int):
+            if poly not in config.PRPG_POLYS:
+                raise ValueError(f"No polynomial of degree {poly} in config.PRPG_POLYS")
+            poly = config.PRPG_POLYS[poly]
+        self.poly = sorted(set(poly), reverse=True)
+        n = self.poly[0]
+        if self.poly[-1] != 0 or n < 2:
+            raise ValueError(f"Polynomial {poly} should have a constant term and degree > 1")
+        if not (0 < seed < 1<<n):
+            raise ValueError(f"Seed of a degree {n} LFSR should be in [1, 2^{n})")
+        self.seed = seed
+
+        # companion matrix, stage i shifts to stage i-1 and the feedback enters stage n-1
+        self.A = np.zeros((n, n), dtype=np.uint8)
+        self.A[np.arange(n-1), np.arange(1, n)] = 1
+        self.A[n-1, self.poly[1:]] = 1
+        self.A64 = gf2_matpow(self.A, 64)
+
+        self.P = self._phase_shifter(phase_shifter, ps_seed)
+
+        # row k gives stage 0 at the k-th clock of a word, from the state at its start
+        G0 = np.empty((64, n), dtype=np.uint8)
+        row = np.eye(n, dtype=np.uint8)[:1]
+        for k in range(64):
+            G0[k] = row
+            row = gf2_matmul(row, self.A)
+        self.G0 = G0
+        self.reset()
+
+    @property
+    def degree(self):
+        return self.poly[0]
+
+    def _phase_shifter(self, phase_shifter, ps_seed):
+        n, n_pi = self.degree, len(self.circuit.PI)
+        P = np.zeros((n_pi, n), dtype=np.uint8)
+        if phase_shifter is None:
+            P[np.arange(n_pi), np.arange(n_pi) % n] = 1
+        elif isinstance(phase_shifter, int):
+            rng = np.random.default_rng(ps_seed)
+            n_taps = min(phase_shifter, n)
+            for i in range(n_pi):
+                P[i, rng.choice(n, size=n_taps, replace=False)] = 1
+        else:
+            if len(phase_shifter) != n_pi:
+                raise ValueError(f"Phase shifter should have {n_pi} outputs")
+            for i, stages in enumerate(phase_shifter):
+                for stage in stages:
+                    P[i, stage] ^= 1
+        return P
+
+    def reset(self):
+        """ Loads the seed into the LFSR """
+        self.state = np.array([(self.seed >> i) & 1 for i in range(self.degree)],
+                dtype=np.uint8)
+
+    def jump(self, tp_count):
+        """ Advances the LFSR by tp_count clocks, without generating the patterns """
+        self.state = gf2_matmul(gf2_matpow(self.A, int(tp_count)), self.state)
+
+    def spawn(self, n, tp_count):
+        """ Returns n copies of the PRPG, copy i starts i*tp_count clocks after the
+        current state, so that n workers of tp_count patterns apply consecutive
+        segments of the same sequence. The state of this PRPG is not changed """
+        prpgs = []
+        for _ in range(n):
+            prpgs.append(copy.copy(self))
+            self.jump(tp_count)
+        self.state = prpgs[0].state
+        return prpgs
+
+    def _word_states(self, n_words):
+        """ States at the start of the next n_words words, shape is (degree, n_words).
+        Jumps of 64, 128, 256, ... clocks double the computed states each step. """
+        S = np.empty((self.degree, n_words), dtype=np.uint8)
+        S[:, 0] = self.state
+        jump, done = self.A64, 1
+        while done < n_words:
+            todo = min(done, n_words - done)
+            S[:, done:done+todo] = gf2_matmul(jump, S[:, :todo])
+            jump = gf2_matmul(jump, jump)
+            done += todo
+        return S
+
+    def gen_packed(self, tp_count):
+        """ Generates the next tp_count patterns of the sequence, bit-packed
+
+        Returns
+        -------
+        np.ndarray (uint64) with shape (n_PI, ceil(tp_count/64)), bits after
+        tp_count in the last word are zero
+        """
+        tp_count = int(tp_count)
+        n_pi = len(self.circuit.PI)
+        n_words = (tp_count + 63) // 64
+        words = np.zeros((n_pi, n_words), dtype=np.uint64)
+        if n_words == 0:
+            return words
+
+        # stage 0 words, with extra words for the delays of the other stages
+        n_x = n_words + (self.degree-1) // 64 + 1
+        S = self._word_states(n_x)
+        bits = gf2_matmul(self.G0, S).T
+        x = np.packbits(np.ascontiguousarray(bits), axis=1, bitorder='little')
+        x = x.view('<u8')[:, 0].astype(np.uint64)
+
+        for j in range(self.degree):
+            rows = np.flatnonzero(self.P[:, j])
+            if len(rows) == 0:
+                continue
+            q, r = divmod(j, 64)
+            stage = x[q:q+n_words]
+            if r:
+                stage = (stage >> np.uint64(r)) | (x[q+1:q+1+n_words] << np.uint64(64-r))
+            words[rows] ^= stage
+
+        if tp_count % 64:
+            words[:, -1] &= np.uint64((1 << (tp_count % 64)) - 1)
+            self.state = gf2_matmul(gf2_matpow(self.A, tp_count % 64), S[:, n_words-1])
+        else:
+            self.state = gf2_matmul(self.A64, S[:, n_words-1])
+        return words
+
+    def gen_n_random(self, tp_count, mode="b"):
+        """ Generates the next tp_count patterns as lists of 0/1, as TPGenerator.gen_n_random """
+        if mode != "b":
+            raise NameError("PRPG only generates patterns in mode b")
+        return utils.unpack_words(self.gen_packed(tp_count), int(tp_count)).tolist()
+
+    def gen_single(self, mode="b"):
+        return self.gen_n_random(1, mode)[0]
@@ -0,0 +1,191 @@
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append('../')
+
+import config
+import utils
+from utils import bcolors
+from prpg import PRPG
+from tp_file import TPFile, TPFileWriter
+from tp_generator import TPGenerator
+
+from circuit.circuit import Circuit
+from fault_simulation.fault import FaultList
+from logic_simulation.exhaustive_sim import ExhaustiveSim
+
+N_TP = 200
+SIMPLE_CIRCUITS = ['add2','c1','c2','c3','c4','cmini','x3mult', 'c17','FA', 'FA_NAND']
+ISCAS85_CIRCUITS = ['c432', 'c499', 'c880', 'c1355', 'c1908', 'c3540', 'c5315', 'c6288']
+
+def print_result(name, passed):
+    if passed:
+        print(f"{name}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+    else:
+        print(f"{name}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def check_packed_sim(circuit, tps):
+    """ Compares Circuit.logic_sim_packed with Circuit.logic_sim """
+    golden = [circuit.logic_sim(tp) for tp in tps]
+    po_words = circuit.logic_sim_packed(utils.pack_tps(tps))
+    return utils.unpack_words(po_words, len(tps)).tolist() == golden
+
+def check_codegen_sim(circuit, tps):
+    """ Compares logic_sim and logic_sim_bitwise, with and without generated code """
+    max_nodes = config.CODEGEN_MAX_NODES
+    tps_bin = [int(''.join(str(tp[i]) for tp in tps[:64]), 2) for i in range(len(circuit.PI))]
+    res = []
+    for config.CODEGEN_MAX_NODES in [0, max_nodes]:
+        res.append(([circuit.logic_sim(tp) for tp in tps], circuit.logic_sim_bitwise(tps_bin),
+            [n.value for n in circuit.nodes_lev]))
+    config.CODEGEN_MAX_NODES = max_nodes
+    return res[0] == res[1]
+
+def check_event_sim(circuit, tps):
+    """ Compares Circuit.logic_sim_event with Circuit.logic_sim, for random patterns
+    and for patterns that differ from the previous one in a single PI. Every third 
+    pattern, logic_sim is run on another pattern in between, and all node values 
+    are compared after each event-driven run """
+    seq = []
+    for tp in tps[:N_TP//2]:
+        seq.append(tp)
+        seq.append(tp[:])
+        idx = random.randrange(len(tp))
+        seq[-1][idx] = 1 - tp[idx]
+    golden = []
+    for tp in seq:
+        po_vals = circuit.logic_sim(tp)
+        golden.append((po_vals, [n.value for n in circuit.nodes_lev]))
+    for idx, tp in enumerate(seq):
+        if idx % 3 == 2:
+            circuit.logic_sim([1 - val for val in tp])
+        if circuit.logic_sim_event(tp) != golden[idx][0]:
+            return False
+        if [n.value for n in circuit.nodes_lev] != golden[idx][1]:
+            return False
+    return True
+
+def check_ternary_sim(circuit, tps):
+    """ Compares logic_sim_ternary and logic_sim_ternary_packed with logic_sim_t, 
+    for patterns with 30% of X values """
+    tps_t = [[config.X_VALUE if random.random() < 0.3 else val for val in tp] for tp in tps]
+    golden = [circuit.logic_sim_t(tp) for tp in tps_t]
+    if circuit.logic_sim_ternary(tps_t) != golden:
+        return False
+    po_r1, po_r0 = circuit.logic_sim_ternary_packed(*utils.pack_tps_t(tps_t))
+    return utils.unpack_words_t(po_r1, po_r0, len(tps_t)) == golden
+
+def check_parallel_sim(circuit, tps):
+    """ Compares Circuit.logic_sim_parallel with Circuit.logic_sim_packed """
+    pi_words = utils.pack_tps(tps)
+    po_words = circuit.logic_sim_parallel(pi_words, num_proc=3)
+    return (po_words == circuit.logic_sim_packed(pi_words)).all()
+
+def check_exhaustive_sim(circuit, tps, max_pis=12):
+    """ Compares truth tables and exact fault detection counts of ExhaustiveSim with 
+    logic_sim_bitwise over all patterns, for circuits with at most max_pis PIs """
+    n_pi = len(circuit.PI)
+    if n_pi > max_pis:
+        return True
+    cc = circuit.compile()
+    sim = ExhaustiveSim(cc, word_pis=2)
+    faults = FaultList(circuit)
+    faults.add_all()
+    faults = random.sample(faults.faults, min(20, len(faults.faults)))
+    counts = sim.detection_counts([(cc.num2id[f.node_num], int(f.stuck_val)) for f in faults])
+    tts = sim.truth_tables()
+
+    golden_tts, golden_counts = [0] * len(circuit.PO), [0] * len(faults)
+    for m0 in range(0, 1 << n_pi, 64):
+        ms = range(m0, min(m0+64, 1 << n_pi))
+        tps_bin = [sum(((m >> i) & 1) << (m-m0) for m in ms) for i in range(n_pi)]
+        good = circuit.logic_sim_bitwise(tps_bin)
+        for i, word in enumerate(good):
+            golden_tts[i] |= (word & ((1 << len(ms)) - 1)) << m0
+        for i, fault in enumerate(faults):
+            bad = circuit.logic_sim_bitwise(tps_bin, fault)
+            det = 0
+            for g, b in zip(good, bad):
+                det |= (g ^ b) & ((1 << len(ms)) - 1)
+            golden_counts[i] += bin(det).count('1')
+    return tts == golden_tts and counts == golden_counts
+
+def check_tp_file(circuit, tps):
+    """ Converts a text pattern file to binary and back, with and without X values,
+    and compares logic_sim_file of both files. Also converts a binary file without PIs """
+    tg = TPGenerator(circuit, seed=0)
+    tps_x = tg.gen_n_random(len(tps), mode="x")
+    res = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fname = lambda name: os.path.join(tmp_dir, name)
+        for name, patterns in [("b", tps), ("x", tps_x)]:
+            with open(fname(name + ".tp"), 'w') as outfile:
+                outfile.write(",".join([node.num for node in circuit.PI]) + "\n")
+                outfile.write("".join([",".join(map(str, tp)) + "\n" for tp in patterns]))
+            tp_file = TPFile.from_text(fname(name + ".tp"), fname(name + config.TP_BIN_EXT), 
+                    chunk_size=64)
+            tp_file.to_text(fname(name + "_back.tp"))
+            res.append(tp_file.tps() == patterns and TPGenerator.load_file(
+                fname(name + "_back.tp")) == TPGenerator.load_file(fname(name + ".tp")))
+
+        with TPFileWriter(fname("e" + config.TP_BIN_EXT), []) as writer:
+            writer.write_words(np.zeros((0, 1), dtype=np.uint64), 3)
+        tp_file = TPFile(fname("e" + config.TP_BIN_EXT))
+        tp_file.to_text(fname("e_back.tp"))
+        with open(fname("e_back.tp")) as infile:
+            res.append(tp_file.tps() == [[]] * 3 and infile.read() == "\n" * 4)
+        res.append(TPFile.from_text(fname("e_back.tp"), fname("e_back" + config.TP_BIN_EXT)
+            ).n_PI == 0)
+
+        circuit.logic_sim_file(fname("b.tp"), fname("b.out"))
+        circuit.logic_sim_file(fname("b" + config.TP_BIN_EXT), fname("b_bin.out"))
+        with open(fname("b.out")) as f1, open(fname("b_bin.out")) as f2:
+            res.append(f1.read() == f2.read())
+    return all(res)
+
+def check_prpg(circuit, tps):
+    """ Compares the packed patterns of PRPG with a clock by clock LFSR simulation,
+    also when generated in several calls and by spawned copies """
+    res = []
+    for poly, phase_shifter in [(None, 3), (8, None)]:
+        prpg = PRPG(circuit, poly, seed=0x5a, phase_shifter=phase_shifter)
+        state = [(prpg.seed >> i) & 1 for i in range(prpg.degree)]
+        golden = []
+        for _ in range(len(tps)):
+            golden.append([sum(state[j] for j in range(prpg.degree) if prpg.P[i, j]) % 2 
+                for i in range(len(circuit.PI))])
+            state = state[1:] + [sum(state[j] for j in prpg.poly[1:]) % 2]
+        split = len(tps) // 3
+        res.append(prpg.gen_n_random(split) + prpg.gen_n_random(len(tps)-split) == golden)
+        prpg.reset()
+        spawned = prpg.spawn(2, split)
+        res.append(spawned[0].gen_n_random(split) + spawned[1].gen_n_random(len(tps)-split) 
+                == golden)
+    return all(res)
+
+def check_weighted_tps(circuit, tps, n_tps=1<<14):
+    """ Checks the frequency of ones of weighted random tps, with two weight sets """
+    n_pi = len(circuit.PI)
+    weights = [[0, 1] * (n_pi//2) + [0.5] * (n_pi%2), [(i+1) / (n_pi+1) for i in range(n_pi)]]
+    tg = TPGenerator(circuit, seed=0, weights=weights)
+    bits = utils.unpack_words(tg.gen_packed(n_tps), n_tps)
+    res = []
+    for k, weight in enumerate(weights):
+        freq = bits[k::2].mean(axis=0)
+        res.append(all(abs(f - w) < 0.05 for f, w in zip(freq, weight)))
+        res.append(all(f == w for f, w in zip(freq, weight) if w in [0, 1]))
+    return all(res)
+
+CHECKS = [check_packed_sim, check_codegen_sim, check_event_sim, check_ternary_sim, 
+        check_parallel_sim, check_exhaustive_sim, check_tp_file, check_prpg, check_weighted_tps]
+
+if __name__ == '__main__':
+    for c_name in SIMPLE_CIRCUITS + ISCAS85_CIRCUITS:
+        circuit = Circuit(os.path.join(config.CKT_DIR, c_name + ".ckt"))
+        tps = TPGenerator(circuit).gen_n_random(N_TP)
+        for check in CHECKS:
+            print_result(f"{c_name:8} {check.__name__}", check(circuit, tps))
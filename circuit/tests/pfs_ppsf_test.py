@@ -3,13 +3,18 @@ import sys
 
 sys.path.append('../')
 
+import numpy as np
 import pandas as pd
 
 import config
+import utils
 from utils import bcolors
 from fault_simulation.fault import FaultList
 from fault_simulation.pfs import PFS
 from fault_simulation.ppsf import PPSF
+from fault_simulation.cfs import CFS
+from fault_simulation.deductive_fs import DFS
+from fault_simulation.cpt import CPT
 from tp_generator import TPGenerator
 
 from circuit.circuit import Circuit
@@ -237,6 +242,238 @@ def compare_pfs_ppsf_same_tps(circuit_dir: list):
                 print(e)
                 print(c,'errored')
 
+def compare_pfs_multiprocess(circuit_dir=config.CKT_DIR, num_proc=3):
+    """ Check whether multiprocess PFS (fault list shards) and single process PFS give 
+    the same FC of each tp and D_counts, with and without fault drop """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = Circuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(4*MAX_N_TP)
+        for fault_drop in [None, 1, 3]:
+            res = []
+            for n_proc in [1, num_proc]:
+                fault_list = FaultList(circuit)
+                fault_list.add_all()
+                pfs = PFS(circuit)
+                fc, faults = pfs.run(tps, fault_list, fault_drop=fault_drop, save_log=False, 
+                        num_proc=n_proc)
+                res.append((fc, sorted([f.__str__() for f in faults]), 
+                    [f.D_count for f in fault_list.faults]))
+            if res[0] == res[1]:
+                if PRINT_PASSED:
+                    print(f"{c:12} fault_drop={fault_drop}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+            else:
+                print(f"{c:12} fault_drop={fault_drop}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def check_observation_point(circuit_dir=config.CKT_DIR):
+    """ Check whether PPSF and logic_sim_packed see an observation point (OP) appended to
+    circuit.PO, as in tpi/observation.py, and no longer see it once it is removed. 
+    The OP is the node whose faults are detected by the fewest tps, as a PO one of its 
+    two faults is detected by each tp """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = Circuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(4*MAX_N_TP)
+
+        def ppsf_D_counts():
+            fault_list = FaultList(circuit)
+            fault_list.add_all()
+            PPSF(circuit).run(tps, fault_list)
+            return {f.__str__(): f.D_count for f in fault_list.faults}
+
+        D_counts = ppsf_D_counts()
+        nodes = [node for node in circuit.nodes_lev if node not in circuit.PO]
+        if not nodes:
+            continue
+        op = min(nodes, key=lambda node: D_counts[f"{node.num}@0"] + D_counts[f"{node.num}@1"])
+        circuit.PO.append(op)
+        op_D_counts = ppsf_D_counts()
+        po_words = circuit.logic_sim_packed(utils.pack_tps(tps))
+        circuit.PO = circuit.PO[:-1]
+        res = [op_D_counts[f"{op.num}@0"] + op_D_counts[f"{op.num}@1"] == len(tps),
+                po_words.shape[0] == len(circuit.PO) + 1,
+                ppsf_D_counts() == D_counts]
+        if all(res):
+            if PRINT_PASSED:
+                print(f"{c:12} OP {op.num}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+        else:
+            print(f"{c:12} OP {op.num}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def compare_pfs_engines(circuit_dir=config.CKT_DIR, engines=[CFS, DFS]):
+    """ Check whether other single pattern engines (concurrent CFS, deductive DFS) and PFS 
+    give the same FC of each tp and D_counts, with and without fault drop """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = Circuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(4*MAX_N_TP)
+        for fault_drop, engine in [(fd, e) for e in engines for fd in [None, 1, 3]]:
+            res = []
+            for fs in [PFS, engine]:
+                fault_list = FaultList(circuit)
+                fault_list.add_all()
+                fc, faults = fs(circuit).run(tps, fault_list, fault_drop=fault_drop, 
+                        save_log=False)
+                res.append((fc, sorted([f.__str__() for f in faults]), 
+                    [f.D_count for f in fault_list.faults]))
+            name = f"{c:12} {engine.__name__} fault_drop={fault_drop}:"
+            if res[0] == res[1]:
+                if PRINT_PASSED:
+                    print(f"{name} {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+            else:
+                print(f"{name} {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def compare_pfs_cfs_resume(circuit_dir=config.CKT_DIR, engines=[CFS, DFS]):
+    """ Check whether CFS, DFS and PFS give the same results on a fault list with D_counts 
+    of a previous run: faults detected fault_drop times are not simulated again """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = Circuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(4*MAX_N_TP)
+        for fault_drop, engine in [(fd, e) for e in engines for fd in [1, 3]]:
+            res = []
+            for fs in [PFS, engine]:
+                fault_list = FaultList(circuit)
+                fault_list.add_all()
+                fs(circuit).run(tps[:len(tps)//2], fault_list, fault_drop=fault_drop, 
+                        save_log=False)
+                fc, faults = fs(circuit).run(tps[len(tps)//2:], fault_list, 
+                        fault_drop=fault_drop, save_log=False)
+                res.append((fc, sorted([f.__str__() for f in faults]), 
+                    [f.D_count for f in fault_list.faults]))
+            name = f"{c:12} {engine.__name__} resume fault_drop={fault_drop}:"
+            if res[0] == res[1]:
+                if PRINT_PASSED:
+                    print(f"{name} {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+            else:
+                print(f"{name} {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def compare_cpt_ppsf(circuit_dir=config.CKT_DIR, n_tp=1000):
+    """ Check whether critical path tracing (CPT) and PPSF give the same D_counts with
+    exact stem analysis, and a subset of the detections in conservative mode. Also checks 
+    the sensitization used by CPT against DFTNode.is_sensible for single tps """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = DFTCircuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(n_tp)
+        fault_list = FaultList(circuit)
+        fault_list.add_all()
+        PPSF(circuit).run(tps, fault_list)
+        ppsf_D_counts = [f.D_count for f in fault_list.faults]
+
+        res = []
+        for stem_mode in ["exact", "conservative"]:
+            fault_list = FaultList(circuit)
+            fault_list.add_all()
+            cpt = CPT(circuit, stem_mode=stem_mode)
+            cpt.run(tps, fault_list, save_log=False)
+            D_counts = [f.D_count for f in fault_list.faults]
+            if stem_mode == "exact":
+                res.append(D_counts == ppsf_D_counts)
+            else:
+                res.append(all([x <= y for x, y in zip(D_counts, ppsf_D_counts)]))
+
+        for tp in tps[:10]:
+            circuit.logic_sim(tp)
+            cpt.sim.run(tp)
+            for node in circuit.nodes_lev:
+                if node.ntype != 'PO' and len(node.dnodes) == 1:
+                    idx, gate = cpt.cc.num2id[node.num], cpt.cc.num2id[node.dnodes[0].num]
+                    if bool(cpt._sensitivity(idx, gate, 1)) != node.is_sensible():
+                        res.append(False)
+
+        if all(res):
+            if PRINT_PASSED:
+                print(f"{c:12}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+        else:
+            print(f"{c:12}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def check_fault_collapsing(circuit_dir=config.CKT_DIR, n_tp=500):
+    """ Check fault collapsing with PPSF on the same tps: equivalent faults are detected 
+    together, faults removed by dominance are detected when a dominated fault is, and 
+    the FC of all faults from the collapsed list is exact without dominance """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = DFTCircuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(n_tp)
+        full = FaultList(circuit)
+        full.add_all()
+        PPSF(circuit).run(tps, full)
+        detected = set([str(f) for f in full.faults if f.D_count > 0])
+
+        res = []
+        for dominance in [False, True]:
+            fault_list = FaultList(circuit)
+            fault_list.add_collapsed(dominance)
+            PPSF(circuit).run(tps, fault_list)
+            for rep, faults in fault_list.classes.items():
+                if rep in fault_list.dominated:
+                    if any([r in detected for r in fault_list.dominated[rep]]):
+                        res.append(all([f in detected for f in faults]))
+                else:
+                    res.append(all([(f in detected) == (rep in detected) for f in faults]))
+            if not dominance:
+                res.append(fault_list.calc_fc_full() == full.calc_fc())
+
+        if all(res):
+            if PRINT_PASSED:
+                print(f"{c:12}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+        else:
+            print(f"{c:12}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def check_fault_list(circuit_dir=config.CKT_DIR):
+    """ Check the arrays of FaultList after PFS: the coverage counter, first detecting tps 
+    against the FC of each tp, dropped faults, and lookup of faults by string """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = Circuit(os.path.join(circuit_dir, c))
+        tps = TPGenerator(circuit, seed=0).gen_n_random(4*MAX_N_TP)
+        fault_list = FaultList(circuit)
+        fault_list.add_all()
+        fc, _ = PFS(circuit).run(tps, fault_list, fault_drop=2, save_log=False)
+
+        n = len(fault_list.faults)
+        first_det = fault_list.first_det[:n]
+        res = [fault_list.n_detected == len([f for f in fault_list.faults if f.D_count > 0])]
+        res.append(fc == [(first_det[first_det >= 0] <= idx).sum() / n for idx in range(len(fc))])
+        res.append(all(fault_list.live[:n] == (fault_list.D_counts[:n] < 2)))
+        res.append(all([fault_list.get(str(f)) is f for f in fault_list.faults]))
+        if all(res):
+            if PRINT_PASSED:
+                print(f"{c:12}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+        else:
+            print(f"{c:12}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def compare_ppsf_multiprocess(circuit_dir=config.CKT_DIR, num_proc=2, n_tp=200):
+    """ Check whether each process of multiprocess PPSF gives the same D_counts as single 
+    process PPSF with the tps of that process, for a PPSF built with a fault list """
+    for c in sorted(os.listdir(circuit_dir)):
+        if not c.endswith('.ckt'):
+            continue
+        circuit = Circuit(os.path.join(circuit_dir, c))
+        fault_list = FaultList(circuit)
+        fault_list.add_all()
+        ppsf = PPSF(circuit, fault_list)
+        ppsf._multiprocess_handler(tp=n_tp, fl_curr=fault_list, num_proc=num_proc, seed=0)
+        res = []
+        for id_proc, seed in enumerate(np.random.SeedSequence(0).spawn(num_proc)):
+            golden = FaultList(circuit)
+            golden.add_all()
+            PPSF(circuit).run(TPGenerator(circuit, seed).gen_n_random(n_tp), golden)
+            res.append([f.D_count_list[id_proc] for f in fault_list.faults] == 
+                    [f.D_count for f in golden.faults])
+        if all(res):
+            if PRINT_PASSED:
+                print(f"{c:12} PPSF num_proc={num_proc}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+        else:
+            print(f"{c:12} PPSF num_proc={num_proc}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
 def run_logic_sim(circuit_dir=config.CKT_DIR):
     for c in os.listdir(circuit_dir):
         try:
@@ -303,7 +540,14 @@ def get_undetected_faults():
             print(file, undetected_faults[file])
             print('_'*50)
 
+# checks of the circuits in config.CKT_DIR, each prints the result of each circuit
+CHECKS = [compare_pfs_multiprocess, check_observation_point, compare_pfs_engines, 
+        compare_pfs_cfs_resume, compare_cpt_ppsf, check_fault_collapsing, check_fault_list, 
+        compare_ppsf_multiprocess]
+
 if __name__ == '__main__':
+    for check in CHECKS:
+        check()
 
     pfs_csv_generator()
     ppsf_csv_generator()
@@ -0,0 +1,65 @@
+import os
+import sys
+
+sys.path.append('../')
+
+import numpy as np
+
+import config
+from utils import bcolors
+
+from circuit.circuit import Circuit
+
+N_CYCLES = 20
+N_SEQ = 64
+# Max node evaluations of the golden cycle by cycle simulation, fewer sequences are
+# compared for large circuits
+MAX_GOLDEN_EVALS = 1<<22
+ISCAS89_CIRCUITS = ['s27', 's298', 's344', 's382', 's526', 's820', 's1196', 's1423', 's5378',
+        's38417', 's38584']
+
+def print_result(name, passed):
+    if passed:
+        print(f"{name}: {bcolors.OKGREEN}Passed{bcolors.ENDC}")
+    else:
+        print(f"{name}: {bcolors.FAIL}Failed{bcolors.ENDC}")
+
+def check_full_scan(circuit):
+    """ Flip-flops are cut into pseudo-PIs and pseudo-POs at the end of PI and PO """
+    n_dff = len(circuit.DFF)
+    return (n_dff > 0 and 
+            [q for q, _ in circuit.DFF] == circuit.PI[-n_dff:] and
+            [d for _, d in circuit.DFF] == circuit.PO[-n_dff:] and
+            all(q.gtype == "IPT" for q, _ in circuit.DFF))
+
+def check_seq_sim(circuit):
+    """ Compares Circuit.logic_sim_seq with cycle by cycle logic_sim of each sequence,
+    or of the first sequences for large circuits (see MAX_GOLDEN_EVALS) """
+    n_dff = len(circuit.DFF)
+    n_pi, n_po = len(circuit.PI) - n_dff, len(circuit.PO) - n_dff
+    rng = np.random.default_rng(0)
+    bits = rng.integers(0, 2, size=(N_CYCLES, n_pi, N_SEQ), dtype=np.uint8)
+    pi_seq = np.zeros((N_CYCLES, n_pi, 1), dtype=np.uint64)
+    for k in range(N_SEQ):
+        pi_seq[:, :, 0] |= bits[:, :, k].astype(np.uint64) << np.uint64(k)
+    po_seq, _ = circuit.logic_sim_seq(pi_seq)
+
+    n_golden = max(1, min(N_SEQ, MAX_GOLDEN_EVALS // (N_CYCLES * len(circuit.nodes_lev))))
+    for k in range(n_golden):
+        state = [0] * n_dff
+        for cycle in range(N_CYCLES):
+            res = circuit.logic_sim(bits[cycle, :, k].tolist() + state)
+            golden = res[:n_po]
+            state = res[n_po:]
+            po = [int(word >> np.uint64(k)) & 1 for word in po_seq[cycle, :, 0]]
+            if po != golden:
+                return False
+    return True
+
+CHECKS = [check_full_scan, check_seq_sim]
+
+if __name__ == '__main__':
+    for c_name in ISCAS89_CIRCUITS:
+        circuit = Circuit(os.path.join(config.ISCAS89_DIR, c_name + ".v"))
+        for check in CHECKS:
+            print_result(f"{c_name:8} {check.__name__}", check(circuit))
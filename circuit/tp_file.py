@@ -0,0 +1,266 @@
+import os
+import struct
+
+import numpy as np
+
+import config
+import utils
+
+MAGIC = b"TPB\x00"
+VERSION = 1
+# magic, version, flags, n_PI, n_tps, length of the PI names in bytes
+HEADER = struct.Struct("<4sHHIQI")
+N_TPS_OFFSET = 12
+FLAG_X = 1
+# data starts at a multiple of this, after the header and the PI names
+ALIGN = 64
+
+
+class TPFileWriter:
+    """ Writes test patterns in the packed binary format, read with TPFile.
+    Patterns are appended as packed words (see utils.pack_tps), so a file of any
+    size is written without keeping its patterns in memory. The pattern count in
+    the header is updated on close.
+
+    File layout: a header with the PI names, then the data as an array with shape
+    (n_words, n_planes, n_PI) of little-endian uint64. Plane 0 holds the value bits
+    and plane 1, if the file has an X-mask, the bits of patterns where the PI is X.
+    Bit k of word w belongs to pattern 64*w+k, bits after the last pattern are zero.
+    """
+
+    def __init__(self, fname, pi_names, has_x=False):
+        """
+        Arguments
+        ---------
+        fname : str
+        pi_names : list of str, e.g. [node.num for node in circuit.PI]
+        has_x : bool
+            if True, an X-mask plane is stored along with the values
+        """
+        self.fname = fname
+        self.n_PI = len(pi_names)
+        self.has_x = has_x
+        self.n_tps = 0
+
+        names = ",".join([str(name) for name in pi_names]).encode()
+        header = HEADER.pack(MAGIC, VERSION, FLAG_X if has_x else 0,
+                self.n_PI, 0, len(names)) + names
+        header += b"\x00" * (-len(header) % ALIGN)
+        self.outfile = open(fname, 'wb')
+        self.outfile.write(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_words(self, words, n_tps, x_words=None):
+        """ Appends packed patterns
+
+        Arguments
+        ---------
+        words : np.ndarray (uint64) with shape (n_PI, n_words), value bits
+        n_tps : int
+            number of patterns in words, only the last write can have
+            a partially filled last word
+        x_words : np.ndarray (uint64) with the same shape, X-mask bits
+        """
+        words = np.asarray(words, dtype=np.uint64)
+        if words.ndim != 2:
+            words = words.reshape(self.n_PI, -1)
+        n_words = words.shape[1]
+        if self.n_tps % 64:
+            raise ValueError("Only the last write can have a partial word")
+        if not (64 * (n_words-1) < n_tps <= 64 * n_words):
+            raise ValueError(f"{n_words} words cannot hold {n_tps} patterns")
+
+        planes = [words]
+        if self.has_x:
+            if x_words is None:
+                x_words = np.zeros_like(words)
+            planes.append(np.asarray(x_words, dtype=np.uint64).reshape(words.shape))
+        elif x_words is not None and np.any(x_words):
+            raise ValueError("File is created without X-mask, but patterns have X")
+
+        # zero the bits after the last pattern, so a file is identical however written
+        if n_tps % 64:
+            tail = np.uint64((1 << (n_tps % 64)) - 1)
+            planes = [plane.copy() for plane in planes]
+            for plane in planes:
+                plane[:, -1] &= tail
+
+        data = np.stack(planes, axis=0).transpose(2, 0, 1)
+        self.outfile.write(np.ascontiguousarray(data, dtype='<u8').tobytes())
+        self.n_tps += n_tps
+
+    def write_tps(self, tps):
+        """ Appends patterns given as lists of 0/1/X, each in the order of the PI names """
+        vals = np.asarray(tps, dtype=object).reshape(len(tps), -1)
+        is_x = (vals != 0) & (vals != 1)
+        x_words = utils.pack_tps(is_x) if np.any(is_x) else None
+        self.write_words(utils.pack_tps(vals == 1), len(tps), x_words)
+
+    def close(self):
+        if self.outfile.closed:
+            return
+        self.outfile.seek(N_TPS_OFFSET)
+        self.outfile.write(struct.pack("<Q", self.n_tps))
+        self.outfile.close()
+
+
+class TPFile:
+    """ Reader of packed binary test pattern files, see TPFileWriter.
+    The data is memory-mapped, words are returned as views of the file without
+    copies, in the (n_PI, n_words) layout used by the simulators (e.g. PackedSim).
+
+    Attributes
+    ----------
+    pi_names : list of str
+    n_tps : int
+    has_x : bool
+    """
+
+    def __init__(self, fname):
+        if not os.path.exists(fname):
+            raise NameError(f"Test pattern file {fname} does not exist")
+        self.fname = fname
+        with open(fname, 'rb') as infile:
+            head = infile.read(HEADER.size)
+            if len(head) < HEADER.size or head[:4] != MAGIC:
+                raise ValueError(f"{fname} is not a binary test pattern file")
+            _, version, flags, n_pi, n_tps, names_len = HEADER.unpack(head)
+            if version != VERSION:
+                raise ValueError(f"Version {version} of {fname} is not supported")
+            names = infile.read(names_len).decode()
+
+        self.pi_names = names.split(",") if n_pi else []
+        self.n_tps = n_tps
+        self.has_x = bool(flags & FLAG_X)
+        offset = HEADER.size + names_len
+        offset += -offset % ALIGN
+        n_planes = 2 if self.has_x else 1
+        if self.n_words and n_pi:
+            self.data = np.memmap(fname, dtype='<u8', mode='r', offset=offset,
+                    shape=(self.n_words, n_planes, n_pi))
+        else:
+            self.data = np.zeros((self.n_words, n_planes, n_pi), dtype='<u8')
+
+    @property
+    def n_PI(self):
+        return len(self.pi_names)
+
+    @property
+    def n_words(self):
+        return (self.n_tps + 63) // 64
+
+    def __len__(self):
+        return self.n_tps
+
+    def check(self, circuit):
+        """ Raises ValueError if the PI names do not match circuit.PI """
+        if self.pi_names != [str(node.num) for node in circuit.PI]:
+            raise ValueError(f"PIs of {self.fname} do not match PIs of {circuit.c_name}")
+
+    def words(self, w0=0, w1=None):
+        """ Value words of patterns 64*w0 to 64*w1-1, shape is (n_PI, w1-w0) """
+        return self.data[w0:w1, 0].T
+
+    def x_words(self, w0=0, w1=None):
+        """ X-mask words, in the same shape as words(), None if the file has no X """
+        return self.data[w0:w1, 1].T if self.has_x else None
+
+    def ternary_words(self, w0=0, w1=None):
+        """ Two-rail words (r1, r0) for TernarySim, see utils.pack_tps_t """
+        words = self.words(w0, w1)
+        x_words = self.x_words(w0, w1)
+        r1, r0 = np.array(words), ~words
+        if x_words is not None:
+            r1 |= x_words
+            r0 |= x_words
+        w1 = self.n_words if w1 is None else min(w1, self.n_words)
+        if w1 == self.n_words and self.n_tps % 64 and r0.shape[1]:
+            r0[:, -1] &= np.uint64((1 << (self.n_tps % 64)) - 1)
+        return r1, r0
+
+    def iter_words(self, chunk_words=config.LOGIC_SIM_FILE_CHUNK // 64):
+        """ Yields (words, x_words, n_tps) for chunks of chunk_words words """
+        for w0 in range(0, self.n_words, chunk_words):
+            w1 = min(w0 + chunk_words, self.n_words)
+            n_tps = min(64 * w1, self.n_tps) - 64 * w0
+            yield self.words(w0, w1), self.x_words(w0, w1), n_tps
+
+    def tps(self, t0=0, t1=None):
+        """ Returns patterns t0 to t1-1 as lists of 0/1/X, as TPGenerator.load_file """
+        t1 = self.n_tps if t1 is None else min(t1, self.n_tps)
+        if t1 <= t0:
+            return []
+        w0, w1 = t0 // 64, (t1 + 63) // 64
+        vals = utils.unpack_words(self.words(w0, w1), 64 * (w1-w0))[t0-64*w0:t1-64*w0]
+        if not self.has_x:
+            return vals.tolist()
+        is_x = utils.unpack_words(self.x_words(w0, w1), 64 * (w1-w0))[t0-64*w0:t1-64*w0]
+        tps = vals.astype(object)
+        tps[is_x.astype(bool)] = config.X_VALUE
+        return tps.tolist()
+
+    @staticmethod
+    def from_text(tp_fname, bin_fname, chunk_size=config.LOGIC_SIM_FILE_CHUNK):
+        """ Converts a text test pattern file (see TPGenerator.gen_file) to binary.
+        As in TPGenerator.load_file, any value other than 0 and 1 is taken as X.
+
+        Returns
+        -------
+        TPFile of the written file
+        """
+        from tp_generator import TPGenerator
+        if not os.path.exists(tp_fname):
+            raise NameError(f"Test pattern file {tp_fname} does not exist")
+        with open(tp_fname, 'r') as infile:
+            header = infile.readline().strip()
+            pi_names = header.split(",") if header else []
+        n_pi = len(pi_names)
+
+        chunk_size = max(64, chunk_size - chunk_size % 64)
+        with TPFileWriter(bin_fname, pi_names, has_x=TPFile._text_has_x(tp_fname)) as writer:
+            for lines in TPGenerator.read_file_chunks(tp_fname, chunk_size):
+                if all(len(line) == 2*n_pi-1 for line in lines):
+                    # single character values, they are every other byte
+                    chars = np.frombuffer("".join(lines).encode(), dtype=np.uint8)
+                    chars = chars.reshape(len(lines), 2*n_pi-1)[:, ::2]
+                    is_one, is_zero = (chars == ord('1')), (chars == ord('0'))
+                else:
+                    words = np.array([line.split(',') for line in lines])
+                    is_one, is_zero = (words == '1'), (words == '0')
+                if is_one.shape[1] != n_pi:
+                    raise ValueError(f"Patterns of {tp_fname} do not match its {n_pi} PIs")
+                writer.write_words(utils.pack_tps(is_one), len(lines),
+                        utils.pack_tps(~(is_one | is_zero)))
+        return TPFile(bin_fname)
+
+    @staticmethod
+    def _text_has_x(tp_fname):
+        """ True if a text pattern file has any value other than 0 and 1 """
+        with open(tp_fname, 'rb') as infile:
+            infile.readline()
+            for block in iter(lambda: infile.read(1<<20), b''):
+                if block.translate(None, b"01,\r\n "):
+                    return True
+        return False
+
+    def to_text(self, tp_fname, chunk_words=config.LOGIC_SIM_FILE_CHUNK // 64):
+        """ Writes the patterns in the text format of TPGenerator.gen_file """
+        symbols = np.frombuffer(b"01" + str(config.X_VALUE).encode(), dtype=np.uint8)
+        with open(tp_fname, 'w') as outfile:
+            outfile.write(",".join(self.pi_names) + "\n")
+            if self.n_PI == 0:
+                outfile.write("\n" * self.n_tps)
+                return
+            for words, x_words, n_tps in self.iter_words(chunk_words):
+                codes = utils.unpack_words(words, n_tps)
+                if x_words is not None:
+                    codes = np.where(utils.unpack_words(x_words, n_tps), 2, codes)
+                chars = np.full((n_tps, 2*self.n_PI), ord(','), dtype=np.uint8)
+                chars[:, 0::2] = symbols[codes]
+                chars[:, -1] = ord('\n')
+                outfile.write(chars.tobytes().decode())
@@ -1,11 +1,40 @@
-import random
 import config
 import os
 import utils
 
+import numpy as np
+
+from tp_file import TPFile, TPFileWriter
+
 class TPGenerator:
-    def __init__(self, circuit):
+    def __init__(self, circuit, seed=None, weights=None):
+        """ 
+        Arguments
+        ---------
+        circuit : Circuit
+        seed : int or np.random.SeedSequence
+            seed of the NumPy random generator, if None a fresh entropy is used. 
+            Independent generators for parallel workers are made by spawn(). 
+        weights : list of float, or list of weight sets
+            probability of 1 for each PI, in the same order as circuit.PI. 
+            If None, patterns are uniform random. With several weight sets, pattern t
+            is generated with set t % (number of sets). See gen_weighted_packed. 
+        """
         self.circuit = circuit
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_seq = seed
+        self.rng = np.random.default_rng(seed)
+        self.weights = None
+        if weights is not None:
+            weights = np.array(weights, dtype=float).reshape(-1, len(circuit.PI))
+            if np.any(weights < 0) or np.any(weights > 1):
+                raise ValueError("Weights should be probabilities, in [0, 1]")
+            self.weights = weights
+
+    def spawn(self, n):
+        """ Returns n TPGenerators with independent random streams, e.g. one per worker """
+        return [TPGenerator(self.circuit, seed, self.weights) for seed in self.seed_seq.spawn(n)]
         
     def gen_single(self, mode="b"):
         """ Generate a random input pattern.
@@ -13,40 +42,124 @@ class TPGenerator:
         mode x: generate values in {0, 1, X}
         returns a single input pattern
             """
-        if mode not in ["b", "x"]:
-            raise NameError("Mode is not acceptable")
-
-        bits = [0, 1, config.X_VALUE]
-        if mode == "b":
-            tp = [int(bits[random.randint(0,1)]) for _ in range(len(self.circuit.PI))]
-        elif mode == "x":
-            tp = [bits[random.randint(0,2)] for _ in range(len(self.circuit.PI))]
-        
-        return tp 
+        return self.gen_n_random(1, mode)[0]
     
     def gen_n_random(self, tp_count, mode="b", unique=False):
         """ Generate multiple random input patterns
-        mode b: generate values in {0, 1}
+        mode b: generate values in {0, 1}, weighted if self.weights is set
         mode x: generate values in {0, 1, X}
         returns a list of random test patterns
         does not store the generated tps in file 
         """
+        if mode not in ["b", "x"]:
+            raise NameError("Mode is not acceptable")
+
+        if mode == "b" and self.weights is not None:
+            return utils.unpack_words(self.gen_packed(tp_count, unique), int(tp_count)).tolist()
 
-        if 1<<len(self.circuit.PI) < tp_count:
+        n_pi = len(self.circuit.PI)
+        if mode == "x":
+            vals = self.rng.integers(0, 3, size=(int(tp_count), n_pi), dtype=np.uint8)
+            return [[config.X_VALUE if val == 2 else val for val in tp] for tp in vals.tolist()]
+
+        if 1<<n_pi < tp_count:
             unique = False
 
         if not unique:
-            return [self.gen_single(mode) for _ in range(int(tp_count))]
+            return self.rng.integers(0, 2, size=(int(tp_count), n_pi), dtype=np.uint8).tolist()
 
-        tps = []
-        # Bad performance
-        # Can't use random.choices() since it can't fit in integer for large circuits
-        while len(tps) < tp_count: 
-            x = self.gen_single()
-            if x not in tps:
-                tps.append(x)
+        rows = self._gen_unique_rows(int(tp_count))
+        return np.unpackbits(rows, axis=1, count=n_pi, bitorder='little').tolist()
 
-        return tps
+    def _gen_unique_rows(self, tp_count):
+        """ Generates unique random tps, each tp is bit-packed in a row of bytes. 
+        Uniqueness is checked with a hash set over the packed rows. """
+        n_pi = len(self.circuit.PI)
+        n_bytes = (n_pi + 7) // 8
+        pad_mask = np.uint8((1 << (n_pi - 8*(n_bytes-1))) - 1) if n_pi else np.uint8(0)
+        seen = set()
+        rows = []
+        while len(rows) < tp_count:
+            batch = self.rng.integers(0, 256, size=(tp_count - len(rows), n_bytes), dtype=np.uint8)
+            if n_bytes:
+                batch[:, -1] &= pad_mask
+            for row in batch:
+                key = row.tobytes()
+                if key not in seen:
+                    seen.add(key)
+                    rows.append(row)
+        return np.array(rows, dtype=np.uint8).reshape(tp_count, n_bytes)
+
+    def gen_packed(self, tp_count, unique=False):
+        """ Generate random tps directly bit-packed, see utils.pack_tps
+
+        Returns
+        -------
+        np.ndarray (uint64) with shape (n_PI, ceil(tp_count/64)), bits after 
+        tp_count in the last word are zero 
+        """
+        if self.weights is not None:
+            if unique:
+                print("Warning: unique is ignored for weighted random tps")
+            return self.gen_weighted_packed(tp_count)
+
+        n_pi = len(self.circuit.PI)
+        n_words = (int(tp_count) + 63) // 64
+        if 1<<n_pi < tp_count:
+            unique = False
+
+        if unique:
+            rows = self._gen_unique_rows(int(tp_count))
+            return utils.pack_tps(np.unpackbits(rows, axis=1, count=n_pi, bitorder='little'))
+
+        words = self.rng.integers(0, np.iinfo(np.uint64).max, size=(n_pi, n_words), 
+                dtype=np.uint64, endpoint=True)
+        if tp_count % 64 and n_words:
+            words[:, -1] &= np.uint64((1 << (tp_count % 64)) - 1)
+        return words
+
+    def gen_weighted_packed(self, tp_count, weights=None):
+        """ Generate weighted random tps, bit-packed as in gen_packed. 
+        Weights are quantized to config.WRP_BITS bits, and each PI bit is 1 if a 
+        random number of WRP_BITS bits, made of bit-sliced random words, is less than 
+        its quantized weight. All PIs and 64 tps are compared at once with word operations. 
+
+        Arguments
+        ---------
+        weights : list of weight sets, default is self.weights
+        """
+        weights = self.weights if weights is None else np.array(weights, dtype=float)
+        weights = weights.reshape(-1, len(self.circuit.PI))
+        n_bits = config.WRP_BITS
+        # quantized weights of each set, bit b of each PI as an all-zeros/ones word
+        levels = np.rint(weights * (1<<n_bits)).astype(np.int64)
+        full = np.uint64(np.iinfo(np.uint64).max)
+        wbits = [[np.where((lev >> b) & 1, full, np.uint64(0))[:, None] for b in range(n_bits)]
+                for lev in levels]
+
+        n_pi = len(self.circuit.PI)
+        n_words = (int(tp_count) + 63) // 64
+        words = np.zeros((n_pi, n_words), dtype=np.uint64)
+        chunk = max(1, config.PACKED_SIM_MEM // (8 * n_bits * max(1, n_pi)))
+        for w0 in range(0, n_words, chunk):
+            w1 = min(w0 + chunk, n_words)
+            rand = self.rng.integers(0, full, size=(n_bits, n_pi, w1-w0), dtype=np.uint64, 
+                    endpoint=True)
+            # tps of each weight set, t % n_sets == k
+            tp_set = np.arange(64 * w0, 64 * w1).reshape(-1, 64) % len(levels)
+            for k, lev in enumerate(levels):
+                less = np.zeros((n_pi, w1-w0), dtype=np.uint64)
+                equal = np.full((n_pi, w1-w0), full, dtype=np.uint64)
+                for b in reversed(range(n_bits)):
+                    less |= equal & ~rand[b] & wbits[k][b]
+                    equal &= ~(rand[b] ^ wbits[k][b])
+                less[lev == 1<<n_bits] = full
+                select = np.packbits(tp_set == k, axis=1, bitorder='little').view('<u8')[:, 0]
+                words[:, w0:w1] |= less & select
+
+        if tp_count % 64 and n_words:
+            words[:, -1] &= np.uint64((1 << (tp_count % 64)) - 1)
+        return words
 
     def gen_file(self, tp_count, tp_fname=None, mode="b", verbose=False, unique=False):
         """ Create single file with multiple input patterns
@@ -77,6 +190,31 @@ class TPGenerator:
 
         return tp_fname, tps
 
+    def gen_bin_file(self, tp_count, tp_fname=None, chunk_size=config.LOGIC_SIM_FILE_CHUNK, 
+            verbose=False):
+        """ Create a binary test pattern file (see TPFile) with tp_count random patterns. 
+        Patterns are generated packed and written in chunks of chunk_size patterns, 
+        so the file size is not limited by memory. 
+
+        Returns
+        ------
+        TPFile of the generated file
+        """ 
+        if not os.path.exists(config.PATTERN_DIR):
+            os.makedirs(config.PATTERN_DIR)
+        fn = os.path.join(config.PATTERN_DIR, 
+                self.circuit.c_name + "_" + str(tp_count) + "_tp_b" + config.TP_BIN_EXT)
+        tp_fname = fn if tp_fname==None else tp_fname
+        chunk_size = max(64, chunk_size - chunk_size % 64)
+        with TPFileWriter(tp_fname, [node.num for node in self.circuit.PI]) as writer:
+            for t0 in range(0, int(tp_count), chunk_size):
+                n_tps = min(chunk_size, int(tp_count) - t0)
+                writer.write_words(self.gen_packed(n_tps), n_tps)
+        if verbose:
+            print(f"Generated {tp_count} test patterns and saved in {tp_fname}")
+
+        return TPFile(tp_fname)
+
     def gen_full(self):
         """
         Return all possible test patterns
@@ -151,24 +289,38 @@ class TPGenerator:
         
         return list(all_tps)
 
+    @staticmethod
+    def read_file_chunks(fname, chunk_size=config.LOGIC_SIM_FILE_CHUNK):
+        """ Reads a test pattern file lazily, without its header line. 
+        Yields lists of at most chunk_size lines, stripped and non-empty """ 
+        if not os.path.exists(fname):
+            raise NameError('Test file does not exist. Use gen_tp_file() or gen_full_tp_file() instead')
+
+        with open(fname, 'r') as infile:
+            infile.readline()
+            chunk = []
+            for line in infile:
+                line = line.strip()
+                if line:
+                    chunk.append(line)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
     @staticmethod
     def load_file(fname):
         """ Load single file with multiple test pattern vectors. 
-            Does not warn if the size of input nodes is less than each test pattern""" 
+            Does not warn if the size of input nodes is less than each test pattern
+            Binary files (config.TP_BIN_EXT) are read with TPFile""" 
         # do we need to check the order of the inputs in the file?  
-        # this can be done using "yield" or "generate" -- check online 
-
-        if not os.path.exists(fname):
-            raise 'Test file does not exist. Use gen_tp_file() or gen_full_tp_file() instead'
-            # return self.gen_tp_file(tp_count=tp_count,tp_fname=fname)
-        
-        infile = open(fname, 'r')
+        if fname.endswith(config.TP_BIN_EXT):
+            return TPFile(fname).tps()
         tps = []
-        lines = infile.readlines()
-
-        for line in lines[1:]:
-            words = line.rstrip().split(',')
-            words = [int(word) if word == '1' or word == '0' else 'X' for word in words]
-            tps.append(words)
-        infile.close()
-        return tps
\ No newline at end of file
+        for lines in TPGenerator.read_file_chunks(fname):
+            for line in lines:
+                words = line.split(',')
+                words = [int(word) if word == '1' or word == '0' else 'X' for word in words]
+                tps.append(words)
+        return tps
@@ -5,6 +5,8 @@ import numpy as np
 from collections import deque
 from functools import reduce
 
+import config
+
 class bcolors:
     OKGREEN = '\033[92m'
     FAIL = '\033[91m'
@@ -61,6 +63,55 @@ def comp_Zg_Zf_bin(Zg, Zf, bitwidth):
                 tps.add(j)
     return tps 
 
+def pack_tps(tps):
+    """ Bit-packs test patterns into uint64 words, used in pattern-parallel simulation 
+    Bit k of word w of a PI is the value of that PI in test pattern 64*w+k 
+
+    Arguments
+    ---------
+    tps : list of lists (or 2D array) of 0/1, each tp in the same order as circuit.PI
+
+    Return
+    ------
+    np.ndarray (uint64) with shape (n_PI, ceil(n_tps/64))
+    """
+    bits = np.asarray(tps, dtype=np.uint8).reshape(len(tps), -1).T
+    n_words = (bits.shape[1] + 63) // 64
+    padded = np.zeros((bits.shape[0], n_words * 64), dtype=np.uint8)
+    padded[:, :bits.shape[1]] = bits
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+def unpack_words(words, n_tps):
+    """ Reverse of pack_tps, returns an array (uint8) with shape (n_tps, n_rows) 
+    e.g. the PO values of each test pattern """
+    words = np.ascontiguousarray(words, dtype='<u8')
+    bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder='little')
+    return bits[:, :n_tps].T
+
+def words_to_ints(words):
+    """ Converts each row of packed words (see pack_tps) to one Python int, 
+    bit 64*w+k of the int is bit k of word w. Used to simulate any number of tps at once """
+    words = np.ascontiguousarray(words, dtype='<u8').reshape(len(words), -1)
+    return [int.from_bytes(row.tobytes(), 'little') for row in words]
+
+def pack_tps_t(tps):
+    """ Bit-packs ternary test patterns (0/1/X) into two-rail uint64 words, 
+    "can be 1" and "can be 0" planes, used in TernarySim. See pack_tps.
+
+    Return
+    ------
+    (r1, r0) : np.ndarray (uint64) with shape (n_PI, ceil(n_tps/64))
+    """
+    vals = np.asarray(tps, dtype=object).reshape(len(tps), -1)
+    is_x = (vals == config.X_VALUE)
+    return pack_tps((vals == 1) | is_x), pack_tps((vals == 0) | is_x)
+
+def unpack_words_t(r1, r0, n_tps):
+    """ Reverse of pack_tps_t, returns a list of n_tps lists of 0/1/X values """
+    b1, b0 = unpack_words(r1, n_tps), unpack_words(r0, n_tps)
+    return [[config.X_VALUE if (v1 and v0) else v1 for v1, v0 in zip(row1, row0)]
+            for row1, row0 in zip(b1.tolist(), b0.tolist())]
+
 def print_out_bin(Z):
     for k in Z:
         print(k + "\t" + "{:064b}".format(Z[k]))